@@ -1,21 +1,136 @@
-import openai
-import requests
+import itertools
 import json
-from typing import Dict, Any
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple
+
+import ai_metering
+
+OPENAI_MODEL = "gpt-3.5-turbo"
+DEEPSEEK_MODEL = "deepseek-chat"
+SYSTEM_PROMPT = "你是一个专业的医疗AI助手,基于医学知识提供分析和建议。"
+
+# 限流、服务端错误和网络错误时的重试次数和首次等待秒数（之后每次加倍）
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0
+
+# 分析结果的各个部分：(标题, 格式说明)。完整提示词按顺序拼接全部部分；
+# 分段分析先单独生成诊断，再基于诊断并行生成其余各部分
+DIAGNOSIS_SECTION = ('初步诊断分析', """主要诊断：[诊断名称]
+诊断依据：[具体说明]
+鉴别诊断：[需要排除的疾病]
+可能并发症：[可能出现的并发症]
+ICD-10编码：[对应的ICD-10编码]""")
+
+SECTIONS = (
+    ('检查建议', """实验室检查：
+[具体检查项目]
+
+影像学检查：
+[具体检查项目]
+
+其他辅助检查：
+[其他必要检查]"""),
+    ('用药方案', """推荐用药：
+- [药品1]：[剂量] [用法]
+用药说明：[具体说明]
+注意事项：[用药注意事项]
+
+- [药品2]：[剂量] [用法]
+用药说明：[具体说明]
+注意事项：[用药注意事项]
+
+- [药品3]：[剂量] [用法]
+用药说明：[具体说明]
+注意事项：[用药注意事项]
+
+- [药品4]：[剂量] [用法]
+用药说明：[具体说明]
+注意事项：[用药注意事项]
+
+- [药品5]：[剂量] [用法]
+用药说明：[具体说明]
+注意事项：[用药注意事项]"""),
+    ('手术建议', """手术名称：[手术名称]
+手术编码：[ICD-9-CM-3编码]
+手术说明：[具体说明]"""),
+    ('DRGs信息', """MDC分组：[MDC分组]
+DRG分组：[具体DRG分组]
+优化建议：[优化建议]"""),
+    ('生活指导', """饮食建议：[具体建议]
+活动建议：[具体建议]
+复诊计划：[具体安排]
+预防保健：[具体措施]"""),
+    ('医保信息', """医保类别：[医保类别]
+报销范围：[可报销项目]
+自付比例：[自付比例说明]"""),
+)
+
+PROMPT_NOTES = """注意事项:
+1. 所有建议均基于循证医学证据
+2. 用药建议符合国家基本药物目录
+3. 诊疗方案符合医保支付政策
+4. 本建议仅供参考,具体诊疗请遵医嘱
+
+免责声明：本分析结果仅供参考,不能替代专业医生的诊疗意见。请务必在专业医疗机构进行正规诊疗。
+
+请严格按照以上格式输出，特别是用药信息部分，每个药品必须包含名称、剂量、用法、说明和注意事项，并使用统一的格式和缩进。"""
+
+# 分段分析时各请求的 max_tokens：诊断部分较短，用药方案最长
+DIAGNOSIS_MAX_TOKENS = 500
+SECTION_MAX_TOKENS = {'用药方案': 900}
+DEFAULT_SECTION_MAX_TOKENS = 400
+
+DISCLAIMER = "免责声明:本分析结果仅供参考,具体诊疗请遵医嘱。"
+
+
+class RetryableStatus(Exception):
+    """可重试的 HTTP 状态（429、5xx）"""
+
+
+def _openai_usage(usage) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return usage.prompt_tokens, usage.completion_tokens, getattr(details, 'cached_tokens', None)
+
+
+def _deepseek_usage(usage: Dict[str, Any]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    # DeepSeek 的缓存命中数为 prompt_cache_hit_tokens，兼容 OpenAI 格式的 prompt_tokens_details
+    cached = usage.get('prompt_cache_hit_tokens')
+    if cached is None:
+        cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+    return usage.get('prompt_tokens'), usage.get('completion_tokens'), cached
+
 
 class MedicalAnalyzer:
-    def __init__(self):
+    def __init__(self, metering: Optional[ai_metering.Metering] = None):
+        # 每次调用的 token、耗时和费用交给 metering 异步记录
+        self.metering = metering
+        # 计量记录中的患者标识，由界面在每次分析前设置
+        self.patient: Optional[str] = None
         self.setup_ai_models()
         
     def setup_ai_models(self):
         # 从配置文件加载API密钥和URL
         config = self.load_config()
-        self.openai_client = openai.OpenAI(
-            api_key=config['openai']['api_key'],
-            base_url=config['openai']['base_url']
-        )
+        self.openai_api_key = config['openai']['api_key']
+        self.openai_base_url = config['openai']['base_url']
         self.deepseek_api_key = config['deepseek']['api_key']
         self.deepseek_base_url = config['deepseek']['base_url']
+        self._openai_client = None
+
+    @property
+    def openai_client(self):
+        # OpenAI SDK 导入较慢，首次调用时才创建客户端
+        if self._openai_client is None:
+            import openai
+            # 由 _retry 负责重试，以便记录重试次数
+            self._openai_client = openai.OpenAI(
+                api_key=self.openai_api_key,
+                base_url=self.openai_base_url,
+                max_retries=0
+            )
+        return self._openai_client
 
     def load_config(self) -> Dict[str, Any]:
         try:
@@ -34,141 +149,240 @@ class MedicalAnalyzer:
                 }
             }
 
-    def build_medical_prompt(self, user_info: Dict[str, Any], symptoms: str) -> str:
-        return f"""作为一个专业的AI医疗助手,请基于以下信息进行分析,并严格按照指定格式输出:
-
-患者基本信息:
+    def patient_block(self, user_info: Dict[str, Any], symptoms: str) -> str:
+        return f"""患者基本信息:
 - 年龄: {user_info['age']}岁
 - 性别: {user_info['gender']}
 - 身高: {user_info.get('height', '未提供')}cm
 - 体重: {user_info.get('weight', '未提供')}kg
-- 症状描述: {symptoms}
+- 症状描述: {symptoms}"""
+
+    def build_medical_prompt(self, user_info: Dict[str, Any], symptoms: str) -> str:
+        sections = "\n\n".join(
+            f"=== {title} ===\n{template}" for title, template in (DIAGNOSIS_SECTION,) + SECTIONS
+        )
+        return f"""作为一个专业的AI医疗助手,请基于以下信息进行分析,并严格按照指定格式输出:
+
+{self.patient_block(user_info, symptoms)}
 
 请按以下格式提供分析结果:
 
-=== 初步诊断分析 ===
-主要诊断：[诊断名称]
-诊断依据：[具体说明]
-鉴别诊断：[需要排除的疾病]
-可能并发症：[可能出现的并发症]
-ICD-10编码：[对应的ICD-10编码]
+{sections}
 
-=== 检查建议 ===
-实验室检查：
-[具体检查项目]
+{PROMPT_NOTES}
+"""
 
-影像学检查：
-[具体检查项目]
+    def build_diagnosis_prompt(self, user_info: Dict[str, Any], symptoms: str) -> str:
+        """分段分析的第一步：只要求给出诊断部分"""
+        title, template = DIAGNOSIS_SECTION
+        return f"""作为一个专业的AI医疗助手,请基于以下信息进行诊断分析,并严格按照指定格式输出:
 
-其他辅助检查：
-[其他必要检查]
+{self.patient_block(user_info, symptoms)}
 
-=== 用药方案 ===
-推荐用药：
-- [药品1]：[剂量] [用法]
-用药说明：[具体说明]
-注意事项：[用药注意事项]
+请只输出以下部分:
 
-- [药品2]：[剂量] [用法]
-用药说明：[具体说明]
-注意事项：[用药注意事项]
+=== {title} ===
+{template}
+"""
 
-- [药品3]：[剂量] [用法]
-用药说明：[具体说明]
-注意事项：[用药注意事项]
+    def build_section_prompt(self, user_info: Dict[str, Any], symptoms: str,
+                             diagnosis: str, section: Tuple[str, str]) -> str:
+        """分段分析中基于已有诊断生成单个部分"""
+        title, template = section
+        return f"""作为一个专业的AI医疗助手,请基于以下患者信息和已完成的诊断分析,只输出"{title}"部分,并严格按照指定格式输出:
 
-- [药品4]：[剂量] [用法]
-用药说明：[具体说明]
-注意事项：[用药注意事项]
+{self.patient_block(user_info, symptoms)}
 
-- [药品5]：[剂量] [用法]
-用药说明：[具体说明]
-注意事项：[用药注意事项]
+已完成的诊断分析:
+{diagnosis}
 
-=== 手术建议 ===
-手术名称：[手术名称]
-手术编码：[ICD-9-CM-3编码]
-手术说明：[具体说明]
+请只输出以下部分:
 
-=== DRGs信息 ===
-MDC分组：[MDC分组]
-DRG分组：[具体DRG分组]
-优化建议：[优化建议]
+=== {title} ===
+{template}
 
-=== 生活指导 ===
-饮食建议：[具体建议]
-活动建议：[具体建议]
-复诊计划：[具体安排]
-预防保健：[具体措施]
+注意事项: 建议基于循证医学证据，用药符合国家基本药物目录，诊疗方案符合医保支付政策。
+"""
 
-=== 医保信息 ===
-医保类别：[医保类别]
-报销范围：[可报销项目]
-自付比例：[自付比例说明]
+    def _meter(self, provider: str, model: str, purpose: str) -> ai_metering.CallMeter:
+        if self.metering is not None:
+            return self.metering.meter(provider, model, purpose, self.patient)
+        return ai_metering.CallMeter(provider, model, purpose, self.patient)
 
-注意事项:
-1. 所有建议均基于循证医学证据
-2. 用药建议符合国家基本药物目录
-3. 诊疗方案符合医保支付政策
-4. 本建议仅供参考,具体诊疗请遵医嘱
+    def _record(self, meter: ai_metering.CallMeter, error: Optional[BaseException] = None):
+        meter.finish(error)
+        if self.metering is not None:
+            self.metering.record(meter)
 
-免责声明：本分析结果仅供参考,不能替代专业医生的诊疗意见。请务必在专业医疗机构进行正规诊疗。
+    @staticmethod
+    def _retry(meter: ai_metering.CallMeter, call: Callable, retryable: tuple):
+        """限流、服务端错误和网络错误时按指数退避重试，重试次数记入计量"""
+        for attempt in itertools.count():
+            try:
+                return call()
+            except retryable:
+                if attempt >= MAX_RETRIES:
+                    raise
+                meter.retries += 1
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
 
-请严格按照以上格式输出，特别是用药信息部分，每个药品必须包含名称、剂量、用法、说明和注意事项，并使用统一的格式和缩进。
-"""
+    @staticmethod
+    def _openai_retryable() -> tuple:
+        import openai
+        return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+    @staticmethod
+    def _requests_retryable() -> tuple:
+        import requests
+        return (requests.ConnectionError, requests.Timeout, RetryableStatus)
 
-    def get_openai_analysis(self, prompt: str) -> str:
+    def _messages(self, prompt: str) -> list:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def get_openai_analysis(self, prompt: str, max_tokens: int = 2000, purpose: str = '完整分析') -> str:
+        meter = self._meter("OpenAI", OPENAI_MODEL, purpose)
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的医疗AI助手,基于医学知识提供分析和建议。"},
-                    {"role": "user", "content": prompt}
-                ],
+            response = self._retry(meter, lambda: self.openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=self._messages(prompt),
                 temperature=0.3,
-                max_tokens=2000
-            )
-            return response.choices[0].message.content
+                max_tokens=max_tokens
+            ), self._openai_retryable())
+            if response.usage is not None:
+                meter.usage(*_openai_usage(response.usage))
+            content = response.choices[0].message.content
         except Exception as e:
+            self._record(meter, e)
             raise Exception(f"OpenAI API调用失败: {str(e)}")
+        self._record(meter)
+        return content
 
-    def get_deepseek_analysis(self, prompt: str) -> str:
+    def _deepseek_post(self, prompt: str, max_tokens: int, stream: bool = False):
+        """发出请求并检查状态；429 和 5xx 抛出 RetryableStatus 以便重试"""
+        import requests
+        
+        headers = {
+            "Authorization": f"Bearer {self.deepseek_api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": DEEPSEEK_MODEL,
+            "messages": self._messages(prompt),
+            "temperature": 0.3,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            # 最后一个事件附带 token 用量
+            data.update(stream=True, stream_options={"include_usage": True})
+        
+        response = requests.post(
+            f"{self.deepseek_base_url}/chat/completions",
+            headers=headers,
+            json=data,
+            stream=stream
+        )
+        if response.status_code != 200:
+            message = f"API返回错误: {response.text}"
+            response.close()
+            if response.status_code == 429 or response.status_code >= 500:
+                raise RetryableStatus(message)
+            raise Exception(message)
+        return response
+
+    def get_deepseek_analysis(self, prompt: str, max_tokens: int = 2000, purpose: str = '完整分析') -> str:
+        meter = self._meter("DeepSeek", DEEPSEEK_MODEL, purpose)
         try:
-            headers = {
-                "Authorization": f"Bearer {self.deepseek_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的医疗AI助手,基于医学知识提供分析和建议。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(
-                f"{self.deepseek_base_url}/chat/completions",
-                headers=headers,
-                json=data
-            )
-            
-            if response.status_code == 200:
-                return response.json()['choices'][0]['message']['content']
-            else:
-                raise Exception(f"API返回错误: {response.text}")
+            response = self._retry(meter, lambda: self._deepseek_post(prompt, max_tokens),
+                                   self._requests_retryable())
+            result = response.json()
+            if result.get('usage'):
+                meter.usage(*_deepseek_usage(result['usage']))
+            content = result['choices'][0]['message']['content']
         except Exception as e:
+            self._record(meter, e)
             raise Exception(f"DeepSeek API调用失败: {str(e)}")
+        self._record(meter)
+        return content
 
-    def analyze(self, user_info: Dict[str, Any], symptoms: str) -> str:
-        # 构建医疗提示词
-        prompt = self.build_medical_prompt(user_info, symptoms)
-        
-        # 调用两个模型获取分析结果
-        openai_result = self.get_openai_analysis(prompt)
-        deepseek_result = self.get_deepseek_analysis(prompt)
+    def stream_openai_analysis(self, prompt: str, max_tokens: int = 2000,
+                               purpose: str = '完整分析') -> Iterator[str]:
+        """流式调用，逐段返回生成的文本"""
+        meter = self._meter("OpenAI", OPENAI_MODEL, purpose)
+        try:
+            # 只在收到第一段文本之前重试
+            stream = self._retry(meter, lambda: self.openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=self._messages(prompt),
+                temperature=0.3,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            ), self._openai_retryable())
+            for chunk in stream:
+                if chunk.usage is not None:
+                    meter.usage(*_openai_usage(chunk.usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    meter.first_token()
+                    yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            self._record(meter, Exception("已取消"))
+            raise
+        except Exception as e:
+            self._record(meter, e)
+            raise Exception(f"OpenAI API调用失败: {str(e)}")
+        self._record(meter)
+
+    def stream_deepseek_analysis(self, prompt: str, max_tokens: int = 2000,
+                                 purpose: str = '完整分析') -> Iterator[str]:
+        """流式调用（SSE），逐段返回生成的文本"""
+        meter = self._meter("DeepSeek", DEEPSEEK_MODEL, purpose)
+        try:
+            response = self._retry(meter, lambda: self._deepseek_post(prompt, max_tokens, stream=True),
+                                   self._requests_retryable())
+            with response:
+                # 每个事件一行 "data: {...}"，以 "data: [DONE]" 结束；
+                # 按字节分行后再解码，避免 text/event-stream 未声明编码时按 latin-1 解码
+                for line in response.iter_lines():
+                    if not line.startswith(b'data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == b'[DONE]':
+                        break
+                    event = json.loads(payload.decode('utf-8'))
+                    if event.get('usage'):
+                        meter.usage(*_deepseek_usage(event['usage']))
+                    choices = event.get('choices') or [{}]
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        meter.first_token()
+                        yield content
+        except GeneratorExit:
+            self._record(meter, Exception("已取消"))
+            raise
+        except Exception as e:
+            self._record(meter, e)
+            raise Exception(f"DeepSeek API调用失败: {str(e)}")
+        self._record(meter)
+
+    def analyze(self, user_info: Dict[str, Any], symptoms: str, sectioned: bool = False) -> str:
+        if sectioned:
+            # 两个模型的分段分析同时进行
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                openai_future = pool.submit(self.analyze_sectioned, user_info, symptoms, "OpenAI")
+                deepseek_future = pool.submit(self.analyze_sectioned, user_info, symptoms, "DeepSeek")
+                openai_result = openai_future.result()
+                deepseek_result = deepseek_future.result()
+        else:
+            # 构建医疗提示词
+            prompt = self.build_medical_prompt(user_info, symptoms)
+            
+            # 调用两个模型获取分析结果
+            openai_result = self.get_openai_analysis(prompt)
+            deepseek_result = self.get_deepseek_analysis(prompt)
         
         # 合并分析结果
         final_result = f"""=== AI 综合诊断分析 ===
@@ -179,6 +393,65 @@ OpenAI 分析建议:
 DeepSeek 分析建议:
 {deepseek_result}
 
-免责声明:本分析结果仅供参考,具体诊疗请遵医嘱。
+{DISCLAIMER}
 """
-        return final_result 
\ No newline at end of file
+        return final_result 
+
+    def get_analysis(self, provider: str, prompt: str, max_tokens: int = 2000, purpose: str = '完整分析') -> str:
+        """按模型名称（"OpenAI" / "DeepSeek"）调用"""
+        if provider == "DeepSeek":
+            return self.get_deepseek_analysis(prompt, max_tokens, purpose)
+        return self.get_openai_analysis(prompt, max_tokens, purpose)
+
+    def stream_analysis(self, provider: str, prompt: str, max_tokens: int = 2000,
+                        purpose: str = '完整分析') -> Iterator[str]:
+        """按模型名称流式调用"""
+        if provider == "DeepSeek":
+            return self.stream_deepseek_analysis(prompt, max_tokens, purpose)
+        return self.stream_openai_analysis(prompt, max_tokens, purpose)
+
+    def analyze_sectioned(self, user_info: Dict[str, Any], symptoms: str, provider: str = "OpenAI") -> str:
+        """分段并行分析
+
+        先单独生成诊断，再基于诊断为其余各部分并行发出较小的请求，总耗时约为
+        诊断请求加最慢的一个部分请求，而不是一次生成全部内容。结果按原有的
+        "=== 标题 ===" 格式依次拼接；某个部分失败时只在该部分写明原因。
+        """
+        diagnosis = self.get_analysis(
+            provider, self.build_diagnosis_prompt(user_info, symptoms), DIAGNOSIS_MAX_TOKENS, '诊断'
+        )
+        diagnosis = _section_text(DIAGNOSIS_SECTION[0], diagnosis)
+
+        def generate(section: Tuple[str, str]) -> str:
+            title = section[0]
+            prompt = self.build_section_prompt(user_info, symptoms, diagnosis, section)
+            try:
+                text = self.get_analysis(provider, prompt,
+                                         SECTION_MAX_TOKENS.get(title, DEFAULT_SECTION_MAX_TOKENS), title)
+            except Exception as e:
+                return f"=== {title} ===\n（本部分生成失败: {str(e)}）"
+            return _section_text(title, text)
+
+        with ThreadPoolExecutor(max_workers=len(SECTIONS)) as pool:
+            sections = list(pool.map(generate, SECTIONS))
+
+        return "\n\n".join([diagnosis] + sections) + f"\n\n{DISCLAIMER}\n"
+
+
+_HEADER = re.compile(r'^\s*===\s*(.+?)\s*===\s*$', re.M)
+
+
+def _section_text(title: str, text: str) -> str:
+    """只保留指定部分：补上缺少的标题，去掉模型多输出的其他部分"""
+    text = (text or '').strip()
+    headers = list(_HEADER.finditer(text))
+    own = next((h for h in headers if h.group(1) == title), None)
+    if own is None:
+        body_start, body = 0, text
+    else:
+        body_start = own.end()
+        body = text[body_start:]
+    following = _HEADER.search(body)
+    if following:
+        body = body[:following.start()]
+    return f"=== {title} ===\n{body.strip()}"
@@ -0,0 +1,312 @@
+"""AI 调用计量
+
+每次模型调用记录一行到 ai_calls 表：模型、用途、患者、诊所、提示/生成/缓存
+命中的 token 数、耗时、首个 token 耗时（流式调用）、重试次数和费用。
+调用线程只把记录放入队列，由后台线程批量写入数据库，不增加调用耗时。
+
+单价按每百万 token 计，可在 config.yaml 中覆盖：
+
+    metering:
+      clinic: 本院
+      prices:
+        gpt-3.5-turbo: {input: 0.5, cached_input: 0.25, output: 1.5}
+
+    python ai_metering.py --days 30   # 输出延迟、每日用量和费用统计
+"""
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CLINIC = '本院'
+
+# 每百万 token 的单价（美元）：输入、缓存命中的输入、输出
+DEFAULT_PRICES = {
+    'gpt-3.5-turbo': {'input': 0.5, 'cached_input': 0.5, 'output': 1.5},
+    'deepseek-chat': {'input': 0.27, 'cached_input': 0.07, 'output': 1.1},
+}
+
+# 后台线程每批最多写入的记录数
+BATCH_SIZE = 200
+# 写入失败（如数据库被锁定）时的重试次数和等待秒数（每次加倍，最长 MAX_WRITE_BACKOFF）
+WRITE_RETRIES = 8
+WRITE_BACKOFF = 0.5
+MAX_WRITE_BACKOFF = 10.0
+# flush() 默认最多等待的秒数
+FLUSH_TIMEOUT = 3.0
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ai_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,              -- 调用开始时间
+        provider TEXT,               -- OpenAI / DeepSeek
+        model TEXT,
+        purpose TEXT,                -- 完整分析、诊断或分段分析的部分名称
+        patient TEXT,                -- 患者标识（未填写时为空）
+        clinic TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        cached_tokens INTEGER,       -- 提示中命中缓存的 token 数
+        latency_ms REAL,             -- 从发出请求到完整结果
+        ttft_ms REAL,                -- 首个 token 耗时，仅流式调用
+        retries INTEGER,
+        status TEXT,                 -- ok / error
+        error TEXT,
+        cost REAL
+    )
+'''
+INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_ai_calls_timestamp ON ai_calls (timestamp)
+'''
+
+_COLUMNS = ('timestamp', 'provider', 'model', 'purpose', 'patient', 'clinic', 'prompt_tokens',
+            'completion_tokens', 'cached_tokens', 'latency_ms', 'ttft_ms', 'retries', 'status',
+            'error', 'cost')
+_INSERT = f"INSERT INTO ai_calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+
+class CallMeter:
+    """一次调用的计量，由调用方在请求过程中填写"""
+
+    def __init__(self, provider: str, model: str, purpose: str = '', patient: Optional[str] = None,
+                 clinic: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        self.purpose = purpose
+        self.patient = patient
+        self.clinic = clinic
+        self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached_tokens: Optional[int] = None
+        self.latency_ms: Optional[float] = None
+        self.ttft_ms: Optional[float] = None
+        self.retries = 0
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def first_token(self):
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self._started) * 1000
+
+    def usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+              cached_tokens: Optional[int] = None):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.latency_ms = (time.perf_counter() - self._started) * 1000
+        if error is not None:
+            self.error = str(error)
+
+    def cost(self, prices: Dict[str, Dict[str, float]]) -> Optional[float]:
+        price = prices.get(self.model)
+        if price is None or self.prompt_tokens is None:
+            return None
+        cached = self.cached_tokens or 0
+        return ((self.prompt_tokens - cached) * price.get('input', 0)
+                + cached * price.get('cached_input', price.get('input', 0))
+                + (self.completion_tokens or 0) * price.get('output', 0)) / 1e6
+
+
+class Metering:
+    """计量记录的异步写入
+
+    record() 只入队；后台线程用自己的数据库连接，把队列中已有的记录一次
+    executemany 写入。数据库被锁定等写入失败时按指数退避重试同一批，
+    多次失败后才放弃并计入 dropped。
+    """
+
+    def __init__(self, db_path: str, clinic: Optional[str] = None,
+                 prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.db_path = db_path
+        self.clinic = clinic or DEFAULT_CLINIC
+        self.prices = dict(DEFAULT_PRICES)
+        self.prices.update(prices or {})
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='ai-metering', daemon=True)
+        self._thread.start()
+
+    def meter(self, provider: str, model: str, purpose: str = '', patient: Optional[str] = None) -> CallMeter:
+        return CallMeter(provider, model, purpose, patient, self.clinic)
+
+    def record(self, meter: CallMeter):
+        self._queue.put((
+            meter.timestamp, meter.provider, meter.model, meter.purpose, meter.patient,
+            meter.clinic or self.clinic, meter.prompt_tokens, meter.completion_tokens,
+            meter.cached_tokens, meter.latency_ms, meter.ttft_ms, meter.retries,
+            'error' if meter.error else 'ok', meter.error, meter.cost(self.prices)
+        ))
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """等待已入队的记录写入，超时（如数据库长时间被锁定）返回 False"""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        db = None
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < BATCH_SIZE:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in rows
+            values = [row for row in rows if row is not None]
+            try:
+                if values:
+                    db = self._write(db, values)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+            if stop:
+                break
+        if db is not None:
+            db.close()
+
+    def _write(self, db: Optional[sqlite3.Connection], values: List[tuple]) -> Optional[sqlite3.Connection]:
+        """写入一批记录，返回（可能新建的）连接；连接和建表失败也按写入失败重试"""
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                if db is None:
+                    db = sqlite3.connect(self.db_path)
+                    db.execute(SCHEMA)
+                    db.execute(INDEX)
+                    db.commit()
+                db.executemany(_INSERT, values)
+                db.commit()
+                self.written += len(values)
+                return db
+            except Exception as e:
+                if db is not None:
+                    try:
+                        db.rollback()
+                    except sqlite3.Error:
+                        pass
+                if attempt == WRITE_RETRIES:
+                    # 计量失败不影响分析
+                    self.dropped += len(values)
+                    print(f"写入AI调用记录失败，丢弃 {len(values)} 条: {e}")
+                    return db
+                time.sleep(min(WRITE_BACKOFF * 2 ** attempt, MAX_WRITE_BACKOFF))
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数（values 已排序）"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def _since(days: Optional[int]) -> str:
+    if not days:
+        return ''
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def latency_stats(db: sqlite3.Connection, days: Optional[int] = None) -> List[Dict[str, Any]]:
+    """按模型统计调用次数、失败数、重试数和 p50/p95 耗时（含首个 token）"""
+    rows = db.execute('''
+        SELECT provider, latency_ms, ttft_ms, status, retries FROM ai_calls
+        WHERE timestamp >= ? ORDER BY provider
+    ''', (_since(days),)).fetchall()
+    groups: Dict[str, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(row[0], []).append(row)
+    stats = []
+    for provider, calls in groups.items():
+        latencies = sorted(call[1] for call in calls if call[3] == 'ok' and call[1] is not None)
+        ttfts = sorted(call[2] for call in calls if call[2] is not None)
+        stats.append({
+            'provider': provider,
+            'calls': len(calls),
+            'errors': sum(1 for call in calls if call[3] != 'ok'),
+            'retries': sum(call[4] or 0 for call in calls),
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'ttft_p50_ms': _percentile(ttfts, 50),
+            'ttft_p95_ms': _percentile(ttfts, 95),
+        })
+    return stats
+
+
+def daily_tokens(db: sqlite3.Connection, days: Optional[int] = 30) -> List[Dict[str, Any]]:
+    """每日各模型的 token 用量和费用"""
+    rows = db.execute('''
+        SELECT substr(timestamp, 1, 10) AS day, provider, COUNT(*),
+               COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0),
+               COALESCE(SUM(cached_tokens), 0), COALESCE(SUM(cost), 0)
+        FROM ai_calls
+        WHERE timestamp >= ?
+        GROUP BY day, provider
+        ORDER BY day DESC, provider
+    ''', (_since(days),)).fetchall()
+    return [{'day': row[0], 'provider': row[1], 'calls': row[2], 'prompt_tokens': row[3],
+             'completion_tokens': row[4], 'cached_tokens': row[5], 'cost': row[6]} for row in rows]
+
+
+def cost_by(db: sqlite3.Connection, column: str = 'clinic', days: Optional[int] = None) -> List[Dict[str, Any]]:
+    """按诊所、患者或模型汇总调用次数、token 和费用，费用从高到低"""
+    if column not in ('clinic', 'patient', 'provider', 'purpose'):
+        raise ValueError(f"不支持的汇总字段: {column}")
+    rows = db.execute(f'''
+        SELECT {column}, COUNT(*), COALESCE(SUM(prompt_tokens), 0),
+               COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cost), 0)
+        FROM ai_calls
+        WHERE timestamp >= ?
+        GROUP BY {column}
+        ORDER BY SUM(cost) DESC
+    ''', (_since(days),)).fetchall()
+    return [{column: row[0] or '未填写', 'calls': row[1], 'prompt_tokens': row[2],
+             'completion_tokens': row[3], 'cost': row[4]} for row in rows]
+
+
+def _ms(value: Optional[float]) -> str:
+    return '-' if value is None else f"{value:.0f}"
+
+
+def report(db: sqlite3.Connection, days: Optional[int] = 30) -> str:
+    db.execute(SCHEMA)
+    lines = [f"=== AI 调用统计（最近 {days} 天）===" if days else "=== AI 调用统计 ==="]
+    lines.append("模型\t调用\t失败\t重试\tp50(ms)\tp95(ms)\t首字p50\t首字p95")
+    for s in latency_stats(db, days):
+        lines.append(f"{s['provider']}\t{s['calls']}\t{s['errors']}\t{s['retries']}\t{_ms(s['p50_ms'])}\t"
+                     f"{_ms(s['p95_ms'])}\t{_ms(s['ttft_p50_ms'])}\t{_ms(s['ttft_p95_ms'])}")
+    lines.append("\n日期\t模型\t调用\t提示\t生成\t缓存\t费用")
+    for d in daily_tokens(db, days):
+        lines.append(f"{d['day']}\t{d['provider']}\t{d['calls']}\t{d['prompt_tokens']}\t"
+                     f"{d['completion_tokens']}\t{d['cached_tokens']}\t{d['cost']:.4f}")
+    lines.append("\n诊所\t调用\t提示\t生成\t费用")
+    for c in cost_by(db, 'clinic', days):
+        lines.append(f"{c['clinic']}\t{c['calls']}\t{c['prompt_tokens']}\t{c['completion_tokens']}\t{c['cost']:.4f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AI 调用的延迟、用量和费用统计")
+    parser.add_argument('--db', default='medical.db')
+    parser.add_argument('--days', type=int, default=30, help="统计最近多少天（0 为全部）")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    print(report(connection, args.days or None))
+    connection.close()
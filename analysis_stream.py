@@ -0,0 +1,167 @@
+"""流式分析与用药条目的增量识别
+
+模型输出按片段到达，MedicationStreamParser 只保留最后一个未完整的行，
+逐行判断当前所在的部分；在"用药方案"等部分中，"- 药品：剂量 用法" 开始
+一个条目，其后的"用药说明/注意事项"补充到该条目。条目在写完注意事项、
+出现下一个条目或离开该部分时即告完成，立即交给界面，生成结束时用药列表
+已经整理好，不需要再对全文做一遍匹配。
+
+AnalysisStream 在后台线程中读取流式结果，文本片段、完成的用药条目和最终
+结果通过信号投递回界面线程。
+"""
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import drug_normalizer
+
+# 其中的条目视为用药（与"从分析结果提取"的快速选择一致）
+MEDICATION_SECTIONS = ("用药方案", "治疗方案", "推荐用药", "用药建议")
+# 文本片段最多每隔这么久投递一次，避免逐个 token 刷新界面
+TEXT_INTERVAL = 0.05
+
+_HEADER = re.compile(r'^\s*===\s*(.+?)\s*===\s*$')
+# 与提取对话框的简单格式相同：名称、剂量（到第一个逗号或空白为止）、用法
+_ENTRY = re.compile(r'^\s*[-•]\s*([^：:\n]+)[：:]\s*([^，,\n]+?)(?:[，,]|\s+)(.+)$')
+_NOTE = re.compile(r'^\s*(用药说明|注意事项)\s*[：:]\s*(.*)$')
+_NOTE_LABELS = {'用药说明': '说明', '注意事项': '注意'}
+
+
+class MedicationStreamParser:
+    """增量识别用药条目，feed/close 返回新完成的条目（已按通用名去重）"""
+
+    def __init__(self):
+        self._buffer = ''
+        self._in_section = False
+        self._current: Optional[Dict[str, Any]] = None
+        self._notes: List[str] = []
+        self._seen = set()
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        self._buffer += chunk
+        if '\n' not in chunk:
+            return []
+        *lines, self._buffer = self._buffer.split('\n')
+        done = []
+        for line in lines:
+            self._line(line, done)
+        return done
+
+    def close(self) -> List[Dict[str, str]]:
+        """输出结束：处理最后一行并交出未完成的条目"""
+        done = []
+        if self._buffer:
+            self._line(self._buffer, done)
+            self._buffer = ''
+        self._finish(done)
+        return done
+
+    def _line(self, line: str, done: list):
+        header = _HEADER.match(line)
+        if header:
+            self._finish(done)
+            self._in_section = any(name in header.group(1) for name in MEDICATION_SECTIONS)
+            return
+        if not self._in_section:
+            return
+
+        entry = _ENTRY.match(line)
+        if entry:
+            self._finish(done)
+            # 跳过非药品行
+            if "无抗生素推荐" not in entry.group(1):
+                self._current = {
+                    'name': entry.group(1).strip(),
+                    'dosage': entry.group(2).strip(),
+                    'time': entry.group(3).strip(),
+                }
+            return
+
+        note = _NOTE.match(line)
+        if note and self._current is not None:
+            if note.group(2).strip():
+                self._notes.append(f"{_NOTE_LABELS[note.group(1)]}：{note.group(2).strip()}")
+            # 注意事项是条目的最后一项，写完即可交出
+            if note.group(1) == '注意事项':
+                self._finish(done)
+
+    def _finish(self, done: list):
+        med, self._current = self._current, None
+        notes, self._notes = self._notes, []
+        if med is None:
+            return
+        # "阿莫西林(0.25g)"与"Amoxicillin"视为同一药品，不同剂型分别保留
+        names = drug_normalizer.normalizer()
+        key = names.dedupe_key(med['name'])
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        med['name'] = names.canonical(med['name'])
+        med['notes'] = "\n".join(notes)
+        done.append(med)
+
+
+def parse_medications(text: str) -> List[Dict[str, str]]:
+    """一次性识别完整文本中的用药条目（非流式的分析结果）"""
+    parser = MedicationStreamParser()
+    return parser.feed(text) + parser.close()
+
+
+class AnalysisStream(QObject):
+    """在后台线程中读取流式分析结果"""
+
+    text = pyqtSignal(str)          # 新到达的文本
+    medications = pyqtSignal(list)  # 新完成的用药条目
+    finished = pyqtSignal(str)      # 完整的分析结果
+    failed = pyqtSignal(str)        # 错误信息
+
+    def __init__(self, chunks: Callable[[], Iterable[str]], parent=None):
+        super().__init__(parent)
+        self._chunks = chunks
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='analysis-stream', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """停止投递结果（当前的网络请求在后台自然结束）"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _run(self):
+        parser = MedicationStreamParser()
+        parts, pending = [], []
+        last_emit = 0.0
+        try:
+            for chunk in self._chunks():
+                if self.cancelled:
+                    return
+                parts.append(chunk)
+                pending.append(chunk)
+                done = parser.feed(chunk)
+                now = time.monotonic()
+                if done or now - last_emit >= TEXT_INTERVAL:
+                    # 先投递文本，再投递其中完成的条目
+                    self.text.emit(''.join(pending))
+                    pending.clear()
+                    last_emit = now
+                if done:
+                    self.medications.emit(done)
+            if self.cancelled:
+                return
+            if pending:
+                self.text.emit(''.join(pending))
+            done = parser.close()
+            if done:
+                self.medications.emit(done)
+            self.finished.emit(''.join(parts))
+        except Exception as e:
+            if not self.cancelled:
+                self.failed.emit(str(e))
@@ -0,0 +1,248 @@
+"""批量导出处方 PDF
+
+按日期范围和/或科室分块读取 prescriptions 与 prescription_items 的联接结果，
+每凑满一批处方就交给进程池渲染，多核并行生成 PDF。可以每份处方一个文件，
+也可以合并为一个按处方分页的 PDF。
+
+    python bulk_export.py --start 2024-01-01 --end 2024-12-31 --out 处方导出
+    python bulk_export.py --department 内科 --merged --out 内科处方.pdf
+"""
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import exporters
+
+Progress = Optional[Callable[[float], None]]
+
+
+def _filters(start_date: Optional[str], end_date: Optional[str],
+             department: Optional[str]) -> Tuple[str, list]:
+    conditions, params = [], []
+    if start_date:
+        conditions.append('p.date >= ?')
+        params.append(start_date)
+    if end_date:
+        # 结束日期包含当天
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        conditions.append('p.date < ?')
+        params.append(end.strftime('%Y-%m-%d'))
+    if department:
+        conditions.append('p.department = ?')
+        params.append(department)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where, params
+
+
+def count_prescriptions(db: sqlite3.Connection, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None, department: Optional[str] = None) -> int:
+    where, params = _filters(start_date, end_date, department)
+    return db.execute(f'SELECT COUNT(*) FROM prescriptions p {where}', params).fetchone()[0]
+
+
+def iter_prescriptions(db: sqlite3.Connection, start_date: Optional[str] = None,
+                       end_date: Optional[str] = None, department: Optional[str] = None,
+                       chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """按处方逐个产出联接行（与 export_prescription 查询结果的列相同），不一次读入全部"""
+    where, params = _filters(start_date, end_date, department)
+    cursor = db.execute(f'''
+        SELECT p.*, i.*
+        FROM prescriptions p
+        LEFT JOIN prescription_items i ON p.id = i.prescription_id
+        {where}
+        ORDER BY p.id, i.id
+    ''', params)
+
+    current: List[tuple] = []
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            if current and row[0] != current[0][0]:
+                yield current
+                current = []
+            current.append(row)
+    if current:
+        yield current
+
+
+def _safe_name(text: str) -> str:
+    return ''.join('_' if c in '\\/:*?"<>|' else c for c in str(text))
+
+
+def _render_files(directory: str, batch: List[List[tuple]]) -> int:
+    """进程池任务：每份处方写一个文件（先写临时文件再改名）"""
+    for prescription_data in batch:
+        file_name = os.path.join(directory, f"处方_{_safe_name(prescription_data[0][1])}.pdf")
+        temp_name = f"{file_name}.tmp"
+        exporters.export_prescription_pdf(temp_name, prescription_data)
+        os.replace(temp_name, file_name)
+    return len(batch)
+
+
+def _render_merged(file_name: str, batch: List[List[tuple]], first_page: int) -> int:
+    """进程池任务：把一批处方按顺序写入一个多页 PDF 分段"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    font_name = exporters.prescription_font()
+    c = canvas.Canvas(file_name, pagesize=A4)
+    page = first_page
+    for prescription_data in batch:
+        page += exporters.draw_prescription(c, font_name, prescription_data, page)
+        c.showPage()
+    c.save()
+    return len(batch)
+
+
+def _merge_pdfs(file_name: str, parts: List[str]):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(part)
+    with open(file_name, 'wb') as f:
+        writer.write(f)
+
+
+def export_prescriptions(target: str, db_path: str, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None, department: Optional[str] = None,
+                         merged: bool = False, workers: Optional[int] = None,
+                         batch_size: int = 50, progress: Progress = None) -> str:
+    """批量导出处方，返回包含吞吐量的统计说明
+
+    merged 为 False 时 target 是输出目录，每份处方一个文件；为 True 时 target
+    是合并后的 PDF 文件。合并需要 pypdf，未安装时在当前进程中顺序写入。
+    """
+    workers = workers or os.cpu_count() or 1
+    db = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    try:
+        total = count_prescriptions(db, start_date, end_date, department)
+        prescriptions = iter_prescriptions(db, start_date, end_date, department)
+
+        if merged:
+            try:
+                import pypdf  # noqa: F401
+            except ImportError:
+                done = _export_merged_sequential(target, prescriptions, total, progress)
+            else:
+                done = _export_parallel(target, prescriptions, total, True, workers, batch_size, progress)
+        else:
+            os.makedirs(target, exist_ok=True)
+            done = _export_parallel(target, prescriptions, total, False, workers, batch_size, progress)
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    rate = done / seconds if seconds > 0 else 0.0
+    return f"共 {done} 份处方，用时 {seconds:.1f} 秒，{rate:.1f} 份/秒"
+
+
+def _export_parallel(target: str, prescriptions: Iterator[List[tuple]], total: int,
+                     merged: bool, workers: int, batch_size: int, progress: Progress) -> int:
+    """分批提交到进程池，同时在途的批次数有上限，读取和渲染保持流式"""
+    temp_dir = tempfile.mkdtemp(prefix='.bulk_export_', dir=os.path.dirname(os.path.abspath(target))) \
+        if merged else None
+    parts: List[str] = []
+    pending = set()
+    done = 0
+
+    # spawn 方式启动子进程，避免在带界面线程的进程中 fork
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        def collect(return_when):
+            nonlocal done, pending
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                done += future.result()
+            if progress:
+                progress(done / total if total else 1.0)
+
+        def submit(batch: List[List[tuple]], page: int):
+            if merged:
+                parts.append(os.path.join(temp_dir, f"{len(parts):06d}.pdf"))
+                pending.add(pool.submit(_render_merged, parts[-1], batch, page))
+            else:
+                pending.add(pool.submit(_render_files, target, batch))
+
+        batch: List[List[tuple]] = []
+        page = 1
+        for prescription_data in prescriptions:
+            batch.append(prescription_data)
+            if len(batch) < batch_size:
+                continue
+            submit(batch, page)
+            page += sum(exporters.prescription_pages(p) for p in batch)
+            batch = []
+            if len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+        if batch:
+            submit(batch, page)
+        while pending:
+            collect(FIRST_COMPLETED)
+
+        if merged:
+            # 各分段按提交顺序合并，页码已在渲染时按全局顺序编号
+            if parts:
+                _merge_pdfs(target, parts)
+            else:
+                _render_merged(target, [], 1)
+    finally:
+        # 取消或出错时丢弃尚未开始的批次
+        pool.shutdown(wait=True, cancel_futures=True)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return done
+
+
+def _export_merged_sequential(file_name: str, prescriptions: Iterator[List[tuple]],
+                              total: int, progress: Progress) -> int:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    font_name = exporters.prescription_font()
+    c = canvas.Canvas(file_name, pagesize=A4)
+    done = 0
+    page = 1
+    for prescription_data in prescriptions:
+        done += 1
+        page += exporters.draw_prescription(c, font_name, prescription_data, page)
+        c.showPage()
+        if progress and done % 50 == 0:
+            progress(done / total if total else 1.0)
+    c.save()
+    return done
+
+
+def list_departments(db: sqlite3.Connection) -> List[str]:
+    rows = db.execute('''
+        SELECT DISTINCT department FROM prescriptions
+        WHERE department IS NOT NULL AND department != ''
+        ORDER BY department
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量导出处方 PDF")
+    parser.add_argument('--db', default='medical.db')
+    parser.add_argument('--start', help="开始日期 YYYY-MM-DD")
+    parser.add_argument('--end', help="结束日期 YYYY-MM-DD（含当天）")
+    parser.add_argument('--department')
+    parser.add_argument('--merged', action='store_true', help="合并为一个 PDF")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--out', required=True, help="输出目录，--merged 时为 PDF 文件")
+    args = parser.parse_args()
+
+    print(export_prescriptions(args.out, args.db, args.start, args.end, args.department,
+                               args.merged, args.workers))
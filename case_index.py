@@ -0,0 +1,247 @@
+"""相似病例检索
+
+用 MinHash/LSH 在历史病历中查找与当前问诊相似的病例：症状描述归一化后取
+字符二元组，再加上年龄段和性别，计算 64 个最小哈希值作为病例签名。签名分成
+16 段，每段 4 个值，任一段完全相同的病例作为候选（相似度 0.5 左右开始大概率
+命中），再按签名相同的比例（Jaccard 相似度的估计）排序。
+
+签名存放在 case_signatures 表中（首次载入时建表），启动后只需读入签名重建
+分段桶；保存病历时增量加入，删除病历时移出，不需要重建索引。索引未载入时
+删除的病历，其签名在下次载入时清理。
+"""
+import json
+import re
+import sqlite3
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# 哈希参数或分词方式改变时递增，旧签名在载入时重新计算
+VERSION = 1
+SEED = 20240601
+# 低于该相似度的病例不展示
+MIN_SIMILARITY = 0.3
+# 年龄段下界：婴幼儿、儿童、青少年、青年、中年、老年
+AGE_BUCKETS = (0, 3, 13, 18, 40, 65)
+
+# 大于 2^32 的素数；a < 2^31、哈希值 < 2^32，a*x+b 不会溢出 uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)[:, None]
+# 把一段内的 ROWS 个值合成一个段键（uint64 乘加自然回绕）
+_MIX = _rng.integers(1, 1 << 63, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+_NOISE = re.compile(r'[\W_]+')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS case_signatures (
+        record_id INTEGER PRIMARY KEY,   -- 病历ID
+        version INTEGER,                 -- 签名算法版本
+        signature BLOB,                  -- NUM_PERM 个 uint64 最小哈希值
+        FOREIGN KEY (record_id) REFERENCES medical_records (id)
+    )
+'''
+
+
+def normalize_symptoms(text: str) -> str:
+    """统一全半角和大小写，去掉空白和标点"""
+    return _NOISE.sub('', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def age_bucket(age: Optional[int]) -> Optional[int]:
+    # 界面中年龄未填写时为 0，视为未知
+    if not age:
+        return None
+    return sum(1 for low in AGE_BUCKETS if age >= low)
+
+
+def shingles(symptoms: str, age: Optional[int] = None, gender: Optional[str] = None) -> Set[str]:
+    text = normalize_symptoms(symptoms)
+    if not text:
+        return set()
+    result = {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+    bucket = age_bucket(age)
+    if bucket is not None:
+        result.add(f"#age{bucket}")
+    if gender:
+        result.add(f"#sex{gender}")
+    return result
+
+
+def signature(symptoms: str, age: Optional[int] = None, gender: Optional[str] = None) -> Optional[np.ndarray]:
+    """病例的 MinHash 签名；症状为空时返回 None"""
+    items = shingles(symptoms, age, gender)
+    if not items:
+        return None
+    hashes = np.fromiter((zlib.crc32(item.encode('utf-8')) for item in items), dtype=np.uint64, count=len(items))
+    return ((_A * hashes + _B) % _PRIME).min(axis=1)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """(n, NUM_PERM) 签名 -> (n, BANDS) 段键"""
+    return (signatures.reshape(len(signatures), BANDS, ROWS) * _MIX).sum(axis=2, dtype=np.uint64)
+
+
+def _patient(patient_info: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    try:
+        info = json.loads(patient_info or '{}')
+    except ValueError:
+        return None, None
+    return info.get('age'), info.get('gender')
+
+
+def summary(diagnosis: str, width: int = 60) -> str:
+    """诊断结果的摘要：优先取"主要诊断"一行"""
+    match = re.search(r'主要诊断\s*[:：]\s*(.+)', diagnosis or '')
+    text = match.group(1).strip() if match else (diagnosis or '').strip().replace('\n', ' ')
+    return text if len(text) <= width else text[:width] + "..."
+
+
+class CaseIndex:
+    """medical_records 上的 LSH 索引
+
+    载入时每段的段键排好序，查询时二分查找；之后新增的病例记在一个小字典里，
+    下次载入时并入有序数组。
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.load()
+
+    def __len__(self) -> int:
+        return int(self._alive[:len(self._ids)].sum())
+
+    def load(self):
+        """读入已保存的签名，缺少或过期的签名重新计算并保存"""
+        self.db.execute(SCHEMA)
+        self.db.execute('DELETE FROM case_signatures WHERE record_id NOT IN (SELECT id FROM medical_records)')
+        rows = self.db.execute('''
+            SELECT r.id, r.symptoms, r.patient_info, s.version, s.signature
+            FROM medical_records r
+            LEFT JOIN case_signatures s ON s.record_id = r.id
+            WHERE r.symptoms != '' AND r.diagnosis != ''
+            ORDER BY r.id
+        ''').fetchall()
+
+        ids, blobs, missing = [], [], []
+        for record_id, symptoms, patient_info, version, blob in rows:
+            if version != VERSION or not blob:
+                sig = signature(symptoms, *_patient(patient_info))
+                if sig is None:
+                    continue
+                blob = sig.tobytes()
+                missing.append((record_id, VERSION, blob))
+            ids.append(record_id)
+            blobs.append(blob)
+        if missing:
+            self.db.executemany('INSERT OR REPLACE INTO case_signatures VALUES (?, ?, ?)', missing)
+        self.db.commit()
+
+        self._ids: List[int] = ids
+        self._positions: Dict[int, int] = {record_id: i for i, record_id in enumerate(ids)}
+        # 所有签名拼接后一次转成矩阵
+        self._signatures = np.frombuffer(b''.join(blobs), dtype=np.uint64).reshape(-1, NUM_PERM).copy()
+        self._alive = np.ones(len(ids), dtype=bool)
+        keys = band_keys(self._signatures).T                    # (BANDS, n)
+        self._order = np.argsort(keys, axis=1, kind='stable')
+        self._sorted_keys = np.take_along_axis(keys, self._order, axis=1)
+        self._recent: Dict[Tuple[int, int], List[int]] = {}
+
+    def _grow(self):
+        # 按容量倍增扩展，避免每次加入都复制整个矩阵
+        capacity = max(16, len(self._signatures) * 2)
+        signatures = np.zeros((capacity, NUM_PERM), dtype=np.uint64)
+        signatures[:len(self._ids)] = self._signatures[:len(self._ids)]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._ids)] = self._alive[:len(self._ids)]
+        self._signatures, self._alive = signatures, alive
+
+    def add(self, record_id: int, symptoms: str, age: Optional[int] = None, gender: Optional[str] = None):
+        """保存病历后加入索引（签名写入数据库，由调用方提交）"""
+        sig = signature(symptoms, age, gender)
+        if sig is None:
+            return
+        if record_id in self._positions:
+            self.remove(record_id)
+        self.db.execute('INSERT OR REPLACE INTO case_signatures VALUES (?, ?, ?)',
+                        (record_id, VERSION, sig.tobytes()))
+        if len(self._ids) >= len(self._signatures):
+            self._grow()
+        position = len(self._ids)
+        self._ids.append(record_id)
+        self._positions[record_id] = position
+        self._signatures[position] = sig
+        self._alive[position] = True
+        for band, key in enumerate(band_keys(sig[None, :])[0]):
+            self._recent.setdefault((band, int(key)), []).append(position)
+
+    def remove(self, record_id: int):
+        """删除病历时移出索引（由调用方提交）"""
+        position = self._positions.pop(record_id, None)
+        if position is not None:
+            self._alive[position] = False
+        self.db.execute('DELETE FROM case_signatures WHERE record_id = ?', (record_id,))
+
+    def _candidates(self, keys: np.ndarray) -> np.ndarray:
+        found = []
+        for band, key in enumerate(keys):
+            row = self._sorted_keys[band]
+            lo, hi = np.searchsorted(row, key, 'left'), np.searchsorted(row, key, 'right')
+            if hi > lo:
+                found.append(self._order[band, lo:hi])
+            recent = self._recent.get((band, int(key)))
+            if recent:
+                found.append(np.array(recent, dtype=np.int64))
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.unique(np.concatenate(found))
+        return positions[self._alive[positions]]
+
+    def query(self, symptoms: str, age: Optional[int] = None, gender: Optional[str] = None,
+              k: int = 5, min_similarity: float = MIN_SIMILARITY) -> List[Tuple[int, float]]:
+        """最相似的 k 个病例 [(病历ID, 相似度)]，相似度从高到低"""
+        sig = signature(symptoms, age, gender)
+        if sig is None or not self._ids:
+            return []
+        positions = self._candidates(band_keys(sig[None, :])[0])
+        if not positions.size:
+            return []
+        similarity = (self._signatures[positions] == sig).mean(axis=1)
+        order = np.argsort(-similarity, kind='stable')[:k]
+        return [(self._ids[positions[i]], float(similarity[i])) for i in order if similarity[i] >= min_similarity]
+
+    def similar_cases(self, symptoms: str, age: Optional[int] = None, gender: Optional[str] = None,
+                      k: int = 5) -> List[Dict[str, Any]]:
+        """相似病例及其诊断，供界面展示"""
+        matches = self.query(symptoms, age, gender, k)
+        if not matches:
+            return []
+        ids = [record_id for record_id, _ in matches]
+        rows = self.db.execute(f'''
+            SELECT id, timestamp, patient_info, symptoms, diagnosis FROM medical_records
+            WHERE id IN ({','.join('?' * len(ids))})
+        ''', ids).fetchall()
+        records = {row[0]: row for row in rows}
+        cases = []
+        for record_id, similarity in matches:
+            if record_id not in records:
+                continue
+            _, timestamp, patient_info, record_symptoms, diagnosis = records[record_id]
+            record_age, record_gender = _patient(patient_info)
+            cases.append({
+                'id': record_id,
+                'similarity': similarity,
+                'timestamp': timestamp,
+                'age': record_age,
+                'gender': record_gender,
+                'symptoms': record_symptoms,
+                'diagnosis': diagnosis,
+                'summary': summary(diagnosis),
+            })
+        return cases
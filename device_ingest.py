@@ -0,0 +1,291 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from health_import import row_readings
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+Reading = Tuple[str, str, float]
+
+
+class ReadingRingBuffer:
+    """定长环形缓冲区，写满后丢弃最旧的读数"""
+
+    def __init__(self, capacity: int = 100000):
+        self._items = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+
+    def push_many(self, readings: List[Reading]):
+        with self._lock:
+            overflow = len(self._items) + len(readings) - self._items.maxlen
+            if overflow > 0:
+                self.dropped += min(overflow, self._items.maxlen)
+            self._items.extend(readings)
+            self.received += len(readings)
+
+    def requeue(self, readings: List[Reading]):
+        """写入失败的读数放回缓冲区最前面，超出容量时丢弃其中最旧的"""
+        with self._lock:
+            items = readings + list(self._items)
+            overflow = len(items) - self._items.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+                items = items[overflow:]
+            self._items.clear()
+            self._items.extend(items)
+
+    def discard(self, count: int):
+        """记录无法写入而丢弃的读数"""
+        with self._lock:
+            self.dropped += count
+
+    def drain(self) -> List[Reading]:
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """POST /readings 接收读数，GET /status 返回接入统计"""
+
+    server_version = 'MedicalIngest/1.0'
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/readings':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length).decode('utf-8')
+            rows = parse_payload(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            self._reply(400, {'error': f'无法解析数据: {str(e)}'})
+            return
+
+        readings, invalid = [], 0
+        for row in rows:
+            try:
+                readings.extend(row_readings(row))
+            except (ValueError, TypeError, AttributeError):
+                invalid += 1
+        self.server.ingest.buffer.push_many(readings)
+        self._reply(202, {'accepted': len(readings), 'invalid': invalid})
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/status':
+            self._reply(404, {'error': 'not found'})
+            return
+        self._reply(200, self.server.ingest.stats())
+
+    def _reply(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 高频上报时不逐条打印访问日志
+        pass
+
+
+def parse_payload(body: str) -> List[Dict[str, Any]]:
+    """支持单个对象、对象数组或按行分隔的 JSON"""
+    body = body.strip()
+    if not body:
+        return []
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    if isinstance(payload, dict):
+        return payload['readings'] if isinstance(payload.get('readings'), list) else [payload]
+    if isinstance(payload, list):
+        return payload
+    raise ValueError("数据必须是对象或对象数组")
+
+
+class DeviceIngestServer:
+    """本地设备数据接入服务
+
+    HTTP 请求线程只做解析和校验并写入环形缓冲区；后台线程按固定间隔把缓冲区
+    中的读数用一个事务批量写入 SQLite，然后通过 on_flush 回调通知界面。
+    数据库被锁定等写入失败时，这批读数放回缓冲区，下一轮重试。
+    """
+
+    # 停止服务时最后一批的重试次数（每次间隔 flush_interval）
+    FINAL_RETRIES = 10
+
+    def __init__(self, db_path: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 flush_interval: float = 0.5, capacity: int = 100000,
+                 on_flush: Optional[Callable[[List[Reading]], None]] = None):
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.buffer = ReadingRingBuffer(capacity)
+        self.written = 0
+        self.batches = 0
+        self._stop = threading.Event()
+        self._httpd = None
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return self._httpd is not None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _IngestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.ingest = self
+        # 端口为 0 时使用系统分配的端口
+        self.port = self._httpd.server_address[1]
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, name='ingest-http', daemon=True),
+            threading.Thread(target=self._flush_loop, name='ingest-flush', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        if not self._httpd:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._httpd = None
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'received': self.buffer.received,
+            'dropped': self.buffer.dropped,
+            'pending': len(self.buffer),
+            'written': self.written,
+            'batches': self.batches
+        }
+
+    def _flush_loop(self):
+        """按固定间隔批量写入，停止时写完剩余数据"""
+        db = sqlite3.connect(self.db_path)
+        # WAL 模式下写入不阻塞界面线程的读取，且每批只需一次同步；
+        # 数据库正被锁定时无法切换，不影响写入
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.OperationalError as e:
+            print(f"无法启用 WAL 模式: {str(e)}")
+        db.execute('PRAGMA synchronous=NORMAL')
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._flush(db)
+            for _ in range(self.FINAL_RETRIES):
+                if self._flush(db):
+                    break
+                time.sleep(self.flush_interval)
+            else:
+                # 仍无法写入，剩余读数计为丢弃
+                self.buffer.discard(len(self.buffer.drain()))
+        finally:
+            db.close()
+
+    def _flush(self, db: sqlite3.Connection) -> bool:
+        """写入缓冲区中的读数，失败时放回缓冲区并返回 False"""
+        readings = self.buffer.drain()
+        if not readings:
+            return True
+        try:
+            db.executemany('''
+                INSERT INTO health_trends (timestamp, type, value)
+                VALUES (?, ?, ?)
+            ''', readings)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"写入设备数据失败，稍后重试: {str(e)}")
+            self.buffer.requeue(readings)
+            return False
+        self.written += len(readings)
+        self.batches += 1
+        if self.on_flush:
+            self.on_flush(readings)
+        return True
+
+
+def simulate_device(url: str, trend_type: str = '体重', rate: int = 1000,
+                    seconds: float = 5.0, batch: int = 100) -> Dict[str, Any]:
+    """模拟设备按指定频率（条/秒）上报读数，返回服务端统计"""
+    import random
+    from datetime import datetime
+    from urllib.request import Request, urlopen
+
+    columns = {'体重': ('weight', 70.0, 0.5), '血压': ('systolic', 120.0, 8.0),
+               '血糖': ('glucose', 5.6, 0.6), '体温': ('temperature', 36.6, 0.3)}
+    column, base, spread = columns[trend_type]
+    interval = batch / rate
+    deadline = time.monotonic() + seconds
+    sent = 0
+
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        payload = [{'timestamp': now, column: round(random.gauss(base, spread), 1)}
+                   for _ in range(batch)]
+        request = Request(f"{url}/readings", data=json.dumps(payload).encode('utf-8'),
+                          headers={'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            response.read()
+        sent += batch
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+    with urlopen(f"{url}/status") as response:
+        stats = json.loads(response.read())
+    stats['sent'] = sent
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="设备数据接入服务 / 模拟设备")
+    parser.add_argument('mode', choices=['serve', 'simulate'])
+    parser.add_argument('--db', default='medical.db')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--type', default='体重', dest='trend_type')
+    parser.add_argument('--rate', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        server = DeviceIngestServer(args.db, args.host, args.port)
+        server.start()
+        print(f"设备数据接入服务已启动: {server.url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        print(simulate_device(f"http://{args.host}:{args.port}", args.trend_type,
+                              args.rate, args.seconds))
@@ -0,0 +1,203 @@
+"""用法用量中的服药频次解析
+
+把"每日三次(饭后)"、"bid"、"q8h"、"隔日一次 连用7天"、"睡前"等写法统一解析为
+DoseRule：每天的服药时刻、间隔天数和疗程天数。同一写法只解析一次（缓存），
+服药时间按需逐个生成，时间表、提醒调度和日历导出共用同一套规则。
+"""
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# 三餐时间（分钟），饭前/饭后在此基础上提前或推后半小时
+MEALS = (7 * 60 + 30, 12 * 60, 18 * 60)
+MEAL_OFFSET = 30
+BEDTIME = 21 * 60 + 30
+
+# 未注明饭前饭后时，每日 N 次的默认时刻
+DAILY_SLOTS = {
+    1: (8 * 60,),
+    2: (8 * 60, 20 * 60),
+    3: (8 * 60, 14 * 60, 20 * 60),
+    4: (8 * 60, 12 * 60, 16 * 60, 20 * 60),
+}
+# 按间隔服药时第一次的时刻；一天内的服药尽量落在起床到就寝之间，
+# 跨度放不下时把第一次提前，但不早于 EARLIEST
+INTERVAL_ANCHOR = 8 * 60
+EARLIEST = 6 * 60
+LATEST = 22 * 60
+
+# 拉丁缩写：每日次数
+LATIN_DAILY = {'qd': 1, 'qm': 1, 'bid': 2, 'tid': 3, 'qid': 4}
+
+CHINESE_DIGITS = {'零': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5,
+                  '六': 6, '七': 7, '八': 8, '九': 9}
+
+_NUMBER = r'(\d+|[一二两三四五六七八九十]+)'
+_CLOCK = re.compile(r'(?<!\d)([01]?\d|2[0-4])[:：]([0-5]\d)(?!\d)')
+_PER_DAY = re.compile(rf'(?:每日|每天|一日|一天|每晚|每晨|每早|日)\s*{_NUMBER}\s*次'
+                      rf'|{_NUMBER}\s*次\s*/\s*(?:日|天|d)')
+_PER_HOURS = re.compile(rf'每\s*{_NUMBER}\s*(?:个)?小时|(?<![a-z])q\s*(\d+)\s*h(?![a-z])')
+_EVERY_DAYS = re.compile(rf'每\s*{_NUMBER}\s*(?:天|日)\s*(?:一次|1次)|隔日|隔天|(?<![a-z])qod(?![a-z])')
+_COURSE = re.compile(rf'(?:连用|连服|连续|共|疗程)\s*{_NUMBER}\s*(?:天|日)|[x×]\s*{_NUMBER}\s*(?:天|日|d)')
+# 汉字也算单词字符，拉丁缩写用前后不是字母来界定
+_LATIN = re.compile(r'(?<![a-z])(qd|qm|bid|tid|qid)(?![a-z])')
+_AS_NEEDED = re.compile(r'需要时|必要时|按需|疼痛时|发热时|(?<![a-z])(?:prn|sos)(?![a-z])')
+_BEFORE_MEAL = re.compile(r'饭前|餐前|空腹|(?<![a-z])ac(?![a-z])')
+_AFTER_MEAL = re.compile(r'饭后|餐后|(?<![a-z])pc(?![a-z])')
+_BEDTIME = re.compile(r'睡前|临睡|(?<![a-z])(?:qn|hs)(?![a-z])')
+_EVENING = re.compile(r'晚')
+
+
+def _number(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    # 十、十二、二十 等
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (CHINESE_DIGITS.get(tens, 1) if tens else 1) * 10 + (CHINESE_DIGITS.get(ones, 0) if ones else 0)
+    return CHINESE_DIGITS.get(text, 0)
+
+
+def _first_number(match: re.Match) -> int:
+    return _number(next(group for group in match.groups() if group))
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class DoseRule(NamedTuple):
+    """解析后的服药规则"""
+    minutes: Tuple[int, ...] = ()       # 每天的服药时刻（零点起的分钟数，升序）
+    every_days: int = 1                 # 每几天服一次，隔日为 2
+    course_days: Optional[int] = None   # 用法中写明的疗程天数
+    as_needed: bool = False             # 需要时服用，没有固定时间
+
+    def times(self) -> List[str]:
+        """每天的服药时刻，如 ["08:00", "20:00"]"""
+        return [format_minutes(m) for m in self.minutes]
+
+    def total_days(self, days: Optional[int] = None) -> Optional[int]:
+        """疗程天数：用法中写明的优先，其次为外部给定的天数"""
+        return self.course_days or days
+
+    def doses_per_course(self, days: Optional[int] = None) -> Optional[int]:
+        total = self.total_days(days)
+        if total is None:
+            return None
+        return len(self.minutes) * ((total - 1) // self.every_days + 1)
+
+    def occurrences(self, start: Union[date, datetime], days: Optional[int] = None,
+                    after: Optional[datetime] = None,
+                    until: Optional[datetime] = None) -> Iterator[datetime]:
+        """从 start 当天起按时间顺序产出服药时间（不含 after，含 until）
+
+        疗程天数未知时一直生成，调用方需给出 until 或自行停止。
+        """
+        if not self.minutes:
+            return
+        start = datetime(start.year, start.month, start.day)
+        total = self.total_days(days)
+        day = 0
+        if after is not None and after > start:
+            # 直接跳到 after 所在的服药日，不逐日扫描
+            day = (after - start).days // self.every_days * self.every_days
+        while total is None or day < total:
+            base = start + timedelta(days=day)
+            if until is not None and base > until:
+                return
+            for minute in self.minutes:
+                when = base + timedelta(minutes=minute)
+                if after is not None and when <= after:
+                    continue
+                if until is not None and when > until:
+                    return
+                yield when
+            day += self.every_days
+
+
+def _normalize(text: str) -> str:
+    # 全角转半角、大写转小写，"Ｑ８Ｈ"、"BID" 与 "q8h"、"bid" 相同
+    return unicodedata.normalize('NFKC', text or '').lower().strip()
+
+
+def _spread(count: int, step: int) -> Tuple[int, ...]:
+    """等间隔的每日服药时刻，从 INTERVAL_ANCHOR 起，超出 LATEST 时整体提前"""
+    first = max(EARLIEST, min(INTERVAL_ANCHOR, LATEST - (count - 1) * step))
+    return tuple(sorted((first + k * step) % (24 * 60) for k in range(count)))
+
+
+def _meal_slots(count: int, offset: int, evening: bool) -> Tuple[int, ...]:
+    if count == 1:
+        meals = (MEALS[2],) if evening else (MEALS[0],)
+    elif count == 2:
+        meals = (MEALS[0], MEALS[2])
+    else:
+        meals = MEALS[:count]
+    return tuple(m + offset for m in meals)
+
+
+@lru_cache(maxsize=4096)
+def parse_usage(usage: str) -> DoseRule:
+    """解析服用时间/用法描述；无法识别的写法返回没有服药时刻的规则"""
+    text = _normalize(usage)
+    if not text:
+        return DoseRule()
+
+    course = _COURSE.search(text)
+    course_days = _first_number(course) if course else None
+    every = _EVERY_DAYS.search(text)
+    every_days = 1
+    if every:
+        every_days = 2 if every.group(1) is None else max(1, _first_number(every))
+
+    # 明确写出的时刻优先，如"8:00、20:00"
+    clocks = _CLOCK.findall(text)
+    if clocks:
+        minutes = sorted({(int(h) * 60 + int(m)) % (24 * 60) for h, m in clocks})
+        return DoseRule(tuple(minutes), every_days, course_days)
+
+    if _AS_NEEDED.search(text):
+        return DoseRule((), every_days, course_days, as_needed=True)
+
+    count = None
+    per_day = _PER_DAY.search(text)
+    latin = _LATIN.search(text)
+    if per_day:
+        count = _first_number(per_day)
+    elif latin:
+        count = LATIN_DAILY[latin.group(1)]
+
+    bedtime = bool(_BEDTIME.search(text))
+    if count is None:
+        per_hours = _PER_HOURS.search(text)
+        if per_hours:
+            hours = _first_number(per_hours)
+            if 0 < hours <= 24:
+                return DoseRule(_spread(24 // hours, hours * 60), every_days, course_days)
+        if bedtime:
+            return DoseRule((BEDTIME,), every_days, course_days)
+        if every:
+            count = 1
+        else:
+            return DoseRule((), every_days, course_days)
+
+    count = max(1, min(count, 24))
+    if _BEFORE_MEAL.search(text) and count <= 3:
+        slots = _meal_slots(count, -MEAL_OFFSET, bool(_EVENING.search(text)))
+    elif _AFTER_MEAL.search(text) and count <= 3:
+        slots = _meal_slots(count, MEAL_OFFSET, bool(_EVENING.search(text)))
+    elif count == 1 and _EVENING.search(text):
+        slots = (20 * 60,)
+    elif count in DAILY_SLOTS:
+        slots = DAILY_SLOTS[count]
+    else:
+        # 每日 5 次以上在 EARLIEST 到 LATEST 之间等间隔排列
+        slots = _spread(count, (LATEST - EARLIEST) // (count - 1))
+
+    if bedtime:
+        # 睡前替换最后一次（每日一次时即为睡前服用）
+        slots = slots[:-1] + (BEDTIME,)
+    return DoseRule(tuple(sorted(set(slots))), every_days, course_days)
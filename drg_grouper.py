@@ -0,0 +1,362 @@
+"""本地 DRG 分组
+
+按规则表（data/drg_rules.tsv）为病例确定 MDC 和 DRG，不依赖大模型，结果可复现、
+每一步都能说明依据：
+
+1. 主要诊断决定 MDC（有性别限制的 MDC 与患者性别不符时无法分组）；
+2. 有该 MDC 的手术操作时进入手术组，否则按主要诊断（及年龄）进入内科组；
+   手术操作属于其他 MDC 时进入歧义组（QY）；
+3. 次要诊断中的严重/一般并发症或合并症决定细分：1 伴严重、3 伴一般、5 不伴，
+   不细分的 ADRG 为 9。与主要诊断同一类目的次要诊断不计入。
+
+规则载入时把诊断范围编译成互不重叠的区间表（二分查找），手术操作编译成
+前缀字典，单个病例分组只需几次查找。regroup_records 按年批量重新分组
+medical_records，结果写入 drg_groupings。
+
+    python drg_grouper.py --year 2024         # 批量重新分组
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import icd_codes
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+RULES_PATH = os.path.join(DATA_DIR, 'drg_rules.tsv')
+
+# 无法分组时的 DRG 编码
+UNGROUPABLE = '0000'
+
+SEVERITY_TEXT = {
+    1: "，伴严重并发症或合并症",
+    3: "，伴一般并发症或合并症",
+    5: "，不伴并发症或合并症",
+    9: "",
+}
+CC_SEVERITY = {'MCC': 1, 'CC': 3}
+
+# 分组结果表，按病历ID覆盖写入
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS drg_groupings (
+        record_id INTEGER PRIMARY KEY,   -- 病历ID
+        grouped_at TEXT,                 -- 分组时间
+        rules_version TEXT,              -- 规则表摘要，规则更新后可据此重新分组
+        principal TEXT,                  -- 主要诊断编码
+        mdc TEXT,
+        adrg TEXT,
+        drg TEXT,
+        drg_name TEXT,
+        reason TEXT,                     -- 分组依据
+        FOREIGN KEY (record_id) REFERENCES medical_records (id)
+    )
+'''
+
+# 区间上界的哨兵字符，大于编码中的数字、字母和点，"J18~" 包含 J18 的所有亚目
+_END = '~'
+
+
+class Adrg(NamedTuple):
+    code: str
+    name: str
+    mdc: str
+    surgical: bool
+    min_age: Optional[int]
+    max_age: Optional[int]
+    split: bool                 # 是否按并发症细分
+
+    def accepts(self, age: Optional[int]) -> bool:
+        if age is None:
+            return self.min_age is None and self.max_age is None
+        return ((self.min_age is None or age >= self.min_age)
+                and (self.max_age is None or age <= self.max_age))
+
+
+class DrgResult(NamedTuple):
+    drg: str
+    name: str
+    mdc: str = ''
+    mdc_name: str = ''
+    adrg: str = ''
+    severity: Optional[int] = None
+    principal: str = ''
+    reason: str = ''
+
+    @property
+    def grouped(self) -> bool:
+        return self.drg != UNGROUPABLE
+
+
+def _parse_ranges(text: str) -> List[Tuple[str, str]]:
+    """"J09-J18,K92.0-K92.2,C50" -> 半开区间 [起, 止)"""
+    ranges = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        start = icd_codes.normalize_code(start)
+        end = icd_codes.normalize_code(end) if end else start
+        ranges.append((start, end + _END))
+    return ranges
+
+
+class _RangeTable:
+    """重叠的诊断范围编译成互不重叠的区间，每个区间按优先级列出命中的值"""
+
+    def __init__(self, rules: Iterable[Tuple[List[Tuple[str, str]], object]]):
+        rules = list(rules)
+        bounds = sorted({bound for ranges, _ in rules for start, end in ranges for bound in (start, end)})
+        self._bounds = bounds
+        self._values: List[tuple] = []
+        for i, start in enumerate(bounds):
+            end = bounds[i + 1] if i + 1 < len(bounds) else None
+            self._values.append(tuple(
+                value for ranges, value in rules
+                if any(lo <= start and end is not None and end <= hi for lo, hi in ranges)
+            ))
+
+    def lookup(self, code: str) -> tuple:
+        i = bisect_right(self._bounds, code) - 1
+        return self._values[i] if i >= 0 else ()
+
+
+class DrgRules:
+    """载入并编译规则表"""
+
+    def __init__(self, path: str = RULES_PATH):
+        self.path = path
+        self.mdc_names: Dict[str, str] = {}
+        self.mdc_gender: Dict[str, str] = {}
+        self.adrgs: Dict[str, Adrg] = {}
+        mdc_rules, medical_rules, cc_rules = [], [], []
+        self._surgical: Dict[str, List[Adrg]] = {}
+        self._fallback: Dict[str, Adrg] = {}
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.version = hashlib.sha1(content).hexdigest()[:12]
+        for number, line in enumerate(content.decode('utf-8').splitlines(), 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t') + [''] * 9
+            kind = fields[0]
+            if kind == 'MDC':
+                code, name, ranges, gender = fields[1:5]
+                self.mdc_names[code] = name
+                if gender:
+                    self.mdc_gender[code] = gender
+                mdc_rules.append((_parse_ranges(ranges), code))
+            elif kind == 'ADRG':
+                code, name, mdc, kind_code, ranges, min_age, max_age, no_split = fields[1:9]
+                adrg = Adrg(code, name, mdc, kind_code == 'O',
+                            int(min_age) if min_age else None, int(max_age) if max_age else None,
+                            no_split != '1')
+                self.adrgs[code] = adrg
+                if adrg.surgical:
+                    for prefix in ranges.split(','):
+                        self._surgical.setdefault(icd_codes.normalize_code(prefix), []).append(adrg)
+                elif ranges.strip() == '*':
+                    self._fallback[mdc] = adrg
+                else:
+                    medical_rules.append((_parse_ranges(ranges), adrg))
+            elif kind == 'CC':
+                cc_rules.append((_parse_ranges(fields[1]), fields[2]))
+            else:
+                raise ValueError(f"{path} 第 {number} 行: 未知的规则类型 {kind}")
+
+        self._mdc = _RangeTable(mdc_rules)
+        self._medical = _RangeTable(medical_rules)
+        self._cc = _RangeTable(cc_rules)
+
+    def mdc_of(self, code: str) -> Optional[str]:
+        found = self._mdc.lookup(code)
+        return found[0] if found else None
+
+    def surgical_adrgs(self, code: str) -> List[Adrg]:
+        """操作编码命中的手术 ADRG（最长前缀优先）"""
+        for length in range(len(code), 1, -1):
+            found = self._surgical.get(code[:length])
+            if found:
+                return found
+        return []
+
+    def cc_level(self, code: str) -> Optional[str]:
+        found = self._cc.lookup(code)
+        return found[0] if found else None
+
+    def group(self, principal: Optional[str], secondary: Sequence[str] = (),
+              procedures: Sequence[str] = (), age: Optional[int] = None,
+              gender: Optional[str] = None) -> DrgResult:
+        """按主要诊断、次要诊断、手术操作编码和年龄、性别分组"""
+        if not principal:
+            return DrgResult(UNGROUPABLE, "无法分组", reason="缺少有效的主要诊断编码")
+        principal = icd_codes.normalize_code(principal)
+        mdc = self.mdc_of(principal)
+        if mdc is None:
+            return DrgResult(UNGROUPABLE, "无法分组", principal=principal,
+                             reason=f"主要诊断 {principal} 不属于任何 MDC")
+        mdc_name = self.mdc_names[mdc]
+        required = self.mdc_gender.get(mdc)
+        if required and gender and gender != required:
+            return DrgResult(UNGROUPABLE, "无法分组", mdc, mdc_name, principal=principal,
+                             reason=f"主要诊断 {principal} 属于 {mdc}（限{required}性），与患者性别不符")
+        reasons = [f"主要诊断 {principal} → {mdc}"]
+
+        adrg = None
+        ambiguous = []
+        for procedure in procedures:
+            procedure = icd_codes.normalize_code(procedure)
+            candidates = self.surgical_adrgs(procedure)
+            if not candidates:
+                continue        # 不影响分组的操作（检查、治疗性操作等）
+            matched = [c for c in candidates if c.mdc == mdc and c.accepts(age)]
+            if matched:
+                if adrg is None:
+                    adrg = matched[0]
+                    reasons.append(f"手术操作 {procedure} → {adrg.code}")
+            else:
+                ambiguous.append(procedure)
+
+        if adrg is None and ambiguous:
+            letter = mdc[-1]
+            return DrgResult(f"{letter}QY", f"{mdc_name}歧义组", mdc, mdc_name, f"{letter}QY", None, principal,
+                             "；".join(reasons + [f"手术操作 {'、'.join(ambiguous)} 不属于 {mdc}"]))
+
+        if adrg is None:
+            adrg = next((c for c in self._medical.lookup(principal) if c.mdc == mdc and c.accepts(age)), None)
+            if adrg is None:
+                adrg = self._fallback.get(mdc)
+            if adrg is None:
+                return DrgResult(UNGROUPABLE, "无法分组", mdc, mdc_name, principal=principal,
+                                 reason="；".join(reasons + [f"{mdc} 中没有匹配的内科组"]))
+            reasons.append(f"内科组 {adrg.code}" + (f"（年龄 {age} 岁）" if adrg.min_age is not None
+                                                    or adrg.max_age is not None else ""))
+
+        severity = 9
+        if adrg.split:
+            severity = 5
+            category = principal.split('.')[0]
+            for code in secondary:
+                code = icd_codes.normalize_code(code)
+                if code.split('.')[0] == category:
+                    continue
+                level = self.cc_level(code)
+                if level and CC_SEVERITY[level] < severity:
+                    severity = CC_SEVERITY[level]
+                    reasons.append(f"次要诊断 {code} 为{'严重' if level == 'MCC' else '一般'}并发症或合并症")
+
+        return DrgResult(f"{adrg.code}{severity}", adrg.name + SEVERITY_TEXT[severity], mdc, mdc_name,
+                         adrg.code, severity, principal, "；".join(reasons))
+
+    def group_text(self, text: str, age: Optional[int] = None, gender: Optional[str] = None) -> DrgResult:
+        """按分析结果中通过校验的编码分组，第一个诊断编码为主要诊断
+
+        主要诊断编码未收录时无法分组，不能把其后的次要诊断当作主要诊断。
+        """
+        diagnoses, procedures = icd_codes.extract_codes(text)
+        first = icd_codes.principal_code(text)
+        if first is not None and icd_codes.tables()[icd_codes.ICD10].resolve(first)[1] is None:
+            return DrgResult(UNGROUPABLE, "无法分组", principal=first,
+                             reason=f"主要诊断编码 {first} 未收录于本地编码表，无法确定主要诊断")
+        return self.group(diagnoses[0].code if diagnoses else None,
+                          [code.code for code in diagnoses[1:]],
+                          [code.code for code in procedures], age, gender)
+
+
+@lru_cache(maxsize=None)
+def rules() -> DrgRules:
+    """共享的规则表（首次调用时载入）"""
+    return DrgRules()
+
+
+def report(result: DrgResult) -> str:
+    lines = [f"DRG分组：{result.drg} {result.name}"]
+    if result.mdc:
+        lines.append(f"MDC分组：{result.mdc} {result.mdc_name}")
+    lines.append(f"分组依据：{result.reason}")
+    return "\n".join(lines)
+
+
+def annotate(text: str, age: Optional[int] = None, gender: Optional[str] = None) -> str:
+    """在分析结果末尾追加本地规则分组；没有可用的诊断编码时原样返回"""
+    result = rules().group_text(text, age, gender)
+    if not result.principal:
+        return text
+    return f"{text.rstrip()}\n\n=== DRG分组（本地规则） ===\n{report(result)}\n"
+
+
+def _patient(patient_info: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    try:
+        info = json.loads(patient_info or '{}')
+    except ValueError:
+        return None, None
+    age = info.get('age')
+    # 界面中年龄未填写时为 0
+    return (int(age) if age else None), (info.get('gender') or None)
+
+
+def regroup_records(db_path: str, year: Optional[int] = None,
+                    progress: Optional[Callable[[float], None]] = None,
+                    batch_size: int = 2000) -> str:
+    """按规则表重新分组 medical_records（year 为空时全部），返回统计说明"""
+    table = rules()
+    db = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    try:
+        db.execute(SCHEMA)
+        where, params = '', []
+        if year:
+            where = 'WHERE timestamp >= ? AND timestamp < ?'
+            params = [f"{year}-01-01", f"{year + 1}-01-01"]
+        total = db.execute(f'SELECT COUNT(*) FROM medical_records {where}', params).fetchone()[0]
+        # 读写分开：读游标逐批取数，结果攒够一批再写入
+        cursor = db.execute(f'SELECT id, patient_info, diagnosis FROM medical_records {where} ORDER BY id', params)
+        grouped_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        done = ungrouped = 0
+        pending = []
+
+        def flush():
+            db.executemany('''
+                INSERT OR REPLACE INTO drg_groupings
+                (record_id, grouped_at, rules_version, principal, mdc, adrg, drg, drg_name, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', pending)
+            pending.clear()
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for record_id, patient_info, diagnosis in rows:
+                age, gender = _patient(patient_info)
+                result = table.group_text(diagnosis or '', age, gender)
+                if not result.grouped:
+                    ungrouped += 1
+                pending.append((record_id, grouped_at, table.version, result.principal, result.mdc,
+                                result.adrg, result.drg, result.name, result.reason))
+            done += len(rows)
+            flush()
+            if progress and total:
+                progress(done / total)
+        db.commit()
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    return f"共 {done} 份病历，可分组 {done - ungrouped} 份，无法分组 {ungrouped} 份，用时 {seconds:.1f} 秒"
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="按本地规则批量重新分组病历")
+    parser.add_argument('--db', default='medical.db')
+    parser.add_argument('--year', type=int, help="只分组该年的病历")
+    args = parser.parse_args()
+
+    print(regroup_records(args.db, args.year))
@@ -0,0 +1,205 @@
+"""本地药品目录与输入联想
+
+药品目录为 data/drug_catalog.tsv（通用名、别名、拼音首字母、规格、单位）。
+首次使用时把所有名称、别名和拼音首字母编译成按字节排序的键索引
+（data/drug_catalog.idx），之后通过 mmap 直接在索引文件上二分查找前缀，
+不把目录读入内存；目录文件更新后索引自动重建。
+
+    python drug_catalog.py 阿莫       # 查询联想结果
+    python drug_catalog.py --build    # 重新编译索引
+"""
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CATALOG_PATH = os.path.join(DATA_DIR, 'drug_catalog.tsv')
+
+# 索引文件：头部（魔数、目录文件的修改时间和大小、键数量）、
+# 每个键记录的偏移表，然后是按字节排序的键记录（键 + \0 + 目录行偏移）
+MAGIC = b'DRUGIDX1'
+HEADER = struct.Struct('<8sQQI')
+OFFSET = struct.Struct('<I')
+
+
+class DrugEntry(NamedTuple):
+    name: str
+    aliases: Tuple[str, ...]
+    specs: Tuple[str, ...]
+    units: Tuple[str, ...]
+
+
+def _split(field: str) -> Tuple[str, ...]:
+    return tuple(value.strip() for value in field.split(',') if value.strip())
+
+
+def _normalize(text: str) -> str:
+    return text.strip().lower()
+
+
+def _iter_lines(path: str) -> Iterator[Tuple[int, str]]:
+    """(行偏移, 行内容)，跳过注释和空行"""
+    with open(path, 'rb') as f:
+        offset = 0
+        for raw in f:
+            line = raw.decode('utf-8').rstrip('\r\n')
+            if line and not line.startswith('#'):
+                yield offset, line
+            offset += len(raw)
+
+
+def build_index(catalog_path: str = CATALOG_PATH, index_path: Optional[str] = None) -> str:
+    """编译键索引，写入临时文件后原子替换"""
+    index_path = index_path or os.path.splitext(catalog_path)[0] + '.idx'
+    keys = set()
+    for offset, line in _iter_lines(catalog_path):
+        fields = line.split('\t')
+        names = [fields[0]] + [value for field in fields[1:3] for value in _split(field)]
+        for name in names:
+            keys.add((_normalize(name).encode('utf-8'), offset))
+
+    records = []
+    offsets = []
+    position = 0
+    for key, offset in sorted(keys):
+        record = key + b'\0' + OFFSET.pack(offset)
+        offsets.append(position)
+        records.append(record)
+        position += len(record)
+
+    stat = os.stat(catalog_path)
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, stat.st_mtime_ns, stat.st_size, len(records)))
+        f.write(b''.join(OFFSET.pack(p) for p in offsets))
+        f.write(b''.join(records))
+    os.replace(temp_path, index_path)
+    return index_path
+
+
+class DrugCatalog:
+    """在 mmap 的索引上做前缀查找，条目按需从目录文件读取"""
+
+    def __init__(self, catalog_path: str = CATALOG_PATH, index_path: Optional[str] = None):
+        self.catalog_path = catalog_path
+        self.index_path = index_path or os.path.splitext(catalog_path)[0] + '.idx'
+        if not self._index_is_current():
+            try:
+                build_index(self.catalog_path, self.index_path)
+            except OSError:
+                # 程序目录不可写时索引放到临时目录
+                self.index_path = os.path.join(tempfile.gettempdir(), os.path.basename(self.index_path))
+                if not self._index_is_current():
+                    build_index(self.catalog_path, self.index_path)
+
+        with open(self.index_path, 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.catalog_path, 'rb') as f:
+            self._catalog = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, self._count = HEADER.unpack_from(self._index, 0)
+        self._records = HEADER.size + self._count * OFFSET.size
+        # 让 bisect 直接在索引上比较，无需把键读入列表
+        self._keys = _KeyView(self)
+
+    def _index_is_current(self) -> bool:
+        try:
+            stat = os.stat(self.catalog_path)
+            with open(self.index_path, 'rb') as f:
+                magic, mtime, size, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return magic == MAGIC and mtime == stat.st_mtime_ns and size == stat.st_size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _record(self, i: int) -> Tuple[bytes, int]:
+        start = self._records + OFFSET.unpack_from(self._index, HEADER.size + i * OFFSET.size)[0]
+        end = self._index.find(b'\0', start)
+        return self._index[start:end], OFFSET.unpack_from(self._index, end + 1)[0]
+
+    @lru_cache(maxsize=4096)
+    def entry(self, offset: int) -> DrugEntry:
+        end = self._catalog.find(b'\n', offset)
+        line = self._catalog[offset:end if end >= 0 else len(self._catalog)].decode('utf-8').rstrip('\r')
+        fields = (line.split('\t') + [''] * 5)[:5]
+        return DrugEntry(fields[0], _split(fields[1]), _split(fields[3]), _split(fields[4]))
+
+    def complete(self, text: str, limit: int = 20) -> List[DrugEntry]:
+        """名称、别名或拼音首字母以 text 开头的药品（完全匹配的排在前面）"""
+        prefix = _normalize(text).encode('utf-8')
+        if not prefix:
+            return []
+        exact, others, seen = [], [], set()
+        i = bisect_left(self._keys, prefix)
+        while i < self._count and len(exact) + len(others) < limit:
+            key, offset = self._record(i)
+            if not key.startswith(prefix):
+                break
+            if offset not in seen:
+                seen.add(offset)
+                (exact if key == prefix else others).append(self.entry(offset))
+            i += 1
+        return exact + others
+
+    def entries(self) -> Iterator[DrugEntry]:
+        """按目录顺序遍历全部药品"""
+        for offset, _ in _iter_lines(self.catalog_path):
+            yield self.entry(offset)
+
+    def get(self, name: str) -> Optional[DrugEntry]:
+        """按通用名或别名精确查找"""
+        key = _normalize(name).encode('utf-8')
+        i = bisect_left(self._keys, key)
+        if i < self._count:
+            found, offset = self._record(i)
+            if found == key:
+                return self.entry(offset)
+        return None
+
+    def close(self):
+        self._index.close()
+        self._catalog.close()
+
+
+class _KeyView:
+    """索引键的只读序列视图"""
+
+    def __init__(self, catalog: DrugCatalog):
+        self._catalog = catalog
+
+    def __len__(self) -> int:
+        return len(self._catalog)
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._catalog._record(i)[0]
+
+
+@lru_cache(maxsize=None)
+def catalog() -> DrugCatalog:
+    """共享的药品目录（首次调用时打开）"""
+    return DrugCatalog()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="药品目录查询")
+    parser.add_argument('prefix', nargs='?')
+    parser.add_argument('--build', action='store_true', help="重新编译索引")
+    args = parser.parse_args()
+
+    if args.build:
+        print(build_index())
+    if args.prefix:
+        started = time.perf_counter()
+        results = catalog().complete(args.prefix)
+        elapsed = (time.perf_counter() - started) * 1000
+        for drug in results:
+            print(f"{drug.name}\t{'、'.join(drug.aliases)}\t{'、'.join(drug.specs)}")
+        print(f"{len(results)} 条，{elapsed:.3f} ms")
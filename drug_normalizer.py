@@ -0,0 +1,177 @@
+"""药品名称归一化
+
+AI 输出的药名写法不一（"阿莫西林胶囊"、"阿莫西林(0.25g)"、"Amoxicillin"），
+这里去掉括号和规格后先与药品目录的通用名和别名完整比对，目录中的名称本身
+可能带剂型（红霉素软膏与红霉素是两种药），所以索引中的名称不去剂型；找不到
+时才去掉输入的剂型后缀再比对，此时保留输入的剂型（"布洛芬混悬液"与
+"布洛芬缓释胶囊"仍是两种制剂）。完全相同才归一化为通用名，去重、相互作用
+检查和处方药品都使用该名称。
+名称相近的药品可能是另一种药（头孢克洛/头孢克肟、氧氟沙星/左氧氟沙星），
+所以字符二元组（bigram）索引按 Dice 系数找到的相近通用名只作为提示，
+不替换原名。
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import drug_catalog
+
+# 相近药品提示的最低相似度（只用于提示，不会替换药名）
+MIN_CONFIDENCE = 0.6
+
+# 剂型后缀（长的在前，先匹配"缓释胶囊"再匹配"胶囊"）
+DOSAGE_FORMS = sorted([
+    '片', '胶囊', '颗粒', '颗粒剂', '丸', '滴丸', '散', '口服液', '口服溶液', '糖浆', '混悬液', '干混悬剂',
+    '注射液', '注射剂', '注射用', '粉针', '软膏', '乳膏', '凝胶', '滴眼液', '滴耳液', '滴鼻液', '喷雾剂',
+    '气雾剂', '吸入剂', '吸入粉雾剂', '栓', '贴', '贴剂', '缓释片', '控释片', '肠溶片', '分散片', '咀嚼片',
+    '泡腾片', '含片', '缓释胶囊', '肠溶胶囊', '软胶囊', '胶丸',
+    'tablets', 'tablet', 'tabs', 'capsules', 'capsule', 'caps', 'injection', 'syrup', 'suspension',
+    'granules', 'ointment', 'cream', 'solution', 'sustained release', 'extended release', 'er', 'sr',
+], key=len, reverse=True)
+
+_BRACKETS = re.compile(r'[\(\[（【][^\)\]）】]*[\)\]）】]')
+_STRENGTH = re.compile(r'\d+(?:\.\d+)?\s*(?:mg|g|μg|ug|mcg|ml|iu|u|万单位|单位|%)(?:\s*/\s*\S+)?', re.I)
+_FORM_SUFFIX = re.compile(r'(?:%s)$' % '|'.join(re.escape(form) for form in DOSAGE_FORMS))
+_SEPARATORS = re.compile(r'[\s·•,，、;；:：\-_/]+')
+
+
+class DrugMatch(NamedTuple):
+    name: str                       # 目录中的通用名（归一化结果）
+    drug: drug_catalog.DrugEntry
+    confidence: float               # 0~1，完全匹配通用名或别名时为 1
+    matched: str                    # 命中的通用名或别名
+    form: str = ''                  # 去掉后才匹配上的输入剂型，如"混悬液"
+
+    @property
+    def full_name(self) -> str:
+        """通用名加输入的剂型"""
+        if not self.form:
+            return self.name
+        return f"{self.name} {self.form}" if self.form.isascii() else self.name + self.form
+
+
+def _join(text: str) -> str:
+    # 中文名中的空格去掉，英文名保留单词间的一个空格
+    return re.sub(r'(?<=[^\x00-\x7f]) | (?=[^\x00-\x7f])', '', text)
+
+
+def full_name(text: str) -> str:
+    """去掉括号内容和规格，统一全半角与大小写，保留剂型"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _BRACKETS.sub(' ', text)
+    text = _STRENGTH.sub(' ', text)
+    return _join(_SEPARATORS.sub(' ', text).strip())
+
+
+def clean_name(text: str) -> str:
+    """在 full_name 的基础上再去掉剂型后缀"""
+    text = full_name(text)
+    # 后缀可能叠加，如"阿莫西林胶囊 0.25g"→"阿莫西林胶囊"→"阿莫西林"
+    while True:
+        stripped = _FORM_SUFFIX.sub('', text).strip()
+        if stripped == text or not stripped:
+            break
+        text = stripped
+    return text
+
+
+def _bigrams(text: str) -> Set[str]:
+    padded = f"^{text}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class DrugNormalizer:
+    """药品目录上的 bigram 倒排索引"""
+
+    def __init__(self, catalog: Optional[drug_catalog.DrugCatalog] = None):
+        catalog = catalog or drug_catalog.catalog()
+        self._drugs: List[drug_catalog.DrugEntry] = []
+        self._terms: List[str] = []           # full_name 后的通用名和别名
+        self._term_drug: List[int] = []       # 词 -> 药品下标
+        self._term_grams: List[int] = []      # 词的 bigram 数
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+
+        for drug in catalog.entries():
+            drug_id = len(self._drugs)
+            self._drugs.append(drug)
+            for name in (drug.name,) + drug.aliases:
+                term = full_name(name)
+                if not term:
+                    continue
+                if term in self._exact:
+                    other = self._drugs[self._term_drug[self._exact[term]]]
+                    if other is not drug:
+                        print(f"药品目录中的名称 {name} 同时属于 {other.name} 和 {drug.name}，按 {other.name} 处理")
+                    continue
+                term_id = len(self._terms)
+                self._terms.append(term)
+                self._term_drug.append(drug_id)
+                self._exact[term] = term_id
+                grams = _bigrams(term)
+                self._term_grams.append(len(grams))
+                for gram in grams:
+                    self._postings[gram].append(term_id)
+        self._postings = dict(self._postings)
+        self.match = lru_cache(maxsize=8192)(self._match)
+
+    def _result(self, term_id: int, confidence: float, form: str = '') -> DrugMatch:
+        drug = self._drugs[self._term_drug[term_id]]
+        return DrugMatch(drug.name, drug, round(confidence, 3), self._terms[term_id], form)
+
+    def _match(self, text: str) -> Optional[DrugMatch]:
+        """最相近的目录药品；完全没有相同 bigram 时返回 None"""
+        # 先按完整名称（含剂型）比对，再去掉输入的剂型后缀比对
+        full, query = full_name(text), clean_name(text)
+        term_id = self._exact.get(full)
+        if term_id is not None:
+            return self._result(term_id, 1.0)
+        term_id = self._exact.get(query)
+        if term_id is not None:
+            return self._result(term_id, 1.0, full[len(query):].strip())
+        if not query:
+            return None
+
+        grams = _bigrams(query)
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for term_id in self._postings.get(gram, ()):
+                counts[term_id] += 1
+        if not counts:
+            return None
+        # Dice 系数：2 × 相同 bigram 数 / 两者 bigram 数之和
+        best, score = max(
+            ((term_id, 2 * common / (len(grams) + self._term_grams[term_id])) for term_id, common in counts.items()),
+            key=lambda item: (item[1], -item[0])
+        )
+        return self._result(best, score)
+
+    def exact(self, text: str) -> Optional[DrugMatch]:
+        """去掉括号和规格（目录中没有时再去掉剂型）后与通用名或别名完全相同时的匹配"""
+        match = self.match(text)
+        return match if match and match.confidence == 1.0 else None
+
+    def canonical(self, text: str) -> str:
+        """完全匹配时返回通用名（输入带剂型时保留剂型），否则返回原文（去掉首尾空白）"""
+        match = self.exact(text)
+        return match.full_name if match else (text or '').strip()
+
+    def dedupe_key(self, text: str) -> str:
+        """去重用的键：完全匹配的用通用名（含输入的剂型），否则用去掉括号和规格的名称"""
+        match = self.exact(text)
+        return match.full_name if match else full_name(text)
+
+    def suggest(self, text: str, min_confidence: float = MIN_CONFIDENCE) -> Optional[DrugMatch]:
+        """不能完全匹配时目录中最相近的药品，仅供提示"""
+        match = self.match(text)
+        if match and min_confidence <= match.confidence < 1.0:
+            return match
+        return None
+
+
+@lru_cache(maxsize=None)
+def normalizer() -> DrugNormalizer:
+    """共享的归一化索引（首次调用时从药品目录构建）"""
+    return DrugNormalizer()
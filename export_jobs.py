@@ -0,0 +1,144 @@
+import itertools
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtWidgets import QHBoxLayout, QLabel, QProgressBar, QPushButton, QWidget
+
+
+class ExportCancelled(Exception):
+    """导出任务被用户取消"""
+
+
+class ExportJob:
+    """一次导出任务：先写入同目录下的临时文件，成功后原子替换为目标文件"""
+
+    def __init__(self, job_id: int, title: str, file_name: str,
+                 writer: Callable, args: tuple, atomic: bool = True):
+        self.id = job_id
+        self.title = title
+        self.file_name = file_name
+        self.writer = writer
+        self.args = args
+        self.atomic = atomic
+        self.fraction = 0.0
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+class ExportJobManager(QObject):
+    """在线程池中执行导出，进度和结果通过信号投递回界面线程"""
+
+    progress = pyqtSignal(int, float)     # 任务ID, 0~1 进度
+    finished = pyqtSignal(int, str, str)  # 任务ID, 目标文件, 写入函数返回的说明
+    failed = pyqtSignal(int, str)         # 任务ID, 错误信息
+    cancelled = pyqtSignal(int)           # 任务ID
+
+    def __init__(self, max_workers: int = 3, parent=None):
+        super().__init__(parent)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._ids = itertools.count(1)
+        self.jobs: Dict[int, ExportJob] = {}
+
+    def submit(self, title: str, file_name: str, writer: Callable, *args,
+               atomic: bool = True) -> ExportJob:
+        """writer(临时文件名, *args, progress) 负责生成文件
+
+        atomic 为 False 时（如输出到目录）直接把 file_name 传给 writer，
+        由 writer 自行保证每个文件的完整性。
+        """
+        job = ExportJob(next(self._ids), title, file_name, writer, args, atomic)
+        self.jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job_id: int):
+        job = self.jobs.get(job_id)
+        if job:
+            job.cancel()
+
+    def shutdown(self):
+        """取消所有任务并等待工作线程结束"""
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job: ExportJob):
+        temp_name = None
+        if job.atomic:
+            directory = os.path.dirname(os.path.abspath(job.file_name))
+            base, ext = os.path.splitext(os.path.basename(job.file_name))
+            # 临时文件保留扩展名，写入函数按扩展名选择格式
+            fd, temp_name = tempfile.mkstemp(prefix=f".{base}.", suffix=ext, dir=directory)
+            os.close(fd)
+
+        def report(fraction: float):
+            if job.cancelled:
+                raise ExportCancelled()
+            # 进度变化不足 1% 时不发送，避免信号过多
+            if fraction - job.fraction >= 0.01 or fraction >= 1.0:
+                job.fraction = fraction
+                self.progress.emit(job.id, fraction)
+
+        try:
+            report(0.0)
+            result = job.writer(temp_name or job.file_name, *job.args, progress=report)
+            report(1.0)
+            if temp_name:
+                os.replace(temp_name, job.file_name)
+        except ExportCancelled:
+            self._remove(temp_name)
+            self.cancelled.emit(job.id)
+        except Exception as e:
+            self._remove(temp_name)
+            self.failed.emit(job.id, str(e))
+        else:
+            self.finished.emit(job.id, job.file_name, result if isinstance(result, str) else '')
+        finally:
+            self.jobs.pop(job.id, None)
+
+    @staticmethod
+    def _remove(path: Optional[str]):
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ExportJobWidget(QWidget):
+    """状态栏中的单个导出任务：名称、进度条和取消按钮"""
+
+    def __init__(self, job: ExportJob, manager: ExportJobManager, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.label = QLabel(job.title)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(120)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(lambda: self.cancel(job, manager))
+
+        layout.addWidget(self.label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_btn)
+
+    def cancel(self, job: ExportJob, manager: ExportJobManager):
+        manager.cancel(job.id)
+        self.cancel_btn.setEnabled(False)
+        self.label.setText(f"{job.title}（正在取消）")
+
+    def set_progress(self, fraction: float):
+        self.progress_bar.setValue(int(fraction * 100))
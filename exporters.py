@@ -0,0 +1,342 @@
+"""各类导出的文件生成函数
+
+这里的函数不依赖 Qt，也不读取界面控件，所需数据由调用方在界面线程中
+准备好后传入，因此可以在后台线程中执行。progress 回调接收 0~1 的进度，
+导出任务被取消时该回调会抛出异常以中止写入。
+"""
+import csv
+import functools
+import os
+import platform
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+Progress = Optional[Callable[[float], None]]
+
+
+def _report(progress: Progress, fraction: float):
+    if progress:
+        progress(fraction)
+
+
+def export_medical_record(file_name: str, record: Dict[str, Any], progress: Progress = None):
+    """导出病历记录，record 包含 age/gender/height/weight/symptoms/diagnosis"""
+    created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    if file_name.endswith('.txt'):
+        content = f"""病历记录
+
+时间: {created}
+
+患者信息:
+- 年龄: {record['age']}岁
+- 性别: {record['gender']}
+- 身高: {record['height']}cm
+- 体重: {record['weight']}kg
+
+症状描述:
+{record['symptoms']}
+
+诊断结果:
+{record['diagnosis']}
+"""
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    elif file_name.endswith('.docx'):
+        from docx import Document
+        doc = Document()
+        _report(progress, 0.3)
+
+        # 添加标题
+        doc.add_heading('病历记录', 0)
+
+        # 添加时间
+        doc.add_paragraph(f"时间: {created}")
+
+        # 添加患者信息
+        doc.add_heading('患者信息', level=1)
+        info = doc.add_paragraph()
+        info.add_run(f"年龄: {record['age']}岁\n")
+        info.add_run(f"性别: {record['gender']}\n")
+        info.add_run(f"身高: {record['height']}cm\n")
+        info.add_run(f"体重: {record['weight']}kg")
+
+        # 添加症状描述
+        doc.add_heading('症状描述', level=1)
+        doc.add_paragraph(record['symptoms'])
+
+        # 添加诊断结果
+        doc.add_heading('诊断结果', level=1)
+        doc.add_paragraph(record['diagnosis'])
+        _report(progress, 0.7)
+
+        doc.save(file_name)
+
+    else:
+        raise ValueError("病历仅支持导出为 Word 文档或文本文件")
+
+
+# 各系统的中文字体候选（字体名, 路径），按顺序尝试
+FONT_CANDIDATES = {
+    'Darwin': [
+        ("PingFang", "/System/Library/Fonts/PingFang.ttc"),
+        ("STHeiti", "/System/Library/Fonts/STHeiti Light.ttc")
+    ],
+    'Windows': [
+        ("SimSun", "C:\\Windows\\Fonts\\simsun.ttc"),
+        ("MicrosoftYaHei", "C:\\Windows\\Fonts\\msyh.ttc")
+    ],
+    'Linux': [
+        ("NotoSansCJK", "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc"),
+        ("WenQuanYiMicroHei", "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc")
+    ]
+}
+
+# 处方笺版式（A4，单位为点）
+PRESCRIPTION_TEMPLATE = 'prescription_template'
+ITEMS_TOP = 495          # 第一行药品的位置
+ITEM_HEIGHT = 40         # 每种药品占两行：名称规格用量 + 用药说明
+ITEMS_PER_PAGE = 8       # 药品区到页脚之间可容纳的药品数
+DIAGNOSIS_LINES = 5      # 诊断区最多显示的行数
+
+
+@functools.lru_cache(maxsize=None)
+def register_font(font_name: str, font_path: str) -> bool:
+    """注册 TrueType 字体，每个进程每种字体只解析一次"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if not os.path.exists(font_path):
+        return False
+    try:
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+        return True
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def prescription_font() -> str:
+    """返回处方使用的中文字体名称，首次调用时注册，找不到中文字体时使用 Helvetica"""
+    for font_name, font_path in FONT_CANDIDATES.get(platform.system(), []):
+        if register_font(font_name, font_path):
+            return font_name
+    return "Helvetica"
+
+
+def prescription_pages(prescription_data: list) -> int:
+    """处方占用的页数（药品超过一页容量时续页）"""
+    items = sum(1 for item in prescription_data if item[19])
+    return max(1, -(-items // ITEMS_PER_PAGE))
+
+
+def _prescription_template(c, font_name: str):
+    """处方笺中不随内容变化的部分：边框、标题、栏目名称、分隔线和页脚"""
+    c.beginForm(PRESCRIPTION_TEMPLATE)
+    c.rect(40, 40, 515, 762)
+
+    c.setFont(font_name, 16)
+    c.drawCentredString(297, 775, "处方笺")
+
+    c.setFont(font_name, 12)
+    c.drawString(60, 745, "处方编号:")
+    c.drawString(320, 745, "开具日期:")
+    c.drawString(60, 720, "医疗机构:")
+    c.drawString(320, 720, "科室:")
+    c.line(40, 705, 555, 705)
+
+    c.drawString(60, 685, "姓名:")
+    c.drawString(220, 685, "性别:")
+    c.drawString(340, 685, "年龄:")
+    c.drawString(440, 685, "体重:")
+    c.drawString(60, 660, "医保类型:")
+    c.line(40, 645, 555, 645)
+
+    c.drawString(60, 625, "诊断:")
+    c.line(40, 535, 555, 535)
+
+    # 药品表头
+    c.drawString(60, 515, "药品名称")
+    c.drawString(240, 515, "规格")
+    c.drawString(340, 515, "用法用量")
+    c.drawString(480, 515, "数量")
+    c.line(40, 507, 555, 507)
+
+    # 页脚
+    c.line(40, 180, 555, 180)
+    c.drawString(60, 160, "医师:")
+    c.drawString(240, 160, "职称:")
+    c.drawString(60, 130, "医师签名: _____________    日期: _____________")
+    c.drawString(60, 105, "注意事项:")
+    c.drawString(80, 88, "1. 请按医嘱用药，不得擅自加减药量或停药")
+    c.drawString(80, 72, "2. 如有不适，请及时就医")
+    c.drawString(80, 56, "3. 本处方仅限本次使用")
+    c.endForm()
+
+
+def draw_prescription(c, font_name: str, prescription_data: list, page_number: Optional[int] = None):
+    """绘制一张处方笺（药品较多时续页），返回使用的页数
+
+    静态部分只在每个文档中绘制一次，保存为 form XObject 后每页直接引用，
+    每页只需绘制变化的字段。page_number 不为空时从该页码起在页脚标注页码。
+    """
+    if not c.hasForm(PRESCRIPTION_TEMPLATE):
+        _prescription_template(c, font_name)
+
+    basic_info = prescription_data[0]
+    items = [item for item in prescription_data if item[19]]  # 有药品信息的行
+    diagnosis_lines = (basic_info[11] or '').split('\n')
+    if len(diagnosis_lines) > DIAGNOSIS_LINES:
+        diagnosis_lines = diagnosis_lines[:DIAGNOSIS_LINES - 1] + ['……（见病历）']
+    pages = prescription_pages(prescription_data)
+
+    for page in range(pages):
+        if page:
+            c.showPage()
+        c.doForm(PRESCRIPTION_TEMPLATE)
+        c.setFont(font_name, 12)
+
+        # 基本信息
+        c.drawString(120, 745, f"{basic_info[1]}")
+        c.drawString(380, 745, f"{basic_info[4]}")
+        c.drawString(120, 720, f"{basic_info[14]}")
+        c.drawString(355, 720, f"{basic_info[15]}")
+
+        # 患者信息
+        c.drawString(95, 685, f"{basic_info[6]}")
+        c.drawString(255, 685, f"{basic_info[7]}")
+        c.drawString(375, 685, f"{basic_info[8]}岁")
+        c.drawString(475, 685, f"{basic_info[9]}kg")
+        c.drawString(120, 660, f"{basic_info[10]}")
+
+        # 诊断信息
+        y = 625
+        for line in diagnosis_lines:
+            c.drawString(100, y, line)
+            y -= 18
+
+        # 药品列表
+        y = ITEMS_TOP
+        for item in items[page * ITEMS_PER_PAGE:(page + 1) * ITEMS_PER_PAGE]:
+            c.drawString(60, y, item[20])  # 药品名称
+            c.drawString(240, y, item[21])  # 规格
+            c.drawString(340, y, f"{item[22]} {item[23]}")  # 用法用量和频次
+            c.drawString(480, y, f"{item[24]}{item[25]}")  # 数量和单位
+            if item[27]:  # 如果有用药说明
+                c.drawString(80, y - 18, f"说明: {item[27]}")
+            y -= ITEM_HEIGHT
+        if page < pages - 1:
+            c.drawRightString(540, 190, "（续下页）")
+
+        # 医师信息
+        c.drawString(95, 160, f"{basic_info[12]}")
+        c.drawString(275, 160, f"{basic_info[13]}")
+
+        if page_number is not None:
+            c.setFont(font_name, 9)
+            c.drawCentredString(297, 25, f"第 {page_number + page} 页")
+    return pages
+
+
+def export_prescription_pdf(file_name: str, prescription_data: list, progress: Progress = None):
+    """导出处方为PDF"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    font_name = prescription_font()
+    _report(progress, 0.3)
+
+    c = canvas.Canvas(file_name, pagesize=A4)
+    draw_prescription(c, font_name, prescription_data)
+    _report(progress, 0.8)
+    c.save()
+
+
+def export_prescription_docx(file_name: str, prescription_data: list, progress: Progress = None):
+    """导出处方为Word文档"""
+    from docx import Document
+
+    doc = Document()
+    _report(progress, 0.3)
+    doc.add_heading('处方', 0)
+
+    # 添加基本信息
+    basic_info = prescription_data[0]
+    doc.add_paragraph(f"处方编号: {basic_info[1]}")
+    doc.add_paragraph(f"开具日期: {basic_info[4]}")
+    doc.add_paragraph(f"患者姓名: {basic_info[6]}")
+
+    # 添加药品信息
+    doc.add_heading('药品信息', level=1)
+    for item in prescription_data:
+        if item[19]:  # 如果有药品信息
+            doc.add_paragraph(f"{item[20]} {item[21]} {item[22]}")
+    _report(progress, 0.7)
+
+    doc.save(file_name)
+
+
+def export_prescription(file_name: str, prescription_data: list, progress: Progress = None):
+    """按扩展名导出处方"""
+    if file_name.endswith('.pdf'):
+        export_prescription_pdf(file_name, prescription_data, progress)
+    else:
+        export_prescription_docx(file_name, prescription_data, progress)
+
+
+def export_medication_reminders(file_name: str, medications: List[Dict[str, str]],
+                                progress: Progress = None):
+    """导出用药提醒，medications 每项包含 name/dosage/time/notes，
+    可选 id、start_date（默认今天）和 days（服用天数，默认 30 天）"""
+    columns = ['name', 'dosage', 'time', 'notes']
+    if file_name.endswith('.xlsx'):
+        import pandas as pd
+        _report(progress, 0.3)
+        df = pd.DataFrame(medications, columns=columns)
+        df.to_excel(file_name, index=False)
+
+    elif file_name.endswith('.csv'):
+        with open(file_name, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(medications)
+
+    elif file_name.endswith('.ics'):
+        # 每个方案一个重复事件，逐个写入
+        from ical_export import export_calendar
+        export_calendar(file_name, medications, progress)
+
+
+def export_schedule(file_name: str, medications: List[Dict[str, Any]], start_date: str, days: int,
+                    progress: Progress = None):
+    """导出 start_date 起 days 天的用药时间表
+
+    服药时间由 medication_schedule 按时间顺序逐条生成并直接写入文件，
+    XLSX 使用 openpyxl 的只写模式，不在内存中保留整张表。
+    """
+    from medication_schedule import count_doses, iter_schedule
+
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    total = count_doses(medications, start, days) or 1
+    header = ['日期', '时间', '药品', '用量', '注意事项']
+
+    def rows():
+        for index, (when, name, dosage, notes) in enumerate(iter_schedule(medications, start, days), 1):
+            yield [when.strftime('%Y-%m-%d'), when.strftime('%H:%M'), name, dosage, notes]
+            if index % 500 == 0:
+                _report(progress, 0.95 * index / total)
+
+    if file_name.endswith('.xlsx'):
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('用药时间表')
+        ws.append(header)
+        for row in rows():
+            ws.append(row)
+        wb.save(file_name)
+    else:
+        with open(file_name, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows())
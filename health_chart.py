@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import matplotlib.dates as mdates
+from matplotlib.ticker import MaxNLocator
+
+
+class HealthChartController:
+    """健康趋势图表控制器
+
+    坐标轴的标题、标签、图例、日期格式和网格只创建一次，之后只通过
+    Line2D.set_data 原地更新数据。追加数据点时如果坐标范围不变则使用
+    blit 局部刷新，只有坐标范围变化时才整体重绘。
+    """
+
+    def __init__(self, figure, canvas, blit: bool = True):
+        self.figure = figure
+        self.canvas = canvas
+        self.blit = blit and getattr(canvas, 'supports_blit', False)
+        self.ax = figure.add_subplot(111)
+
+        # 数据（matplotlib 日期数值）
+        self.xdata: List[float] = []
+        self.ydata: List[float] = []
+        self.trend_type = None
+        self._background = None
+
+        # 只创建一次的坐标轴元素
+        self.line, = self.ax.plot([], [], marker='o', linestyle='-', color='b',
+                                  animated=self.blit)
+        self.legend = self.ax.legend([self.line], [''], loc='upper left')
+        self.empty_text = self.ax.text(0.5, 0.5, '暂无数据',
+                                       horizontalalignment='center',
+                                       verticalalignment='center',
+                                       transform=self.ax.transAxes)
+        self.ax.set_xlabel('日期')
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        self.ax.yaxis.set_major_locator(MaxNLocator(10))
+        self.ax.tick_params(axis='x', labelrotation=30)
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        self.figure.subplots_adjust(bottom=0.2)
+
+        if self.blit:
+            self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def set_series(self, trend_type: str, dates: List[datetime], values: List[float]):
+        """替换整条曲线数据"""
+        self.xdata = [mdates.date2num(d) for d in dates]
+        self.ydata = list(values)
+        self.line.set_data(self.xdata, self.ydata)
+
+        changed = self._set_trend_type(trend_type)
+        changed |= self._set_empty(not self.xdata)
+        changed |= self._update_limits()
+
+        if changed:
+            self.canvas.draw_idle()
+        else:
+            self._blit_line()
+
+    def append(self, date: datetime, value: float):
+        """追加一个数据点，坐标范围不变时只局部刷新"""
+        self.xdata.append(mdates.date2num(date))
+        self.ydata.append(value)
+        self.line.set_data(self.xdata, self.ydata)
+
+        changed = self._set_empty(False)
+        if not self._contains(self.xdata[-1], value):
+            changed |= self._update_limits()
+
+        if changed:
+            self.canvas.draw_idle()
+        else:
+            self._blit_line()
+
+    def _set_trend_type(self, trend_type: str) -> bool:
+        """更新标题、纵轴标签和图例文字，返回是否发生变化"""
+        if trend_type == self.trend_type:
+            return False
+        self.trend_type = trend_type
+        self.ax.set_title(f'{trend_type}趋势图')
+        self.ax.set_ylabel(trend_type)
+        self.line.set_label(trend_type)
+        self.legend.get_texts()[0].set_text(trend_type)
+        return True
+
+    def _set_empty(self, empty: bool) -> bool:
+        """切换“暂无数据”提示，返回是否发生变化"""
+        if self.empty_text.get_visible() == empty:
+            return False
+        self.empty_text.set_visible(empty)
+        self.line.set_visible(not empty)
+        self.legend.set_visible(not empty)
+        return True
+
+    def _compute_limits(self) -> Optional[Tuple[Tuple[float, float], Tuple[float, float]]]:
+        """计算坐标范围：横轴按整天对齐，纵轴上下各留 10% 余量"""
+        if not self.xdata:
+            return None
+        day_start = mdates.num2date(min(self.xdata)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        day_end = mdates.num2date(max(self.xdata)).replace(
+            hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        ymin, ymax = min(self.ydata), max(self.ydata)
+        pad = (ymax - ymin) * 0.1 or max(abs(ymax) * 0.05, 1.0)
+        return ((mdates.date2num(day_start), mdates.date2num(day_end)),
+                (ymin - pad, ymax + pad))
+
+    def _update_limits(self) -> bool:
+        """只在坐标范围变化时更新，返回是否发生变化"""
+        limits = self._compute_limits()
+        if limits is None:
+            return False
+        xlim, ylim = limits
+        if self.ax.get_xlim() == xlim and self.ax.get_ylim() == ylim:
+            return False
+        self.ax.set_xlim(*xlim)
+        self.ax.set_ylim(*ylim)
+        return True
+
+    def _contains(self, x: float, y: float) -> bool:
+        """判断数据点是否落在当前坐标范围内"""
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        return x0 <= x <= x1 and y0 <= y <= y1
+
+    def _on_draw(self, event):
+        """整体重绘后缓存背景，并补画动态曲线"""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        if self.line.get_visible():
+            self.ax.draw_artist(self.line)
+
+    def _blit_line(self):
+        """恢复缓存背景后只重画曲线"""
+        if not self.blit or self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        if self.line.get_visible():
+            self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+
+def export_trend_chart(file_name: str, trend_type: str, dates: List[datetime],
+                       values: List[float], dpi: int = 200, progress=None):
+    """使用 matplotlib 导出出版质量的趋势图（PNG/PDF/SVG），不经过 Qt 后端"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8, 5))
+    canvas = FigureCanvasAgg(figure)
+    chart = HealthChartController(figure, canvas, blit=False)
+    chart.set_series(trend_type, dates, values)
+    if progress:
+        progress(0.5)
+    figure.savefig(file_name, dpi=dpi)
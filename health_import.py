@@ -0,0 +1,326 @@
+import csv
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 各类型数据的合理取值范围，超出范围视为无效数据
+TREND_LIMITS = {
+    '体重': (1.0, 500.0),
+    '血压': (30.0, 300.0),
+    '血糖': (0.5, 50.0),
+    '体温': (30.0, 45.0)
+}
+
+# 时间列的常见列名
+TIMESTAMP_COLUMNS = (
+    'timestamp', 'datetime', 'date_time', 'measured_at', 'time', 'date',
+    '测量时间', '时间', '日期'
+)
+
+# 设备导出文件的列名 -> (趋势类型, 换算系数)
+VALUE_COLUMNS = {
+    # 血糖仪
+    'glucose': ('血糖', 1.0),
+    'glucose_mmol': ('血糖', 1.0),
+    'glucose (mmol/l)': ('血糖', 1.0),
+    'glucose_mg_dl': ('血糖', 1 / 18.0),
+    'glucose (mg/dl)': ('血糖', 1 / 18.0),
+    'bg': ('血糖', 1.0),
+    '血糖': ('血糖', 1.0),
+    # 血压计（health_trends 每条只存一个数值，血压按收缩压记录）
+    'systolic': ('血压', 1.0),
+    'sys': ('血压', 1.0),
+    'sbp': ('血压', 1.0),
+    '收缩压': ('血压', 1.0),
+    '血压': ('血压', 1.0),
+    # 体重秤
+    'weight': ('体重', 1.0),
+    'weight_kg': ('体重', 1.0),
+    'weight (kg)': ('体重', 1.0),
+    'weight_lb': ('体重', 0.45359237),
+    'weight (lb)': ('体重', 0.45359237),
+    '体重': ('体重', 1.0),
+    # 体温计
+    'temperature': ('体温', 1.0),
+    'temp': ('体温', 1.0),
+    'temperature (°c)': ('体温', 1.0),
+    '体温': ('体温', 1.0)
+}
+
+# 长表格式（每行一条记录）的列名
+TYPE_COLUMNS = ('type', 'metric', '类型')
+VALUE_COLUMNS_LONG = ('value', '数值')
+
+# 长表格式中类型的英文写法（小写）
+TYPE_ALIASES = {
+    'glucose': '血糖', 'blood_glucose': '血糖', 'blood glucose': '血糖', 'bg': '血糖',
+    'blood_pressure': '血压', 'blood pressure': '血压', 'bp': '血压', 'systolic': '血压', 'sbp': '血压',
+    'weight': '体重', 'body_weight': '体重', 'body weight': '体重',
+    'temperature': '体温', 'body_temperature': '体温', 'body temperature': '体温', 'temp': '体温',
+}
+
+TIMESTAMP_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y'
+)
+
+# 纯数字的紧凑日期时间（按位数），先于时间戳尝试
+COMPACT_FORMATS = {8: '%Y%m%d', 14: '%Y%m%d%H%M%S'}
+
+
+def parse_timestamp(value: Any) -> Optional[str]:
+    """把设备导出的时间统一为 '%Y-%m-%d %H:%M:%S'（本地时间）"""
+    if value is None or value == '':
+        return None
+    # JSON 中的日期可能是数字，如 "date": 20240131
+    compact = str(value) if isinstance(value, int) else value
+    if isinstance(compact, str) and len(compact.strip()) in COMPACT_FORMATS and compact.strip().isdigit():
+        # 20240131、20240131083000 是日期而不是时间戳（这两种位数的时间戳都不是合理时间）
+        text = compact.strip()
+        try:
+            return datetime.strptime(text, COMPACT_FORMATS[len(text)]).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.strip().isdigit()):
+        seconds = float(value)
+        if seconds > 1e11:  # 毫秒时间戳
+            seconds /= 1000
+        return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+    text = str(value).strip()
+    if len(text) >= 10 and text[4] == '/':
+        # 2024/01/31 这类格式转换为 ISO 格式，走 fromisoformat 快速路径
+        text = text.replace('/', '-')
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        parsed = None
+        for fmt in TIMESTAMP_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        if parsed is None:
+            return None
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_json_array(f, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """逐个解析顶层 JSON 数组中的元素，不把整个文件读入内存"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # 跳过空白和元素之间的逗号
+        separators = ' \t\r\n,' if started else ' \t\r\n'
+        while pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+
+        item = None
+        need_more = pos == len(buffer)
+        if not need_more:
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("JSON 文件必须是数组或按行分隔的对象")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # 元素恰好在缓冲区末尾结束时（如数字）可能被截断，需再读一段确认
+                need_more = end == len(buffer) and not eof
+            except ValueError:
+                if eof:
+                    raise
+                need_more = True
+
+        if need_more:
+            if eof:
+                return
+            data = f.read(chunk_size)
+            eof = not data
+            buffer = buffer[pos:] + data
+            pos = 0
+            continue
+
+        yield item
+        pos = end
+
+
+class _Prepend:
+    """把已经读出的字符放回文件流前面"""
+
+    def __init__(self, prefix: str, f):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size: int) -> str:
+        if self.prefix:
+            data, self.prefix = self.prefix, ''
+            return data + self.f.read(max(size - len(data), 0))
+        return self.f.read(size)
+
+
+def iter_rows(f, file_name: str) -> Iterator[Dict[str, Any]]:
+    """按文件类型流式读取 CSV / JSON 数组 / 按行分隔的 JSON"""
+    if file_name.lower().endswith('.csv'):
+        yield from csv.DictReader(f)
+        return
+
+    # 通过第一个非空白字符区分 JSON 数组和按行分隔的 JSON
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    if first == '[':
+        yield from iter_json_array(_Prepend(first, f))
+    elif first:
+        yield json.loads(first + f.readline())
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def row_readings(row: Dict[str, Any]) -> List[Tuple[str, str, float]]:
+    """把一行设备数据转换为 (时间, 类型, 数值) 记录，无效数据抛出 ValueError"""
+    fields = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+
+    timestamp = None
+    for column in TIMESTAMP_COLUMNS:
+        if fields.get(column) not in (None, ''):
+            timestamp = parse_timestamp(fields[column])
+            break
+    if timestamp is None:
+        raise ValueError("缺少有效时间")
+
+    readings = []
+    trend_type = next((fields[c] for c in TYPE_COLUMNS if fields.get(c)), None)
+    if trend_type is not None:
+        value = next((fields[c] for c in VALUE_COLUMNS_LONG if fields.get(c) not in (None, '')), None)
+        trend_type = str(trend_type).strip()
+        readings.append((timestamp, TYPE_ALIASES.get(trend_type.lower(), trend_type), value, 1.0))
+    else:
+        for column, value in fields.items():
+            if column in VALUE_COLUMNS and value not in (None, ''):
+                trend_type, factor = VALUE_COLUMNS[column]
+                readings.append((timestamp, trend_type, value, factor))
+
+    if not readings:
+        raise ValueError("未识别的数据列")
+
+    result = []
+    for timestamp, trend_type, value, factor in readings:
+        if trend_type not in TREND_LIMITS:
+            raise ValueError(f"未知的数据类型: {trend_type}")
+        value = round(float(value) * factor, 2)
+        low, high = TREND_LIMITS[trend_type]
+        if not low <= value <= high:
+            raise ValueError(f"{trend_type}数值超出范围: {value}")
+        result.append((timestamp, trend_type, value))
+    return result
+
+
+class HealthDataImporter:
+    """设备导出数据批量导入
+
+    流式读取 CSV/JSON，每块数据先校验、块内去重，再与数据库中相同时间段的
+    已有记录去重，最后用 executemany 写入。每块一个事务，不长时间锁住数据库；
+    中途失败或取消时已写入的块保留，重新导入同一文件时会作为重复记录跳过。
+    """
+
+    def __init__(self, db, chunk_size: int = 5000):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def run(self, file_name: str,
+            progress: Optional[Callable[[float, Dict[str, int]], None]] = None,
+            cancelled: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+        """导入文件，返回统计信息；progress 接收 (0~1 进度, 统计信息)"""
+        stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0}
+        total_size = os.path.getsize(file_name) or 1
+        cursor = self.db.cursor()
+
+        try:
+            with open(file_name, 'r', encoding='utf-8-sig', newline='') as f:
+                chunk = []
+                for row in iter_rows(f, file_name):
+                    stats['rows'] += 1
+                    try:
+                        chunk.extend(row_readings(row))
+                    except (ValueError, TypeError):
+                        stats['invalid'] += 1
+
+                    if len(chunk) >= self.chunk_size:
+                        self._write_chunk(cursor, chunk, stats)
+                        self.db.commit()
+                        chunk = []
+                        if progress:
+                            progress(min(f.buffer.tell() / total_size, 1.0), stats)
+                        if cancelled and cancelled():
+                            raise InterruptedError("导入已取消")
+
+                if chunk:
+                    self._write_chunk(cursor, chunk, stats)
+
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            raise
+
+        if progress:
+            progress(1.0, stats)
+        return stats
+
+    def _write_chunk(self, cursor, chunk: List[Tuple[str, str, float]], stats: Dict[str, int]):
+        """块内去重并排除数据库中已有的记录后批量写入"""
+        unique = list(dict.fromkeys(chunk))
+        stats['duplicates'] += len(chunk) - len(unique)
+
+        # 按类型查询本块时间范围内已有的记录
+        existing = set()
+        by_type: Dict[str, List[str]] = {}
+        for timestamp, trend_type, _ in unique:
+            by_type.setdefault(trend_type, []).append(timestamp)
+        for trend_type, timestamps in by_type.items():
+            cursor.execute('''
+                SELECT timestamp, type, value
+                FROM health_trends
+                WHERE type = ? AND timestamp BETWEEN ? AND ?
+            ''', (trend_type, min(timestamps), max(timestamps)))
+            existing.update((t, k, round(v, 2)) for t, k, v in cursor.fetchall())
+
+        rows = [r for r in unique if r not in existing]
+        stats['duplicates'] += len(unique) - len(rows)
+
+        cursor.executemany('''
+            INSERT INTO health_trends (timestamp, type, value)
+            VALUES (?, ?, ?)
+        ''', rows)
+        stats['imported'] += len(rows)
+
+
+def import_file(file_name: str, db_path: str,
+                progress: Optional[Callable[[float], None]] = None) -> str:
+    """在独立的数据库连接上导入文件（供后台任务调用），返回统计说明"""
+    db = sqlite3.connect(db_path)
+    try:
+        stats = HealthDataImporter(db).run(
+            file_name, progress=(lambda fraction, _: progress(fraction)) if progress else None
+        )
+    finally:
+        db.close()
+    return (f"共读取 {stats['rows']} 行，导入 {stats['imported']} 条，"
+            f"重复 {stats['duplicates']} 条，无效 {stats['invalid']} 行")
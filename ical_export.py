@@ -0,0 +1,112 @@
+"""用药提醒的 iCalendar (RFC 5545) 导出
+
+每个用药方案写一个重复事件：DTSTART 为第一次服药，RRULE 用 BYHOUR/BYMINUTE
+展开每天的各次服药，UNTIL 截止到疗程最后一天，VALARM 在服药前提醒。
+事件逐个写入文件，不在内存中构建整个日历。时间为不带时区的本地时间，
+日历客户端按用户所在时区显示。
+"""
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+
+from dose_rules import DoseRule, parse_usage
+
+PRODID = '-//AI Medical Assistant//Medication Reminders//ZH'
+DOSE_DURATION = 'PT15M'
+ALARM_BEFORE = '-PT15M'
+# 没有疗程天数时导出的天数
+DEFAULT_DAYS = 30
+
+
+def escape_text(value: Any) -> str:
+    """TEXT 类型转义（RFC 5545 3.3.11）"""
+    text = '' if value is None else str(value)
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line: str) -> str:
+    """超过 75 字节的内容行折行，不拆开多字节字符"""
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        # 续行以一个空格开头，占一个字节
+        if size + width > (75 if not parts else 74):
+            parts.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _local(value: datetime) -> str:
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _slot_groups(rule: DoseRule) -> Iterator[List[int]]:
+    """按分钟数分组：同一组用 BYHOUR 列出各小时，避免 BYHOUR×BYMINUTE 产生多余的时间"""
+    slots = sorted(rule.minutes, key=lambda m: (m % 60, m))
+    for _, group in groupby(slots, key=lambda m: m % 60):
+        yield sorted(group)
+
+
+def regimen_events(med: Dict[str, Any], uid: str, stamp: str, today: datetime) -> Iterator[str]:
+    """一个用药方案的 VEVENT 内容行；需要时服用或无法识别时间的方案不导出"""
+    rule = parse_usage(med['time'])
+    if not rule.minutes:
+        return
+    start = datetime.fromisoformat(med['start_date']) if med.get('start_date') else today
+    days = rule.total_days(med.get('days')) or DEFAULT_DAYS
+    # UNTIL 为最后一个服药日的结束，重复规则会在此之前停止
+    until = start + timedelta(days=days) - timedelta(seconds=1)
+    summary = escape_text(f"服药提醒: {med['name']}")
+    description = escape_text(f"用量: {med['dosage']}\n用法: {med['time']}\n注意事项: {med.get('notes') or ''}")
+
+    for minutes in _slot_groups(rule):
+        hours = ','.join(str(m // 60) for m in minutes)
+        rrule = f"RRULE:FREQ=DAILY;UNTIL={_local(until)};BYHOUR={hours};BYMINUTE={minutes[0] % 60}"
+        if rule.every_days > 1:
+            rrule += f";INTERVAL={rule.every_days}"
+        yield 'BEGIN:VEVENT'
+        yield f"UID:{uid}-{minutes[0] % 60:02d}@medical-assistant"
+        yield f"DTSTAMP:{stamp}"
+        yield f"DTSTART:{_local(start + timedelta(minutes=minutes[0]))}"
+        yield f"DURATION:{DOSE_DURATION}"
+        yield rrule
+        yield f"SUMMARY:{summary}"
+        yield f"DESCRIPTION:{description}"
+        yield 'BEGIN:VALARM'
+        yield 'ACTION:DISPLAY'
+        yield f"DESCRIPTION:{summary}"
+        yield f"TRIGGER:{ALARM_BEFORE}"
+        yield 'END:VALARM'
+        yield 'END:VEVENT'
+
+
+def write_calendar(f: TextIO, medications: List[Dict[str, Any]],
+                   progress: Optional[Callable[[float], None]] = None):
+    """把用药方案逐个写入 f（文本模式、newline=''）"""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    now = datetime.now()
+    today = datetime(now.year, now.month, now.day)
+
+    f.write(fold('BEGIN:VCALENDAR'))
+    f.write(fold(f"PRODID:{PRODID}"))
+    f.write(fold('VERSION:2.0'))
+    f.write(fold('CALSCALE:GREGORIAN'))
+    f.write(fold('X-WR-CALNAME:用药提醒'))
+    for index, med in enumerate(medications):
+        uid = f"medication-{med.get('id', index)}"
+        f.writelines(fold(line) for line in regimen_events(med, uid, stamp, today))
+        if progress and index % 200 == 0:
+            progress(index / len(medications))
+    f.write(fold('END:VCALENDAR'))
+
+
+def export_calendar(file_name: str, medications: List[Dict[str, Any]],
+                    progress: Optional[Callable[[float], None]] = None):
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        write_calendar(f, medications, progress)
@@ -0,0 +1,373 @@
+"""ICD 编码校验
+
+build_medical_prompt 要求模型给出 ICD-10 诊断编码和 ICD-9-CM-3 手术编码，但模型
+可能写出格式不对或与诊断不符的编码。这里用程序自带的编码表（data/icd10.tsv、
+data/icd9cm3.tsv）在本地校验分析结果中的编码，标出有问题的编码，并按编码前缀
+和诊断/手术名称给出最接近的有效编码，不需要联网。
+
+自带的编码表只是常用编码的子集，未收录的编码只说明无法在本地校验，不作为
+错误计数。
+
+编码表按编码排序，前缀查找用二分；名称、常用名上建字符二元组（bigram）倒排
+索引。编码表在首次使用时载入，之后每次校验只做少量字典查找，耗时远低于 1 毫秒。
+"""
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+ICD10 = 'ICD-10'
+ICD9CM3 = 'ICD-9-CM-3'
+
+# 名称检索结果低于该分数时不作为建议
+MIN_SCORE = 0.35
+# 编码与诊断名称的相似度低于该值、而名称检索另有把握较大的编码时，认为编码与诊断不符
+MISMATCH_SCORE = 0.6
+
+# 校验结果
+OK = 'ok'                   # 编码表中的有效编码
+EXTENDED = 'extended'       # 国家临床版等扩展码，前几位是有效编码
+CATEGORY = 'category'       # 只写到类目，编码表中有更细的亚目
+UNKNOWN = 'unknown'         # 格式正确但本地子集未收录（无法校验，不算错误）
+MALFORMED = 'malformed'     # 格式错误
+MISMATCH = 'mismatch'       # 编码有效但与诊断/手术名称不符
+MISSING = 'missing'         # 编码字段中没有编码
+
+STATUS_TEXT = {
+    OK: "有效",
+    EXTENDED: "扩展码，按 {base} 校验有效",
+    CATEGORY: "只写到类目，建议细化",
+    UNKNOWN: "本地子集未收录，未校验",
+    MALFORMED: "格式错误",
+    MISMATCH: "与{label}不符",
+    MISSING: "未给出编码",
+}
+
+# 编码字段 -> (编码体系, 对应的名称字段)
+CODE_FIELDS = {
+    'ICD-10编码': (ICD10, '主要诊断'),
+    '手术编码': (ICD9CM3, '手术名称'),
+}
+# 表示"没有"的填写，这类字段不要求编码
+NONE_VALUES = {'无', '暂无', '不需要', '不适用', '无需手术', '暂不需要', '无手术', '/', '-', 'n/a', 'none'}
+
+_FIELD_LINE = re.compile(r'^\s*(ICD-?10\s*编码|手术编码|主要诊断|手术名称)\s*[:：]\s*(.*)$', re.I | re.M)
+_SYSTEM_NAMES = re.compile(r'ICD-?10|ICD-?9(?:-?CM)?(?:-?3)?', re.I)
+_TOKEN = re.compile(r'[A-Z0-9][A-Z0-9.]*')
+_FORMATS = {
+    # 类目 3 位，亚目 1~2 位小数；国家临床版在后面再加扩展位（如 J18.900、E11.9x001）
+    ICD10: re.compile(r'^[A-Z]\d{2}(?:\.\d{1,4}(?:X\d{3})?)?$'),
+    # 2 位类目，1~2 位小数；国家临床版扩展到 4 位小数（如 47.0100）
+    ICD9CM3: re.compile(r'^\d{2}(?:\.\d{1,4})?$'),
+}
+_NAME_SPLIT = re.compile(r'[，,；;、/\s]+|(?:伴有|伴|合并|及|和)')
+_QUALIFIER = re.compile(r'[，,(\[（【].*$')
+
+
+class IcdCode(NamedTuple):
+    system: str
+    code: str
+    name: str
+
+
+class CodeCheck(NamedTuple):
+    """分析结果中一个编码的校验结果"""
+    system: str
+    label: str                       # 原文中的字段名，如 "ICD-10编码"
+    text: str                        # 原文中的编码
+    status: str
+    code: Optional[IcdCode]          # 对应的有效编码（扩展码为其基础编码）
+    suggestions: Tuple[IcdCode, ...]
+
+    @property
+    def valid(self) -> bool:
+        return self.status in (OK, EXTENDED)
+
+    @property
+    def unchecked(self) -> bool:
+        """本地编码表未收录，既不算有效也不算错误"""
+        return self.status == UNKNOWN
+
+
+def _clean(text: str) -> str:
+    return unicodedata.normalize('NFKC', text or '').strip().lower()
+
+
+def _bigrams(text: str) -> Set[str]:
+    padded = f"^{text}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def normalize_code(text: str) -> str:
+    """统一全半角和大小写，去掉星剑号和末尾的点"""
+    code = unicodedata.normalize('NFKC', text or '').upper().strip()
+    return code.replace('†', '').replace('*', '').rstrip('.')
+
+
+class CodeTable:
+    """一个编码体系的编码表：按编码查找、前缀查找和名称检索"""
+
+    def __init__(self, system: str, path: str):
+        self.system = system
+        self._codes: Dict[str, IcdCode] = {}
+        self._terms: List[str] = []            # 名称、名称主干和常用名
+        self._term_code: List[str] = []
+        self._term_grams: List[int] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if not line or line.startswith('#'):
+                    continue
+                fields = (line.split('\t') + ['', ''])[:3]
+                entry = IcdCode(system, normalize_code(fields[0]), fields[1].strip())
+                self._codes[entry.code] = entry
+                names = [entry.name, _QUALIFIER.sub('', entry.name)] + fields[2].split(',')
+                for term in dict.fromkeys(_clean(name) for name in names):
+                    if term:
+                        self._add_term(term, entry.code)
+        self._sorted = sorted(self._codes)
+        self._postings = dict(self._postings)
+        # 同一诊断名称在一次校验中会被多个编码用到，批量分组时编码大量重复
+        self._scores = lru_cache(maxsize=1024)(self._name_scores)
+        self.search = lru_cache(maxsize=1024)(self._search)
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+
+    def _add_term(self, term: str, code: str):
+        term_id = len(self._terms)
+        grams = _bigrams(term)
+        self._terms.append(term)
+        self._term_code.append(code)
+        self._term_grams.append(len(grams))
+        for gram in grams:
+            self._postings[gram].append(term_id)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def get(self, code: str) -> Optional[IcdCode]:
+        return self._codes.get(normalize_code(code))
+
+    def with_prefix(self, prefix: str, limit: int = 10) -> List[IcdCode]:
+        """以 prefix 开头的编码（按编码排序）"""
+        prefix = normalize_code(prefix)
+        result = []
+        i = bisect_left(self._sorted, prefix)
+        while i < len(self._sorted) and len(result) < limit and self._sorted[i].startswith(prefix):
+            result.append(self._codes[self._sorted[i]])
+            i += 1
+        return result
+
+    def children(self, code: str) -> List[IcdCode]:
+        """编码表中比 code 更细的编码"""
+        code = normalize_code(code)
+        prefix = code if '.' in code else code + '.'
+        return [child for child in self.with_prefix(prefix) if child.code != code]
+
+    def _name_scores(self, text: str) -> Dict[str, float]:
+        """各编码与 text 的名称相似度（取编码各名称中最高的）
+
+        相似度为 Dice 系数与"编码名称有多少出现在 text 中"的平均，诊断写得比
+        编码表名称更具体（如"社区获得性肺炎"）时仍能找到对应的编码。
+        """
+        scores: Dict[str, float] = {}
+        for part in dict.fromkeys(_NAME_SPLIT.split(_clean(text))):
+            if not part:
+                continue
+            grams = _bigrams(part)
+            counts: Dict[int, int] = defaultdict(int)
+            for gram in grams:
+                for term_id in self._postings.get(gram, ()):
+                    counts[term_id] += 1
+            for term_id, common in counts.items():
+                size = self._term_grams[term_id]
+                score = (2 * common / (len(grams) + size) + common / size) / 2
+                code = self._term_code[term_id]
+                if score > scores.get(code, 0):
+                    scores[code] = score
+        return scores
+
+    def _search(self, text: str, limit: int = 5) -> List[Tuple[IcdCode, float]]:
+        """按名称检索编码：名称或常用名以 text 开头的排在前面，其次按相似度"""
+        query = _clean(text)
+        if not query:
+            return []
+        scores = dict(self._scores(query))
+        for term_id, term in enumerate(self._terms):
+            if term.startswith(query):
+                scores[self._term_code[term_id]] = 1.0
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self._codes[code], round(score, 3)) for code, score in ranked[:limit] if score >= MIN_SCORE]
+
+    def similarity(self, code: str, text: str) -> float:
+        """编码名称与 text 的相似度"""
+        return self._scores(text).get(normalize_code(code), 0.0)
+
+    def _resolve(self, text: str) -> Tuple[str, Optional[IcdCode]]:
+        """校验单个编码，返回 (校验结果, 对应的有效编码)"""
+        code = normalize_code(text)
+        if not _FORMATS[self.system].match(code):
+            return MALFORMED, None
+        entry = self._codes.get(code)
+        if entry is not None:
+            return (CATEGORY if self.children(code) else OK), entry
+        # 扩展码：逐位去掉末尾，直到命中编码表中的亚目（不退到类目）
+        base = code.split('X')[0].rstrip('.')
+        while '.' in base and len(base.split('.')[1]) > 1:
+            base = base[:-1]
+            entry = self._codes.get(base)
+            if entry is not None:
+                return EXTENDED, entry
+        return UNKNOWN, None
+
+
+@lru_cache(maxsize=None)
+def tables() -> Dict[str, CodeTable]:
+    """共享的编码表（首次调用时载入）"""
+    return {
+        ICD10: CodeTable(ICD10, os.path.join(DATA_DIR, 'icd10.tsv')),
+        ICD9CM3: CodeTable(ICD9CM3, os.path.join(DATA_DIR, 'icd9cm3.tsv')),
+    }
+
+
+def _category(code: IcdCode) -> str:
+    return code.code.split('.')[0]
+
+
+def check_code(system: str, text: str, name: str = '', label: str = '') -> CodeCheck:
+    """校验一个编码；name 为对应的诊断或手术名称，用于检查编码与名称是否相符"""
+    table = tables()[system]
+    status, entry = table.resolve(text)
+    matches = [code for code, _ in table.search(name, 3)] if name else []
+
+    if status == MALFORMED or status == UNKNOWN:
+        # 先按编码前缀找同一类目下的编码，再按名称找
+        prefix = normalize_code(text)[:3 if system == ICD10 else 2]
+        nearby = table.with_prefix(prefix, 3) if prefix else []
+        suggestions = tuple(dict.fromkeys(matches + nearby))[:5]
+    elif status == CATEGORY:
+        suggestions = tuple(table.children(entry.code)[:5])
+    else:
+        suggestions = ()
+        if name and matches:
+            # 编码有效，但名称检索到的编码都不在同一类目，且编码自身名称与诊断相差很远
+            best = table.search(name, 1)
+            if (best and best[0][1] >= MISMATCH_SCORE
+                    and all(_category(code) != _category(entry) for code in matches)
+                    and table.similarity(entry.code, name) < MIN_SCORE):
+                status = MISMATCH
+                suggestions = tuple(matches)
+    return CodeCheck(system, label, text, status, entry, suggestions)
+
+
+def _code_tokens(value: str) -> List[str]:
+    value = _SYSTEM_NAMES.sub(' ', unicodedata.normalize('NFKC', value).upper())
+    return [token.rstrip('.') for token in _TOKEN.findall(value) if any(ch.isdigit() for ch in token)]
+
+
+def extract_codes(text: str) -> Tuple[List[IcdCode], List[IcdCode]]:
+    """分析结果中通过校验的 (诊断编码, 手术操作编码)，按出现顺序去重
+
+    只按编码表校验，不做名称比对，供批量处理使用；扩展码按其基础编码返回，
+    未收录和格式错误的编码不返回。
+    """
+    found: Dict[str, List[IcdCode]] = {ICD10: [], ICD9CM3: []}
+    for match in _FIELD_LINE.finditer(text or ''):
+        field = match.group(1)
+        if field in ('主要诊断', '手术名称'):
+            continue
+        system = ICD10 if field.upper().startswith('ICD') else ICD9CM3
+        for token in _code_tokens(match.group(2)):
+            _, entry = tables()[system].resolve(token)
+            if entry is not None and entry not in found[system]:
+                found[system].append(entry)
+    return found[ICD10], found[ICD9CM3]
+
+
+def principal_code(text: str) -> Optional[str]:
+    """第一个 ICD-10 编码字段中的第一个编码（主要诊断），不论是否收录"""
+    for match in _FIELD_LINE.finditer(text or ''):
+        if match.group(1).upper().startswith('ICD'):
+            tokens = _code_tokens(match.group(2))
+            if tokens:
+                return normalize_code(tokens[0])
+    return None
+
+
+def validate(text: str) -> List[CodeCheck]:
+    """找出分析结果中所有编码字段并逐个校验
+
+    双模型分析中每个模型各有一组字段，编码与其前面最近的诊断/手术名称对应。
+    """
+    checks = []
+    names = {}
+    for match in _FIELD_LINE.finditer(text or ''):
+        field, value = match.group(1), match.group(2).strip()
+        if field in ('主要诊断', '手术名称'):
+            names[field] = value
+            continue
+        label = 'ICD-10编码' if field.upper().startswith('ICD') else field
+        system, name_field = CODE_FIELDS[label]
+        name = names.get(name_field, '')
+        tokens = _code_tokens(value)
+        if not tokens:
+            if _clean(value).strip('[]【】') in NONE_VALUES or _clean(name) in NONE_VALUES or not name:
+                continue
+            checks.append(CodeCheck(system, label, value, MISSING, None, tuple(
+                code for code, _ in tables()[system].search(name, 3))))
+            continue
+        for token in tokens:
+            checks.append(check_code(system, token, name, label))
+    return checks
+
+
+def _describe(code: IcdCode) -> str:
+    return f"{code.code} {code.name}"
+
+
+def report(checks: List[CodeCheck]) -> str:
+    """校验结果的文字说明，每个编码一行"""
+    lines = []
+    for check in checks:
+        name_label = CODE_FIELDS[check.label][1]
+        status = STATUS_TEXT[check.status].format(base=check.code.code if check.code else '', label=name_label)
+        line = f"{check.label} {check.text}：{status}"
+        if check.status in (OK, EXTENDED) and check.code:
+            line += f"（{check.code.name}）"
+        if check.suggestions:
+            prefix = {CATEGORY: "可选", UNKNOWN: "相近的已收录编码"}.get(check.status, "建议核对")
+            line += f"；{prefix}：" + "、".join(_describe(code) for code in check.suggestions)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def annotate(text: str) -> str:
+    """在分析结果末尾追加编码校验部分；没有编码字段时原样返回"""
+    checks = validate(text)
+    if not checks:
+        return text
+    invalid = sum(1 for check in checks if not check.valid and not check.unchecked)
+    unchecked = sum(1 for check in checks if check.unchecked)
+    if invalid:
+        summary = f"共 {len(checks)} 个编码，{invalid} 个需要核对"
+    elif unchecked:
+        summary = f"共 {len(checks)} 个编码，未发现错误"
+    else:
+        summary = f"共 {len(checks)} 个编码，均有效"
+    if unchecked:
+        summary += f"（{unchecked} 个本地子集未收录，未校验）"
+    return f"{text.rstrip()}\n\n=== 编码校验 ===\n{summary}\n{report(checks)}\n"
+
+
+if __name__ == '__main__':
+    import sys
+
+    for system, table in tables().items():
+        for code, score in table.search(' '.join(sys.argv[1:]) or '肺炎'):
+            print(f"{system}\t{code.code}\t{code.name}\t{score}")
@@ -0,0 +1,40 @@
+from typing import Callable
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QGroupBox, QLabel, QVBoxLayout, QWidget
+
+
+class LazyPanel(QWidget):
+    """延迟构建的面板：先显示占位框，首次需要时再调用工厂函数创建真实内容"""
+
+    def __init__(self, title: str, factory: Callable[[], QWidget], parent=None):
+        super().__init__(parent)
+        self.factory = factory
+        self.is_built = False
+
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+
+        # 占位框与真实面板标题一致，避免构建完成时界面跳动
+        self._placeholder = QGroupBox(title)
+        placeholder_layout = QVBoxLayout(self._placeholder)
+        label = QLabel("正在加载...")
+        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        placeholder_layout.addWidget(label)
+        self._layout.addWidget(self._placeholder)
+
+    def build(self) -> bool:
+        """构建真实面板，已构建时直接返回 False"""
+        if self.is_built:
+            return False
+        # 先置位，工厂函数内部的初始刷新可以正常访问面板；构建失败时恢复，之后可再次尝试
+        self.is_built = True
+        try:
+            widget = self.factory()
+        except BaseException:
+            self.is_built = False
+            raise
+        self._layout.replaceWidget(self._placeholder, widget)
+        self._placeholder.deleteLater()
+        self._placeholder = None
+        return True
@@ -1,27 +1,75 @@
+# 需最先导入：启用启动分析时记录之后所有模块的导入耗时
+from startup_profiler import profiler
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
-from PyQt6.QtGui import QAction, QPainter, QFont
+from PyQt6.QtGui import QAction, QTextCursor
 from PyQt6.QtPrintSupport import QPrintPreviewDialog, QPrinter
 import sys
 import json
 from pathlib import Path
 from ai_analyzer import MedicalAnalyzer
-from datetime import datetime
+from analysis_stream import AnalysisStream, parse_medications
+from lazy_panel import LazyPanel
+from reminder_model import PendingMedicationModel, ReminderTableModel, ScheduleTableModel
+from reminder_scheduler import ReminderScheduler
+import medication_schedule
+import drug_catalog
+import drug_normalizer
+import icd_codes
+import drg_grouper
+import ai_metering
+from export_jobs import ExportJobManager, ExportJobWidget
+import exporters
+from ui_watchdog import install_from_env as install_watchdog
+from datetime import datetime, timedelta
 import re
-import platform
 
 class MedicalAssistant(QMainWindow):
+    # 相似病例对话框的选择（QDialog.done 的返回值，0 为关闭对话框）
+    CASE_CANCEL, CASE_REUSE, CASE_ANALYZE = 0, 1, 2
+    
+    # 设备接入服务写入数据库后通知界面（跨线程排队投递到界面线程）
+    readings_ingested = pyqtSignal(list)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AI医疗助手 - AI安全工坊出品（微信公众号搜索关注）")
         self.setMinimumSize(1200, 800)
         
-        # 初始化AI分析器
-        self.analyzer = MedicalAnalyzer()
+        # AI分析器在首次使用时创建，避免启动时加载 OpenAI SDK
+        self._analyzer = None
+        # 相似病例索引在首次分析时载入
+        self._case_index = None
+        # 正在进行的流式分析
+        self.analysis_stream = None
         
         # 初始化数据存储 - 移到这里，在创建界面之前
         self.init_storage()
         
+        # 设备实时接入：实时数据按最高 10 帧/秒合并刷新到图表
+        self.ingest_server = None
+        self.pending_chart_readings = []
+        self.chart_refresh_timer = QTimer(self)
+        self.chart_refresh_timer.setSingleShot(True)
+        self.chart_refresh_timer.setInterval(100)
+        self.chart_refresh_timer.timeout.connect(self.flush_pending_chart_readings)
+        self.readings_ingested.connect(self.on_readings_ingested)
+        
+        # 导出任务在后台线程池中执行，可同时进行多个
+        self.export_jobs = ExportJobManager(parent=self)
+        self.export_widgets = {}
+        self.export_callbacks = {}
+        self.health_import_running = False
+        self.export_jobs.progress.connect(self.on_export_progress)
+        self.export_jobs.finished.connect(self.on_export_finished)
+        self.export_jobs.failed.connect(self.on_export_failed)
+        self.export_jobs.cancelled.connect(self.on_export_cancelled)
+        
+        # 用药提醒在应用内调度，面板构建完成后加载并补发关闭期间错过的提醒
+        self.reminder_scheduler = ReminderScheduler(self.db, self)
+        self.reminder_scheduler.due.connect(self.on_medication_due)
+        self.reminder_tray = None
+        
         # 创建主窗口部件
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -45,8 +93,14 @@ class MedicalAssistant(QMainWindow):
         # 右侧面板
         right_panel = QVBoxLayout()
         right_panel.addWidget(self.create_medication_reminder())  # 新增用药提醒
-        right_panel.addWidget(self.create_health_trends())  # 新增健康趋势图
-        right_panel.addWidget(self.create_prescription_manager())  # 新增处方管理功能
+        
+        # 健康趋势和处方管理较重，先显示占位框，窗口显示后在空闲时逐个构建
+        self.panels = {
+            'trends': LazyPanel("健康趋势", self.create_health_trends),  # 新增健康趋势图
+            'prescriptions': LazyPanel("处方管理", self.create_prescription_manager)  # 新增处方管理功能
+        }
+        right_panel.addWidget(self.panels['trends'])
+        right_panel.addWidget(self.panels['prescriptions'])
         
         # 将三个面板添加到主布局
         main_layout.addLayout(left_panel, 2)
@@ -59,9 +113,54 @@ class MedicalAssistant(QMainWindow):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         self.statusBar.addPermanentWidget(self.progress_bar)
+        
+        # 引导教程在所有面板构建完成后显示
+        self.tutorial_pending = True
+        self.panels_scheduled = False
 
-        # 显示引导教程
-        self.show_tutorial()  # 确保在所有组件初始化后调用
+    @property
+    def case_index(self):
+        """相似病例索引（首次访问时从数据库载入）"""
+        if self._case_index is None:
+            # 索引依赖 numpy，首次使用时才导入
+            from case_index import CaseIndex
+            self._case_index = CaseIndex(self.db)
+        return self._case_index
+
+    @property
+    def analyzer(self):
+        """AI分析器（首次访问时创建）"""
+        if self._analyzer is None:
+            analyzer = MedicalAnalyzer()
+            # 每次模型调用的 token、耗时和费用由后台线程写入 ai_calls 表
+            config = analyzer.load_config().get('metering') or {}
+            analyzer.metering = ai_metering.Metering(self.db_path, config.get('clinic'), config.get('prices'))
+            self._analyzer = analyzer
+        return self._analyzer
+
+    @property
+    def current_patient(self):
+        """患者标识（未填写时为 None），用于按患者统计AI调用"""
+        return self.patient_id_input.text().strip() or None
+
+    def paintEvent(self, event):
+        """窗口首次绘制后开始在空闲时构建延迟面板"""
+        super().paintEvent(event)
+        if self.tutorial_pending and not self.panels_scheduled:
+            self.panels_scheduled = True
+            QTimer.singleShot(0, self.build_next_panel)
+
+    def build_next_panel(self):
+        """每次事件循环空闲时构建一个面板，全部完成后加载用药提醒并显示引导教程"""
+        for panel in self.panels.values():
+            if panel.build():
+                QTimer.singleShot(0, self.build_next_panel)
+                return
+        
+        if self.tutorial_pending:
+            self.tutorial_pending = False
+            self.reminder_scheduler.load()
+            self.show_tutorial()
 
     def init_storage(self):
         """初始化数据存储"""
@@ -69,7 +168,8 @@ class MedicalAssistant(QMainWindow):
         
         try:
             # 创建数据库连接
-            self.db = sqlite3.connect('medical.db')
+            self.db_path = 'medical.db'
+            self.db = sqlite3.connect(self.db_path)
             self.cursor = self.db.cursor()
             
             # 创建必要的表
@@ -92,16 +192,36 @@ class MedicalAssistant(QMainWindow):
                 )
             ''')
             
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_health_trends_type_time
+                ON health_trends (type, timestamp)
+            ''')
+            
             self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS medication_reminders (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     medicine_name TEXT,
                     dosage TEXT,
                     time TEXT,
-                    notes TEXT
+                    notes TEXT,
+                    days INTEGER,       -- 服用天数
+                    start_date TEXT,    -- 开始日期
+                    last_fired TEXT     -- 已提醒到的时间（创建或最后一次提醒）
                 )
             ''')
             
+            # 旧数据库补充提醒调度需要的列
+            columns = {row[1] for row in self.cursor.execute('PRAGMA table_info(medication_reminders)')}
+            for column, column_type in (('days', 'INTEGER'), ('start_date', 'TEXT'), ('last_fired', 'TEXT')):
+                if column not in columns:
+                    self.cursor.execute(f'ALTER TABLE medication_reminders ADD COLUMN {column} {column_type}')
+            # 旧提醒没有开始日期，从今天开始调度（已提醒时间记为现在，不补发之前的服药）
+            now = datetime.now()
+            self.cursor.execute('''
+                UPDATE medication_reminders SET start_date = ?, last_fired = COALESCE(last_fired, ?)
+                WHERE start_date IS NULL
+            ''', (now.strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d %H:%M')))
+            
             # 创建处方相关表
             self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS prescriptions (
@@ -142,6 +262,19 @@ class MedicalAssistant(QMainWindow):
                 )
             ''')
             
+            # 本地规则 DRG 分组结果
+            self.cursor.execute(drg_grouper.SCHEMA)
+            
+            # AI 调用的 token、耗时和费用
+            self.cursor.execute(ai_metering.SCHEMA)
+            self.cursor.execute(ai_metering.INDEX)
+            
+            # 处方与药品联接查询（批量导出）按处方ID查找药品
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_prescription_items_prescription
+                ON prescription_items (prescription_id)
+            ''')
+            
             self.db.commit()
             
         except Exception as e:
@@ -156,6 +289,11 @@ class MedicalAssistant(QMainWindow):
         self.model_combo.addItems(["OpenAI", "DeepSeek", "双模型分析"])
         group_layout.addWidget(self.model_combo)
         
+        # 先生成诊断，再并行生成其余各部分
+        self.sectioned_check = QCheckBox("分段并行分析（更快）")
+        self.sectioned_check.setToolTip("先生成诊断，再同时生成检查、用药、手术、生活指导和医保等部分")
+        group_layout.addWidget(self.sectioned_check)
+        
         group.setLayout(group_layout)
         return group
 
@@ -163,6 +301,11 @@ class MedicalAssistant(QMainWindow):
         group = QGroupBox("患者信息")
         group_layout = QFormLayout()
         
+        # 患者标识只用于按患者统计AI调用
+        self.patient_id_input = QLineEdit()
+        self.patient_id_input.setPlaceholderText("门诊号或姓名（可选）")
+        group_layout.addRow("患者标识:", self.patient_id_input)
+        
         # 年龄输入
         self.age_input = QSpinBox()
         self.age_input.setRange(0, 120)
@@ -216,6 +359,32 @@ class MedicalAssistant(QMainWindow):
         self.output_text.setReadOnly(True)
         group_layout.addWidget(self.output_text)
         
+        # 生成过程中逐条识别出的用药，可直接修改，确认后加入用药提醒
+        self.pending_medications = PendingMedicationModel(self)
+        self.pending_label = QLabel()
+        group_layout.addWidget(self.pending_label)
+        
+        self.pending_view = QTableView()
+        self.pending_view.setModel(self.pending_medications)
+        self.pending_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.pending_view.horizontalHeader().setStretchLastSection(True)
+        self.pending_view.setMaximumHeight(160)
+        group_layout.addWidget(self.pending_view)
+        
+        pending_buttons = QHBoxLayout()
+        confirm_btn = QPushButton("确认加入用药提醒")
+        remove_btn = QPushButton("移除选中")
+        confirm_btn.clicked.connect(self.confirm_pending_medications)
+        remove_btn.clicked.connect(self.remove_pending_medications)
+        pending_buttons.addWidget(confirm_btn)
+        pending_buttons.addWidget(remove_btn)
+        group_layout.addLayout(pending_buttons)
+        
+        for signal in (self.pending_medications.rowsInserted, self.pending_medications.rowsRemoved,
+                       self.pending_medications.modelReset):
+            signal.connect(self.update_pending_label)
+        self.update_pending_label()
+        
         group.setLayout(group_layout)
         return group
 
@@ -249,6 +418,7 @@ class MedicalAssistant(QMainWindow):
 
     def analyze_symptoms(self):
         """分析症状"""
+        streaming = False
         try:
             # 显示进度条
             self.progress_bar.setVisible(True)
@@ -269,43 +439,212 @@ class MedicalAssistant(QMainWindow):
                 QMessageBox.warning(self, "警告", "请输入症状描述")
                 return
             
+            # 先查找相似的历史病例，医生可以直接复用其诊断而不调用模型
+            choice, case = self.choose_similar_case(symptoms, user_info)
+            if choice == self.CASE_CANCEL:
+                return
+            if choice == self.CASE_REUSE:
+                self.output_text.setPlainText(
+                    f"=== 参考相似病例（{case['timestamp']}，相似度 {case['similarity']:.0%}）===\n"
+                    f"以下为历史病例的分析结果，未重新调用AI模型。\n\n{case['diagnosis']}"
+                )
+                self.pending_medications.clear()
+                self.pending_medications.append(parse_medications(case['diagnosis']))
+                self.progress_bar.setValue(100)
+                self.statusBar.showMessage("已复用相似病例的分析结果")
+                return
+            
             # 更新进度
             self.progress_bar.setValue(40)
             QApplication.processEvents()
             
             # 根据选择的模型进行分析
             selected_model = self.model_combo.currentText()
-            if selected_model == "OpenAI":
-                result = self.analyzer.get_openai_analysis(
-                    self.analyzer.build_medical_prompt(user_info, symptoms)
-                )
-            elif selected_model == "DeepSeek":
-                result = self.analyzer.get_deepseek_analysis(
-                    self.analyzer.build_medical_prompt(user_info, symptoms)
-                )
+            sectioned = self.sectioned_check.isChecked()
+            self.pending_medications.clear()
+            self.analyzer.patient = self.current_patient
+            if selected_model in ("OpenAI", "DeepSeek") and not sectioned:
+                # 单模型分析流式输出，边生成边识别用药条目，完成后由 on_stream_finished 收尾
+                self.start_analysis_stream(selected_model, user_info, symptoms)
+                streaming = True
+                return
+            if sectioned and selected_model in ("OpenAI", "DeepSeek"):
+                result = self.analyzer.analyze_sectioned(user_info, symptoms, selected_model)
             else:  # 双模型分析
-                result = self.analyzer.analyze(user_info, symptoms)
+                result = self.analyzer.analyze(user_info, symptoms, sectioned)
             
-            # 显示结果
-            self.output_text.setPlainText(result)
+            self.pending_medications.append(parse_medications(result))
+            self.show_analysis_result(result, user_info)
             
             # 完成进度
             self.progress_bar.setValue(100)
-            self.statusBar.showMessage("分析完成")
+            self.statusBar.showMessage(self.analysis_done_message())
             
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"分析失败: {str(e)}")
+        finally:
+            if not streaming:
+                self.analyze_btn.setEnabled(True)
+                self.progress_bar.setVisible(False)
+
+    def show_analysis_result(self, result: str, user_info: dict):
+        """附加本地校验结果后显示"""
+        # 本地校验模型给出的 ICD 编码，结果追加在末尾
+        result = icd_codes.annotate(result)
+        # 按校验通过的编码用本地规则分组，与模型给出的 DRGs 信息对照
+        result = drg_grouper.annotate(result, user_info['age'] or None, user_info['gender'])
+        self.output_text.setPlainText(result)
+
+    def analysis_done_message(self) -> str:
+        count = self.pending_medications.rowCount()
+        if count:
+            return f"分析完成，识别到 {count} 条用药，可在诊断结果下方确认加入用药提醒"
+        return "分析完成"
+
+    def start_analysis_stream(self, provider: str, user_info: dict, symptoms: str):
+        """在后台线程中流式生成分析结果"""
+        prompt = self.analyzer.build_medical_prompt(user_info, symptoms)
+        analyzer = self.analyzer
+        stream = AnalysisStream(lambda: analyzer.stream_analysis(provider, prompt), self)
+        stream.text.connect(lambda text: self.on_stream_text(stream, text))
+        stream.medications.connect(lambda medications: self.on_stream_medications(stream, medications))
+        stream.finished.connect(lambda result: self.on_stream_finished(stream, result, user_info))
+        stream.failed.connect(lambda message: self.on_stream_failed(stream, message))
+        
+        self.cancel_analysis_stream()
+        self.analysis_stream = stream
+        self.output_text.clear()
+        self.progress_bar.setValue(60)
+        self.statusBar.showMessage(f"{provider} 正在生成分析结果...")
+        stream.start()
+
+    def cancel_analysis_stream(self):
+        if self.analysis_stream is not None:
+            self.analysis_stream.cancel()
+            self.analysis_stream = None
+
+    def on_stream_text(self, stream: AnalysisStream, text: str):
+        # 已取消或被新的分析取代的结果不再显示
+        if stream is not self.analysis_stream:
+            return
+        cursor = self.output_text.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.output_text.ensureCursorVisible()
+
+    def on_stream_medications(self, stream: AnalysisStream, medications: list):
+        if stream is self.analysis_stream:
+            self.pending_medications.append(medications)
+
+    def on_stream_finished(self, stream: AnalysisStream, result: str, user_info: dict):
+        if stream is not self.analysis_stream:
+            return
+        self.analysis_stream = None
+        try:
+            self.show_analysis_result(result, user_info)
+            self.progress_bar.setValue(100)
+            self.statusBar.showMessage(self.analysis_done_message())
         except Exception as e:
             QMessageBox.critical(self, "错误", f"分析失败: {str(e)}")
         finally:
             self.analyze_btn.setEnabled(True)
             self.progress_bar.setVisible(False)
 
+    def on_stream_failed(self, stream: AnalysisStream, message: str):
+        if stream is not self.analysis_stream:
+            return
+        self.analysis_stream = None
+        self.analyze_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        QMessageBox.critical(self, "错误", f"分析失败: {message}")
+
+    def update_pending_label(self):
+        count = self.pending_medications.rowCount()
+        self.pending_label.setText(f"待确认用药（{count} 条，可直接修改）" if count else "待确认用药：无")
+
+    def confirm_pending_medications(self):
+        """把待确认的用药加入用药提醒"""
+        medications = self.pending_medications.medications()
+        if not medications:
+            QMessageBox.warning(self, "警告", "没有待确认的用药")
+            return
+        try:
+            # 一个事务写入
+            self.schedule_medication_reminders(self.reminder_model.add_many(medications))
+            self.pending_medications.clear()
+            QMessageBox.information(self, "成功", f"已添加 {len(medications)} 条用药提醒")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"添加用药提醒失败: {str(e)}")
+
+    def remove_pending_medications(self):
+        rows = [index.row() for index in self.pending_view.selectionModel().selectedRows()]
+        if not rows:
+            QMessageBox.warning(self, "警告", "请先选择要移除的用药")
+            return
+        self.pending_medications.remove_rows(rows)
+
+    def choose_similar_case(self, symptoms: str, user_info: dict):
+        """列出相似的历史病例，返回 (选择, 选中的病例)
+
+        没有相似病例时直接返回 CASE_ANALYZE。
+        """
+        cases = self.case_index.similar_cases(symptoms, user_info['age'], user_info['gender'])
+        if not cases:
+            return self.CASE_ANALYZE, None
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("相似病例")
+        dialog.setMinimumSize(800, 360)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f"找到 {len(cases)} 个相似的历史病例，可直接复用其分析结果，无需再次调用AI模型："))
+        
+        table = QTableWidget(len(cases), 5)
+        table.setHorizontalHeaderLabels(['相似度', '时间', '患者', '症状', '主要诊断'])
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        for row, case in enumerate(cases):
+            patient = f"{case['age']}岁{case['gender'] or ''}" if case['age'] else (case['gender'] or '')
+            values = [f"{case['similarity']:.0%}", case['timestamp'], patient, case['symptoms'], case['summary']]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(case['diagnosis'] if column == 4 else value)
+                table.setItem(row, column, item)
+        table.selectRow(0)
+        layout.addWidget(table)
+        
+        buttons = QHBoxLayout()
+        reuse_btn = QPushButton("复用所选病例")
+        analyze_btn = QPushButton("仍然进行AI分析")
+        cancel_btn = QPushButton("取消")
+        reuse_btn.clicked.connect(lambda: dialog.done(self.CASE_REUSE))
+        table.doubleClicked.connect(lambda: dialog.done(self.CASE_REUSE))
+        analyze_btn.clicked.connect(lambda: dialog.done(self.CASE_ANALYZE))
+        cancel_btn.clicked.connect(lambda: dialog.done(self.CASE_CANCEL))
+        buttons.addWidget(reuse_btn)
+        buttons.addWidget(analyze_btn)
+        buttons.addWidget(cancel_btn)
+        layout.addLayout(buttons)
+        
+        choice = dialog.exec()
+        if choice == self.CASE_REUSE:
+            return choice, cases[max(0, table.currentRow())]
+        return choice, None
+
     def clear_all(self):
         """清空所有输入和输出"""
+        self.patient_id_input.clear()
         self.age_input.setValue(0)
         self.height_input.setValue(0)
         self.weight_input.setValue(0)
         self.symptoms_text.clear()
+        self.cancel_analysis_stream()
         self.output_text.clear()
+        self.pending_medications.clear()
+        self.analyze_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
 
     def save_result(self):
         """保存分析结果"""
@@ -347,6 +686,32 @@ class MedicalAssistant(QMainWindow):
         load_record.triggered.connect(self.load_medical_record)
         file_menu.addAction(load_record)
         
+        # 导入设备数据
+        import_data = QAction("导入设备数据", self)
+        import_data.triggered.connect(self.import_health_data)
+        file_menu.addAction(import_data)
+        
+        # 设备实时接入
+        self.ingest_action = QAction("设备实时接入", self)
+        self.ingest_action.setCheckable(True)
+        self.ingest_action.toggled.connect(self.toggle_device_ingest)
+        file_menu.addAction(self.ingest_action)
+        
+        # 批量导出处方
+        bulk_export = QAction("批量导出处方", self)
+        bulk_export.triggered.connect(self.bulk_export_prescriptions)
+        file_menu.addAction(bulk_export)
+        
+        # 按本地规则批量重新分组病历
+        regroup = QAction("DRG 批量分组", self)
+        regroup.triggered.connect(self.regroup_medical_records)
+        file_menu.addAction(regroup)
+        
+        # AI 调用的延迟、用量和费用
+        ai_usage = QAction("AI 调用统计", self)
+        ai_usage.triggered.connect(self.show_ai_usage)
+        file_menu.addAction(ai_usage)
+        
         file_menu.addSeparator()
         
         # 退出
@@ -504,6 +869,10 @@ class MedicalAssistant(QMainWindow):
             record['symptoms'],
             record['diagnosis']
         ))
+        # 索引已载入时增量加入，否则下次载入时会计算
+        if self._case_index is not None and record['diagnosis']:
+            self._case_index.add(self.cursor.lastrowid, record['symptoms'],
+                                 record['patient_info']['age'], record['patient_info']['gender'])
         self.db.commit()
         
         # 添加体重记录到健康趋势
@@ -513,29 +882,32 @@ class MedicalAssistant(QMainWindow):
 
     def add_health_trend(self, trend_type: str, value: float):
         """添加健康趋势数据"""
+        timestamp = datetime.now().replace(microsecond=0)
         self.cursor.execute('''
             INSERT INTO health_trends (timestamp, type, value)
             VALUES (?, ?, ?)
         ''', (
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             trend_type,
             value
         ))
         self.db.commit()
+        
+        self.on_health_trend_added(trend_type, timestamp, value)
 
     def create_health_trends(self):
         """创建健康趋势图表"""
-        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-        from matplotlib.figure import Figure
-        import matplotlib.dates as mdates
+        from trend_widget import TrendWidget
+        from trend_cache import TrendSeriesCache
         
         trends_group = QGroupBox("健康趋势")
         layout = QVBoxLayout()
         
-        # 创建图表
-        self.figure = Figure(figsize=(6, 4))
-        self.canvas = FigureCanvas(self.figure)
-        self.ax = self.figure.add_subplot(111)
+        # 健康趋势序列缓存
+        self.trend_cache = TrendSeriesCache()
+        
+        # 创建图表（QPainter 绘制，界面路径不再依赖 matplotlib）
+        self.trend_chart = TrendWidget()
         
         # 添加图表类型选择
         type_layout = QHBoxLayout()
@@ -567,11 +939,16 @@ class MedicalAssistant(QMainWindow):
         range_layout.addWidget(QLabel("时间范围:"))
         range_layout.addWidget(self.range_combo)
         
+        # 导出高清图表（仅在导出时加载 matplotlib）
+        export_chart_btn = QPushButton("导出图表")
+        export_chart_btn.clicked.connect(self.export_health_chart)
+        range_layout.addWidget(export_chart_btn)
+        
         # 添加到主布局
         layout.addLayout(type_layout)
         layout.addLayout(input_layout)
         layout.addLayout(range_layout)
-        layout.addWidget(self.canvas)
+        layout.addWidget(self.trend_chart)
         
         trends_group.setLayout(layout)
         
@@ -591,18 +968,19 @@ class MedicalAssistant(QMainWindow):
                 return
             
             # 保存到数据库
+            timestamp = datetime.now().replace(microsecond=0)
             self.cursor.execute('''
                 INSERT INTO health_trends (timestamp, type, value)
                 VALUES (?, ?, ?)
             ''', (
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                 trend_type,
                 value
             ))
             self.db.commit()
             
-            # 更新图表
-            self.update_health_chart()
+            # 追加到图表（无需重新查询和整体重绘）
+            self.on_health_trend_added(trend_type, timestamp, value)
             
             # 清空输入
             self.value_input.setValue(0)
@@ -654,10 +1032,15 @@ class MedicalAssistant(QMainWindow):
         reminder_group = QGroupBox("用药提醒")
         layout = QVBoxLayout()
         
-        self.medication_list = QTableWidget()
-        self.medication_list.setColumnCount(4)
-        self.medication_list.setHorizontalHeaderLabels(['药品名称', '用法用量', '服用时间', '注意事项'])
-        self.medication_list.setSelectionMode(QTableWidget.SelectionMode.MultiSelection)  # 允许多选
+        # 提醒列表由数据库加载，每行对应一条 medication_reminders 记录
+        self.reminder_model = ReminderTableModel(self.db, self)
+        self.reminder_model.load()
+        
+        self.medication_list = QTableView()
+        self.medication_list.setModel(self.reminder_model)
+        self.medication_list.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.medication_list.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)  # 允许多选
+        self.medication_list.horizontalHeader().setStretchLastSection(True)
         
         # 添加按钮布局
         button_layout = QHBoxLayout()
@@ -705,6 +1088,8 @@ class MedicalAssistant(QMainWindow):
         
         # 药品名称
         medicine_name = QLineEdit()
+        medicine_name.setPlaceholderText("输入名称或拼音首字母")
+        completer = self.drug_completer(medicine_name)
         form_layout.addRow("药品名称:", medicine_name)
         
         # 用法用量
@@ -712,6 +1097,14 @@ class MedicalAssistant(QMainWindow):
         dosage.setPlaceholderText("如: 5mg/片")
         form_layout.addRow("用法用量:", dosage)
         
+        # 选中目录中的药品后提示其常用规格
+        def on_drug_selected(name):
+            drug = drug_catalog.catalog().get(name)
+            if drug and drug.specs:
+                dosage.setPlaceholderText(f"如: {'、'.join(drug.specs)}")
+        
+        completer.activated.connect(on_drug_selected)
+        
         # 服用时间
         time_combo = QComboBox()
         time_combo.addItems([
@@ -794,109 +1187,40 @@ class MedicalAssistant(QMainWindow):
                     QMessageBox.warning(self, "警告", "药品名称和用法用量不能为空")
                     return
                 
-                # 添加到用药提醒表格
-                row = self.medication_list.rowCount()
-                self.medication_list.insertRow(row)
-                self.medication_list.setItem(row, 0, QTableWidgetItem(medicine_name))
-                self.medication_list.setItem(row, 1, QTableWidgetItem(dosage))
-                self.medication_list.setItem(row, 2, QTableWidgetItem(time))
-                self.medication_list.setItem(row, 3, QTableWidgetItem(notes))
+                # 保存到数据库并添加到用药提醒列表
+                reminder_id = self.reminder_model.add(medicine_name, dosage, time, notes, days)
                 
-                # 保存到数据库
-                self.cursor.execute('''
-                    INSERT INTO medication_reminders 
-                    (medicine_name, dosage, time, notes)
-                    VALUES (?, ?, ?, ?)
-                ''', (medicine_name, dosage, time, notes))
-                
-                self.db.commit()
-                
-                # 添加到系统提醒（如果需要）
-                self.schedule_medication_reminder(medicine_name, time, days)
+                # 加入提醒调度
+                self.schedule_medication_reminders([reminder_id])
                 
                 QMessageBox.information(self, "成功", "已添加用药提醒")
                 
         except Exception as e:
             QMessageBox.warning(self, "警告", f"添加用药提醒失败: {str(e)}")
 
-    def schedule_medication_reminder(self, medicine_name: str, time_str: str, days: int):
-        """设置系统用药提醒"""
-        try:
-            from datetime import datetime, timedelta
-            
-            # 根据不同操作系统设置提醒
-            system = platform.system()
-            
-            if system == "Darwin":  # macOS
-                import os
-                for day in range(days):
-                    cmd = f'''osascript -e 'display notification "请按时服用 {medicine_name}" with title "用药提醒" sound name "Glass"' '''
-                    # 使用 launchctl 设置定时任务
-                    plist_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-                    <!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
-                    <plist version="1.0">
-                    <dict>
-                        <key>Label</key>
-                        <string>com.medical.reminder.{medicine_name.replace(" ", "")}</string>
-                        <key>ProgramArguments</key>
-                        <array>
-                            <string>/usr/bin/osascript</string>
-                            <string>-e</string>
-                            <string>display notification "请按时服用 {medicine_name}" with title "用药提醒" sound name "Glass"</string>
-                        </array>
-                        <key>StartCalendarInterval</key>
-                        <dict>
-                            <key>Hour</key>
-                            <integer>9</integer>
-                            <key>Minute</key>
-                            <integer>0</integer>
-                        </dict>
-                    </dict>
-                    </plist>'''
-                    
-                    # 保存 plist 文件
-                    plist_path = os.path.expanduser(f"~/Library/LaunchAgents/com.medical.reminder.{medicine_name.replace(' ', '')}.plist")
-                    with open(plist_path, 'w') as f:
-                        f.write(plist_content)
-                    
-                    # 加载 plist
-                    os.system(f"launchctl load {plist_path}")
-                    
-            elif system == "Windows":
-                import win32com.client
-                scheduler = win32com.client.Dispatch('Schedule.Service')
-                scheduler.Connect()
-                root_folder = scheduler.GetFolder('\\')
-                task_def = scheduler.NewTask(0)
-                
-                # 创建触发器
-                start_time = datetime.now()
-                end_time = start_time + timedelta(days=days)
-                
-                TASK_TRIGGER_TIME = 1
-                trigger = task_def.Triggers.Create(TASK_TRIGGER_TIME)
-                trigger.StartBoundary = start_time.isoformat()
-                trigger.EndBoundary = end_time.isoformat()
-                
-                # 创建操作
-                TASK_ACTION_EXEC = 0
-                action = task_def.Actions.Create(TASK_ACTION_EXEC)
-                action.Path = "cmd.exe"
-                action.Arguments = f'/c msg * "请按时服用 {medicine_name}"'
-                
-                # 注册任务
-                task_name = f"MedicalReminder_{medicine_name.replace(' ', '_')}"
-                root_folder.RegisterTaskDefinition(
-                    task_name,
-                    task_def,
-                    6,  # TASK_CREATE_OR_UPDATE
-                    None,  # 用户名
-                    None,  # 密码
-                    0  # TASK_LOGON_NONE
-                )
-                
-        except Exception as e:
-            print(f"设置系统提醒失败: {str(e)}")
+    def schedule_medication_reminders(self, ids: list):
+        """把新增或修改的提醒交给应用内调度器"""
+        self.reminder_scheduler.schedule(self.reminder_model.reminders_by_id(ids))
+
+    def on_medication_due(self, reminder_id: int, medicine_name: str, dosage: str, scheduled: str, missed: int):
+        """到服药时间时通知（托盘通知不可用时显示在状态栏）"""
+        title = "用药提醒"
+        if missed > 1:
+            message = f"您错过了 {missed} 次 {medicine_name} 的服用，最近一次为 {scheduled}（{dosage}）"
+        else:
+            message = f"请按时服用 {medicine_name}（{dosage}），计划时间 {scheduled}"
+        
+        if self.reminder_tray is None and QSystemTrayIcon.isSystemTrayAvailable():
+            icon = self.windowIcon()
+            if icon.isNull():
+                icon = self.style().standardIcon(QStyle.StandardPixmap.SP_MessageBoxInformation)
+            self.reminder_tray = QSystemTrayIcon(icon, self)
+            self.reminder_tray.show()
+        
+        if self.reminder_tray is not None:
+            self.reminder_tray.showMessage(title, message)
+        self.statusBar.showMessage(f"{title}: {message}", 60000)
+        QApplication.alert(self)
 
     def create_smart_inquiry(self):
         inquiry_group = QGroupBox("智能问诊")
@@ -1039,6 +1363,9 @@ class MedicalAssistant(QMainWindow):
                         
                         # 删除病历记录
                         self.cursor.execute('DELETE FROM medical_records WHERE id = ?', (record_id,))
+                        # 索引未载入时，签名在下次载入时清理
+                        if self._case_index is not None:
+                            self._case_index.remove(record_id)
                         self.db.commit()
                         
                         # 从表格中移除
@@ -1102,56 +1429,16 @@ class MedicalAssistant(QMainWindow):
             if not file_name:
                 return
             
-            if file_name.endswith('.txt'):
-                # 导出为文本文件
-                content = f"""病历记录
-
-时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-患者信息:
-- 年龄: {self.age_input.value()}岁
-- 性别: {self.gender_combo.currentText()}
-- 身高: {self.height_input.value()}cm
-- 体重: {self.weight_input.value()}kg
-
-症状描述:
-{self.symptoms_text.toPlainText()}
-
-诊断结果:
-{self.output_text.toPlainText()}
-"""
-                with open(file_name, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-            elif file_name.endswith('.docx'):
-                from docx import Document
-                doc = Document()
-                
-                # 添加标题
-                doc.add_heading('病历记录', 0)
-                
-                # 添加时间
-                doc.add_paragraph(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                # 添加患者信息
-                doc.add_heading('患者信息', level=1)
-                info = doc.add_paragraph()
-                info.add_run(f"年龄: {self.age_input.value()}岁\n")
-                info.add_run(f"性别: {self.gender_combo.currentText()}\n")
-                info.add_run(f"身高: {self.height_input.value()}cm\n")
-                info.add_run(f"体重: {self.weight_input.value()}kg")
-                
-                # 添加症状描述
-                doc.add_heading('症状描述', level=1)
-                doc.add_paragraph(self.symptoms_text.toPlainText())
-                
-                # 添加诊断结果
-                doc.add_heading('诊断结果', level=1)
-                doc.add_paragraph(self.output_text.toPlainText())
-                
-                doc.save(file_name)
-            
-            QMessageBox.information(self, "成功", "病历记录已导出")
+            # 在界面线程读取控件内容，文件生成交给后台任务
+            record = {
+                'age': self.age_input.value(),
+                'gender': self.gender_combo.currentText(),
+                'height': self.height_input.value(),
+                'weight': self.weight_input.value(),
+                'symptoms': self.symptoms_text.toPlainText(),
+                'diagnosis': self.output_text.toPlainText()
+            }
+            self.start_export("导出病历", file_name, exporters.export_medical_record, record)
             
         except Exception as e:
             QMessageBox.critical(self, "错误", f"导出病历失败: {str(e)}")
@@ -1227,6 +1514,7 @@ class MedicalAssistant(QMainWindow):
             
             # 提取用药信息
             medications = []
+            seen_medications = set()
             patterns = [
                 # 模式1：标准格式（匹配带缩进的完整格式）
                 r"""
@@ -1270,8 +1558,11 @@ class MedicalAssistant(QMainWindow):
                     else:
                         med['notes'] = ""
                     
-                    # 检查是否已存在相同药品
-                    if not any(m['name'] == med['name'] for m in medications):
+                    # 检查是否已存在相同药品（"阿莫西林(0.25g)"与"Amoxicillin"视为同一药品，不同剂型分别保留）
+                    key = drug_normalizer.normalizer().dedupe_key(med['name'])
+                    if key not in seen_medications:
+                        seen_medications.add(key)
+                        med['name'] = drug_normalizer.normalizer().canonical(med['name'])
                         medications.append(med)
                         print(f"Added medication: {med}")  # 调试输出
             
@@ -1297,7 +1588,12 @@ class MedicalAssistant(QMainWindow):
             table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
             
             for i, med in enumerate(medications):
-                table.setItem(i, 0, QTableWidgetItem(med['name']))
+                name_item = QTableWidgetItem(med['name'])
+                # 目录中没有完全相同的药品时只提示相近的通用名，不替换
+                suggestion = drug_normalizer.normalizer().suggest(med['name'])
+                if suggestion:
+                    name_item.setToolTip(f"药品目录中未找到，相近药品：{suggestion.name}（请核对）")
+                table.setItem(i, 0, name_item)
                 table.setItem(i, 1, QTableWidgetItem(med['dosage']))
                 table.setItem(i, 2, QTableWidgetItem(med['time']))
                 table.setItem(i, 3, QTableWidgetItem(med['notes']))
@@ -1319,7 +1615,7 @@ class MedicalAssistant(QMainWindow):
                     # 填充现有数据
                     inputs['name'].setText(med['name'])
                     inputs['dosage'].setText(med['dosage'])
-                    inputs['time'].setText(med['time'])
+                    inputs['time'].setCurrentText(med['time'])
                     inputs['notes'].setText(med['notes'])
                     
                     if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -1347,23 +1643,8 @@ class MedicalAssistant(QMainWindow):
             dialog.setLayout(layout)
             
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                # 添加确认的用药信息
-                for med in medications:
-                    row = self.medication_list.rowCount()
-                    self.medication_list.insertRow(row)
-                    self.medication_list.setItem(row, 0, QTableWidgetItem(med['name']))
-                    self.medication_list.setItem(row, 1, QTableWidgetItem(med['dosage']))
-                    self.medication_list.setItem(row, 2, QTableWidgetItem(med['time']))
-                    self.medication_list.setItem(row, 3, QTableWidgetItem(med['notes']))
-                    
-                    # 保存到数据库
-                    self.cursor.execute('''
-                        INSERT INTO medication_reminders 
-                        (medicine_name, dosage, time, notes)
-                        VALUES (?, ?, ?, ?)
-                    ''', (med['name'], med['dosage'], med['time'], med['notes']))
-                
-                self.db.commit()
+                # 添加确认的用药信息（一个事务）
+                self.schedule_medication_reminders(self.reminder_model.add_many(medications))
                 QMessageBox.information(self, "成功", f"已添加 {len(medications)} 条用药提醒")
                 
         except Exception as e:
@@ -1371,79 +1652,76 @@ class MedicalAssistant(QMainWindow):
 
     def edit_medication_reminder(self):
         """编辑用药提醒"""
-        current_row = self.medication_list.currentRow()
+        current_row = self.medication_list.currentIndex().row()
         if current_row < 0:
             QMessageBox.warning(self, "警告", "请先选择要编辑的用药提醒")
             return
         
         try:
             # 获取当前选中的用药信息
-            medicine_name = self.medication_list.item(current_row, 0).text()
-            dosage = self.medication_list.item(current_row, 1).text()
-            time = self.medication_list.item(current_row, 2).text()
-            notes = self.medication_list.item(current_row, 3).text()
+            reminder = self.reminder_model.reminder(current_row)
             
             # 创建编辑对话框
             dialog, inputs = self.create_medication_dialog()
             
             # 填充现有数据
-            inputs['name'].setText(medicine_name)
-            inputs['dosage'].setText(dosage)
-            inputs['time'].setCurrentText(time)
-            inputs['notes'].setText(notes)
+            inputs['name'].setText(reminder['name'])
+            inputs['dosage'].setText(reminder['dosage'])
+            # 不在预设项中的时间（"8:00、20:00"、"bid" 等）放到自定义中，避免保存时被改成第一项
+            if inputs['time'].findText(reminder['time']) >= 0:
+                inputs['time'].setCurrentText(reminder['time'])
+            else:
+                inputs['time'].setCurrentText("自定义...")
+                inputs['custom_time'].setText(reminder['time'])
+            inputs['days'].setValue(reminder['days'] or 7)
+            inputs['notes'].setText(reminder['notes'])
             
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                # 更新表格
-                self.medication_list.setItem(current_row, 0, QTableWidgetItem(inputs['name'].text()))
-                self.medication_list.setItem(current_row, 1, QTableWidgetItem(inputs['dosage'].text()))
-                self.medication_list.setItem(current_row, 2, QTableWidgetItem(inputs['time'].currentText()))
-                self.medication_list.setItem(current_row, 3, QTableWidgetItem(inputs['notes'].toPlainText()))
+                time = inputs['time'].currentText()
+                if time == "自定义...":
+                    time = inputs['custom_time'].text()
                 
-                # 更新数据库
-                self.cursor.execute('''
-                    UPDATE medication_reminders 
-                    SET medicine_name = ?, dosage = ?, time = ?, notes = ?
-                    WHERE medicine_name = ? AND dosage = ? AND time = ?
-                ''', (
-                    inputs['name'].text(),
-                    inputs['dosage'].text(),
-                    inputs['time'].currentText(),
-                    inputs['notes'].toPlainText(),
-                    medicine_name,
-                    dosage,
-                    time
-                ))
+                # 按主键更新数据库和列表
+                self.reminder_model.update_many({reminder['id']: {
+                    'name': inputs['name'].text(),
+                    'dosage': inputs['dosage'].text(),
+                    'time': time,
+                    'days': inputs['days'].value(),
+                    'notes': inputs['notes'].toPlainText()
+                }})
+                self.schedule_medication_reminders([reminder['id']])
                 
-                self.db.commit()
                 QMessageBox.information(self, "成功", "用药提醒已更新")
                 
         except Exception as e:
             QMessageBox.warning(self, "警告", f"编辑用药提醒失败: {str(e)}")
 
+    def selected_reminder_rows(self) -> list:
+        """选中的提醒行号（没有选中时使用当前行）"""
+        rows = sorted(index.row() for index in self.medication_list.selectionModel().selectedRows())
+        if not rows and self.medication_list.currentIndex().row() >= 0:
+            rows = [self.medication_list.currentIndex().row()]
+        return rows
+
     def delete_medication_reminder(self):
         """删除用药提醒"""
-        current_row = self.medication_list.currentRow()
-        if current_row < 0:
+        rows = self.selected_reminder_rows()
+        if not rows:
             QMessageBox.warning(self, "警告", "请先选择要删除的用药提醒")
             return
         
         try:
-            medicine_name = self.medication_list.item(current_row, 0).text()
+            reminders = self.reminder_model.reminders(rows)
+            names = '、'.join(dict.fromkeys(r['name'] for r in reminders))
             if QMessageBox.question(
                 self,
                 "确认删除",
-                f"确定要删除 {medicine_name} 的用药提醒吗？"
-            ) == QMessageBox.Yes:
-                # 从数据库删除
-                self.cursor.execute('''
-                    DELETE FROM medication_reminders 
-                    WHERE medicine_name = ?
-                ''', (medicine_name,))
-                
-                self.db.commit()
-                
-                # 从表格删除
-                self.medication_list.removeRow(current_row)
+                f"确定要删除 {names} 的 {len(reminders)} 条用药提醒吗？"
+            ) == QMessageBox.StandardButton.Yes:
+                # 按主键删除并取消提醒
+                ids = [r['id'] for r in reminders]
+                self.reminder_model.remove(ids)
+                self.reminder_scheduler.cancel(ids)
                 
                 QMessageBox.information(self, "成功", "用药提醒已删除")
                 
@@ -1452,7 +1730,7 @@ class MedicalAssistant(QMainWindow):
 
     def batch_edit_medications(self):
         """批量编辑用药提醒"""
-        selected_rows = set(item.row() for item in self.medication_list.selectedItems())
+        selected_rows = self.selected_reminder_rows()
         if not selected_rows:
             QMessageBox.warning(self, "警告", "请先选择要编辑的用药提醒")
             return
@@ -1498,26 +1776,16 @@ class MedicalAssistant(QMainWindow):
             dialog.setLayout(layout)
             
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                # 更新选中的行
-                for row in selected_rows:
-                    if time_combo.currentText() != "保持原值":
-                        self.medication_list.setItem(row, 2, QTableWidgetItem(time_combo.currentText()))
-                    
-                    if notes_edit.toPlainText():
-                        self.medication_list.setItem(row, 3, QTableWidgetItem(notes_edit.toPlainText()))
-                    
-                    # 更新数据库
-                    self.cursor.execute('''
-                        UPDATE medication_reminders 
-                        SET time = ?, notes = ?
-                        WHERE medicine_name = ?
-                    ''', (
-                        time_combo.currentText() if time_combo.currentText() != "保持原值" else self.medication_list.item(row, 2).text(),
-                        notes_edit.toPlainText() if notes_edit.toPlainText() else self.medication_list.item(row, 3).text(),
-                        self.medication_list.item(row, 0).text()
-                    ))
-                
-                self.db.commit()
+                # 只写入修改过的字段，所有选中行用一条语句、一次提交
+                fields = {}
+                if time_combo.currentText() != "保持原值":
+                    fields['time'] = time_combo.currentText()
+                if notes_edit.toPlainText():
+                    fields['notes'] = notes_edit.toPlainText()
+                ids = self.reminder_model.ids(selected_rows)
+                self.reminder_model.update_fields(ids, **fields)
+                if 'time' in fields:
+                    self.schedule_medication_reminders(ids)
                 QMessageBox.information(self, "成功", f"已更新 {len(selected_rows)} 条用药提醒")
                 
         except Exception as e:
@@ -1526,17 +1794,8 @@ class MedicalAssistant(QMainWindow):
     def generate_medication_schedule(self):
         """生成用药时间表"""
         try:
-            from datetime import datetime, timedelta
-            
             # 获取所有用药信息
-            medications = []
-            for row in range(self.medication_list.rowCount()):
-                medications.append({
-                    'name': self.medication_list.item(row, 0).text(),
-                    'dosage': self.medication_list.item(row, 1).text(),
-                    'time': self.medication_list.item(row, 2).text(),
-                    'notes': self.medication_list.item(row, 3).text()
-                })
+            medications = self.reminder_model.reminders()
             
             if not medications:
                 QMessageBox.warning(self, "警告", "没有用药信息可生成时间表")
@@ -1548,57 +1807,48 @@ class MedicalAssistant(QMainWindow):
             dialog.setMinimumWidth(800)
             layout = QVBoxLayout()
             
-            # 创建日历视图
+            # 创建日历视图，选中的日期为时间表的开始日期
             calendar = QCalendarWidget()
             layout.addWidget(calendar)
             
-            # 创建时间表
-            table = QTableWidget()
-            table.setColumnCount(4)
-            table.setHorizontalHeaderLabels(['时间', '药品', '用量', '注意事项'])
+            range_layout = QHBoxLayout()
+            range_layout.addWidget(QLabel("显示天数:"))
+            days_spin = QSpinBox()
+            days_spin.setRange(1, 365)
+            days_spin.setValue(7)
+            days_spin.setSuffix(" 天")
+            range_layout.addWidget(days_spin)
+            range_layout.addStretch()
+            layout.addLayout(range_layout)
+            
+            # 创建时间表（按需加载，滚动到底部时继续生成）
+            schedule_model = ScheduleTableModel(dialog)
+            table = QTableView()
+            table.setModel(schedule_model)
+            table.verticalHeader().setVisible(False)
             
             # 设置表格列宽
-            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-            table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
-            table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
-            table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+            for column in range(4):
+                table.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+            table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+            
+            # 需要时服用的药品没有固定时间，单独列出
+            as_needed_names = [med['name'] for med in medication_schedule.as_needed(medications)]
+            as_needed_label = QLabel(f"需要时服用: {'、'.join(as_needed_names)}")
+            as_needed_label.setVisible(bool(as_needed_names))
             
             def update_schedule():
-                table.setRowCount(0)
-                current_row = 0
-                
-                for med in medications:
-                    times = []
-                    if "每日一次" in med['time']:
-                        times = ["08:00"]
-                    elif "每日两次" in med['time']:
-                        times = ["08:00", "20:00"]
-                    elif "每日三次" in med['time']:
-                        times = ["08:00", "14:00", "20:00"]
-                    elif "每日四次" in med['time']:
-                        times = ["06:00", "12:00", "18:00", "24:00"]
-                    else:
-                        # 处理自定义时间
-                        times = ["08:00"]  # 默认时间
-                    
-                    for t in times:
-                        table.insertRow(current_row)
-                        table.setItem(current_row, 0, QTableWidgetItem(t))
-                        table.setItem(current_row, 1, QTableWidgetItem(med['name']))
-                        table.setItem(current_row, 2, QTableWidgetItem(med['dosage']))
-                        table.setItem(current_row, 3, QTableWidgetItem(med['notes']))
-                        current_row += 1
-                
-                # 按时间排序
-                table.sortItems(0)
+                schedule_model.set_range(medications, calendar.selectedDate().toPyDate(), days_spin.value())
             
             # 初始更新时间表
             update_schedule()
             
             # 连接日历选择信号
             calendar.selectionChanged.connect(update_schedule)
+            days_spin.valueChanged.connect(update_schedule)
             
             layout.addWidget(table)
+            layout.addWidget(as_needed_label)
             
             # 添加导出和设置按钮
             button_layout = QHBoxLayout()
@@ -1614,27 +1864,10 @@ class MedicalAssistant(QMainWindow):
                 )
                 
                 if file_name:
+                    # 导出整个日期范围，在后台逐行生成并写入
                     selected_date = calendar.selectedDate().toString("yyyy-MM-dd")
-                    if file_name.endswith('.xlsx'):
-                        import pandas as pd
-                        data = []
-                        for row in range(table.rowCount()):
-                            data.append({
-                                '日期': selected_date,
-                                '时间': table.item(row, 0).text(),
-                                '药品': table.item(row, 1).text(),
-                                '用量': table.item(row, 2).text(),
-                                '注意事项': table.item(row, 3).text()
-                            })
-                        df = pd.DataFrame(data)
-                        df.to_excel(file_name, index=False)
-                    else:
-                        with open(file_name, 'w', encoding='utf-8') as f:
-                            f.write('日期,时间,药品,用量,注意事项\n')
-                            for row in range(table.rowCount()):
-                                f.write(f"{selected_date},{table.item(row, 0).text()},{table.item(row, 1).text()},{table.item(row, 2).text()},{table.item(row, 3).text()}\n")
-                    
-                    QMessageBox.information(dialog, "成功", "时间表已导出")
+                    self.start_export("导出时间表", file_name, exporters.export_schedule,
+                                      medications, selected_date, days_spin.value())
             
             export_btn.clicked.connect(export_schedule)
             button_layout.addWidget(export_btn)
@@ -1681,9 +1914,9 @@ class MedicalAssistant(QMainWindow):
     def check_drug_interactions(self):
         """检查药物相互作用"""
         try:
-            medications = []
-            for row in range(self.medication_list.rowCount()):
-                medications.append(self.medication_list.item(row, 0).text())
+            # 归一化为通用名后去重，同一药品的不同写法只分析一次
+            names = drug_normalizer.normalizer()
+            medications = list(dict.fromkeys(names.canonical(r['name']) for r in self.reminder_model.reminders()))
             
             if len(medications) < 2:
                 QMessageBox.information(self, "提示", "需要至少两种药物才能检查相互作用")
@@ -1733,74 +1966,24 @@ class MedicalAssistant(QMainWindow):
             if not file_name:
                 return
             
-            medications = []
-            for row in range(self.medication_list.rowCount()):
-                medications.append({
-                    'name': self.medication_list.item(row, 0).text(),
-                    'dosage': self.medication_list.item(row, 1).text(),
-                    'time': self.medication_list.item(row, 2).text(),
-                    'notes': self.medication_list.item(row, 3).text()
-                })
-            
-            if file_name.endswith('.xlsx'):
-                import pandas as pd
-                df = pd.DataFrame(medications)
-                df.to_excel(file_name, index=False)
-                
-            elif file_name.endswith('.csv'):
-                import csv
-                with open(file_name, 'w', encoding='utf-8', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=['name', 'dosage', 'time', 'notes'])
-                    writer.writeheader()
-                    writer.writerows(medications)
-                    
-            elif file_name.endswith('.ics'):
-                from icalendar import Calendar, Event
-                from datetime import datetime, timedelta
-                
-                cal = Calendar()
-                start_date = datetime.now()
-                
-                for med in medications:
-                    times = []
-                    if "每日一次" in med['time']:
-                        times = ["08:00"]
-                    elif "每日两次" in med['time']:
-                        times = ["08:00", "20:00"]
-                    elif "每日三次" in med['time']:
-                        times = ["08:00", "14:00", "20:00"]
-                    elif "每日四次" in med['time']:
-                        times = ["06:00", "12:00", "18:00", "24:00"]
-                    
-                    for t in times:
-                        event = Event()
-                        event.add('summary', f"服药提醒: {med['name']}")
-                        event.add('description', f"用量: {med['dosage']}\n注意事项: {med['notes']}")
-                        
-                        # 设置重复规则
-                        event.add('rrule', {'freq': 'daily', 'count': 30})  # 30天
-                        
-                        # 设置提醒时间
-                        hour, minute = map(int, t.split(':'))
-                        event_time = start_date.replace(hour=hour, minute=minute)
-                        event.add('dtstart', event_time)
-                        event.add('duration', timedelta(minutes=15))
-                        
-                        # 添加提醒
-                        event.add('alarm', timedelta(minutes=-15))
-                        
-                        cal.add_component(event)
-                
-                with open(file_name, 'wb') as f:
-                    f.write(cal.to_ical())
+            medications = [
+                {key: r[key] for key in ('id', 'name', 'dosage', 'time', 'notes', 'days', 'start_date')}
+                for r in self.reminder_model.reminders()
+            ]
             
-            QMessageBox.information(self, "成功", "用药提醒已导出")
+            self.start_export("导出用药提醒", file_name, exporters.export_medication_reminders,
+                              medications)
             
         except Exception as e:
             QMessageBox.warning(self, "警告", f"导出用药提醒失败: {str(e)}")
 
     def create_prescription_manager(self):
         """创建处方管理功能"""
+        from prescription_print import PrescriptionPrintCache
+        
+        # 打印排版缓存（预览重绘、缩放和打印共用）
+        self.print_cache = PrescriptionPrintCache()
+        
         prescription_group = QGroupBox("处方管理")
         layout = QVBoxLayout()
         
@@ -1815,6 +1998,10 @@ class MedicalAssistant(QMainWindow):
         self.prescription_list.horizontalHeader().setSectionResizeMode(
             QHeaderView.ResizeMode.ResizeToContents)
         
+        # 按住 Ctrl/Shift 可选择多张处方批量打印
+        self.prescription_list.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.prescription_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        
         # 按钮布局
         button_layout = QHBoxLayout()
         new_btn = QPushButton("新建处方")
@@ -1837,56 +2024,87 @@ class MedicalAssistant(QMainWindow):
         layout.addLayout(button_layout)
         prescription_group.setLayout(layout)
         
-        # 初始化数据库表
-        self.init_prescription_database()
-        
-        # 初始加载处方列表
+        # 初始加载处方列表（处方表已在 init_storage 中创建）
         self.update_prescription_list()
         
         return prescription_group
 
-    def init_prescription_database(self):
-        """初始化处方数据库"""
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS prescriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prescription_no TEXT UNIQUE,  -- 处方编号
-                type TEXT,                    -- 处方类型（普通、急诊、儿科等）
-                category TEXT,                -- 处方分类（西药、中药、中成药）
-                date TEXT,                    -- 开具日期
-                validity TEXT,                -- 有效期
-                patient_name TEXT,            -- 患者姓名
-                patient_gender TEXT,          -- 患者性别
-                patient_age INTEGER,          -- 患者年龄
-                patient_weight REAL,          -- 患者体重
-                medical_insurance TEXT,       -- 医保类型
-                diagnosis TEXT,               -- 诊断结果
-                doctor_name TEXT,             -- 医师姓名
-                doctor_title TEXT,            -- 医师职称
-                hospital_name TEXT,           -- 医疗机构名称
-                department TEXT,              -- 科室
-                status TEXT,                  -- 状态（未调配、已调配、已发药等）
-                notes TEXT                    -- 备注
-            )
-        ''')
+    def drug_completer(self, line_edit: QLineEdit) -> QCompleter:
+        """药品名称输入联想：按通用名、别名或拼音首字母前缀查询本地药品目录"""
+        completer = QCompleter(line_edit)
+        completer.setModel(QStringListModel(completer))
+        # 目录已按前缀查好，拼音首字母的结果不能再按输入文字过滤
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(12)
+        line_edit.setCompleter(completer)
+        
+        def on_text_edited(text):
+            names = [drug.name for drug in drug_catalog.catalog().complete(text)]
+            completer.model().setStringList(names)
+            if names:
+                completer.complete()
+        
+        line_edit.textEdited.connect(on_text_edited)
+        return completer
+
+    def add_medicine_row(self, medicine_table: QTableWidget, values: dict = None) -> int:
+        """在处方药品表中添加一行，values 为已有的药品信息"""
+        values = values or {}
+        row = medicine_table.rowCount()
+        medicine_table.insertRow(row)
+        
+        def editable_combo(items, text=''):
+            combo = QComboBox()
+            combo.setEditable(True)
+            combo.addItems(items)
+            combo.setCurrentText(text or (items[0] if items else ''))
+            return combo
+        
+        # 药品名称（可输入，支持联想）
+        name_combo = editable_combo([], values.get('name', ''))
+        name_combo.lineEdit().setPlaceholderText("名称或拼音首字母")
+        completer = self.drug_completer(name_combo.lineEdit())
+        medicine_table.setCellWidget(row, 0, name_combo)
+        
+        # 规格和单位按目录中的药品给出选项
+        drug = drug_catalog.catalog().get(values['name']) if values.get('name') else None
+        spec_combo = editable_combo(list(drug.specs) if drug else ['0.25g/片', '0.5g/片', '10ml/支', '5mg/片'],
+                                    values.get('specification', ''))
+        medicine_table.setCellWidget(row, 1, spec_combo)
         
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS prescription_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prescription_id INTEGER,       -- 关联处方ID
-                medicine_name TEXT,            -- 药品名称
-                specification TEXT,            -- 规格
-                dosage TEXT,                   -- 用法用量
-                frequency TEXT,                -- 频次
-                quantity REAL,                 -- 数量
-                unit TEXT,                     -- 单位
-                usage_method TEXT,             -- 用药方法
-                notes TEXT,                    -- 用药说明
-                FOREIGN KEY (prescription_id) REFERENCES prescriptions (id)
-            )
-        ''')
+        # 用法用量
+        dosage_combo = editable_combo(['1片', '2片', '5ml', '10ml'], values.get('dosage', ''))
+        medicine_table.setCellWidget(row, 2, dosage_combo)
+        
+        # 频次
+        freq_combo = editable_combo(['每日一次', '每日两次', '每日三次', '每4小时一次'], values.get('frequency', ''))
+        medicine_table.setCellWidget(row, 3, freq_combo)
+        
+        # 数量
+        quantity_spin = QSpinBox()
+        quantity_spin.setRange(1, 100)
+        quantity_spin.setValue(values.get('quantity', 1))
+        medicine_table.setCellWidget(row, 4, quantity_spin)
+        
+        # 单位
+        unit_combo = editable_combo(list(drug.units) if drug else ['片', '支', '瓶', '盒'], values.get('unit', ''))
+        medicine_table.setCellWidget(row, 5, unit_combo)
+        
+        # 用药说明
+        notes_edit = QLineEdit()
+        notes_edit.setText(values.get('notes', ''))
+        medicine_table.setCellWidget(row, 6, notes_edit)
+        
+        def on_drug_selected(name):
+            drug = drug_catalog.catalog().get(name)
+            if not drug:
+                return
+            for combo, options in ((spec_combo, drug.specs), (unit_combo, drug.units)):
+                combo.clear()
+                combo.addItems(options)
         
-        self.db.commit()
+        completer.activated.connect(on_drug_selected)
+        return row
 
     def create_new_prescription(self):
         """创建新处方"""
@@ -1996,6 +2214,8 @@ class MedicalAssistant(QMainWindow):
             medicine_layout.addWidget(medicine_table)
             medicine_info.setLayout(medicine_layout)
             
+            add_medicine_btn.clicked.connect(lambda: self.add_medicine_row(medicine_table))
+            
             # 提取诊断信息
             def extract_diagnosis():
                 try:
@@ -2078,56 +2298,23 @@ class MedicalAssistant(QMainWindow):
                             if "无抗生素推荐" in match.group(1):
                                 continue
                             
-                            # 添加到表格
-                            row = medicine_table.rowCount()
-                            medicine_table.insertRow(row)
-                            
-                            # 药品名称
-                            name_combo = QComboBox()
-                            name_combo.addItems(['阿莫西林', '布洛芬', '头孢克肟', '感冒灵'])
-                            name_combo.setCurrentText(match.group(1).strip())
-                            medicine_table.setCellWidget(row, 0, name_combo)
-                            
                             # 解析用法用量
                             dosage_parts = match.group(2).strip().split()
                             
-                            # 规格
-                            spec_combo = QComboBox()
-                            spec_combo.addItems(['0.25g/片', '0.5g/片', '10ml/支', '5mg/片'])
-                            spec_combo.setCurrentText(dosage_parts[0] if dosage_parts else '')
-                            medicine_table.setCellWidget(row, 1, spec_combo)
-                            
-                            # 用法用量
-                            dosage_combo = QComboBox()
-                            dosage_combo.addItems(['1片', '2片', '5ml', '10ml'])
-                            medicine_table.setCellWidget(row, 2, dosage_combo)
-                            
-                            # 频次
-                            freq_combo = QComboBox()
-                            freq_combo.addItems(['每日一次', '每日两次', '每日三次', '每4小时一次'])
-                            freq_combo.setCurrentText(match.group(3).strip())
-                            medicine_table.setCellWidget(row, 3, freq_combo)
-                            
-                            # 数量
-                            quantity_spin = QSpinBox()
-                            quantity_spin.setRange(1, 100)
-                            quantity_spin.setValue(1)
-                            medicine_table.setCellWidget(row, 4, quantity_spin)
-                            
-                            # 单位
-                            unit_combo = QComboBox()
-                            unit_combo.addItems(['片', '支', '瓶', '盒'])
-                            medicine_table.setCellWidget(row, 5, unit_combo)
-                            
                             # 用药说明
                             notes = ""
                             if match.group(4):  # 如果有用药说明
                                 notes = f"说明：{match.group(4)}"
                                 if match.group(5):  # 如果有注意事项
                                     notes += f"\n注意：{match.group(5)}"
-                            notes_edit = QLineEdit()
-                            notes_edit.setText(notes)
-                            medicine_table.setCellWidget(row, 6, notes_edit)
+                            
+                            # 添加到表格
+                            self.add_medicine_row(medicine_table, {
+                                'name': drug_normalizer.normalizer().canonical(match.group(1)),
+                                'specification': dosage_parts[0] if dosage_parts else '',
+                                'frequency': match.group(3).strip(),
+                                'notes': notes
+                            })
                         
                         # 如果没有匹配到任何药品，尝试使用简单模式
                         if medicine_table.rowCount() == 0:
@@ -2138,9 +2325,12 @@ class MedicalAssistant(QMainWindow):
                                     continue
                                 
                                 # 添加到表格（使用相同的添加逻辑）
-                                row = medicine_table.rowCount()
-                                medicine_table.insertRow(row)
-                                # ... (添加药品信息的代码与上面相同)
+                                dosage_parts = match.group(2).strip().split()
+                                self.add_medicine_row(medicine_table, {
+                                    'name': drug_normalizer.normalizer().canonical(match.group(1)),
+                                    'specification': dosage_parts[0] if dosage_parts else '',
+                                    'frequency': match.group(3).strip()
+                                })
                         
                         extract_dialog.accept()
                     
@@ -2251,6 +2441,9 @@ class MedicalAssistant(QMainWindow):
 
     def update_prescription_list(self):
         """更新处方列表显示"""
+        if not self.panels['prescriptions'].is_built:
+            return  # 面板构建时会加载完整列表
+        
         try:
             # 清空现有列表
             self.prescription_list.setRowCount(0)
@@ -2398,85 +2591,19 @@ class MedicalAssistant(QMainWindow):
             
             # 添加现有药品
             for item in items:
-                row = medicine_table.rowCount()
-                medicine_table.insertRow(row)
-                
-                # 药品名称
-                name_combo = QComboBox()
-                name_combo.addItems(['阿莫西林', '布洛芬', '头孢克肟', '感冒灵'])
-                name_combo.setCurrentText(item[2])  # medicine_name
-                medicine_table.setCellWidget(row, 0, name_combo)
-                
-                # 规格
-                spec_combo = QComboBox()
-                spec_combo.addItems(['0.25g/片', '0.5g/片', '10ml/支', '5mg/片'])
-                spec_combo.setCurrentText(item[3])  # specification
-                medicine_table.setCellWidget(row, 1, spec_combo)
-                
-                # 用法用量
-                dosage_combo = QComboBox()
-                dosage_combo.addItems(['1片', '2片', '5ml', '10ml'])
-                dosage_combo.setCurrentText(item[4])  # dosage
-                medicine_table.setCellWidget(row, 2, dosage_combo)
-                
-                # 频次
-                freq_combo = QComboBox()
-                freq_combo.addItems(['每日一次', '每日两次', '每日三次', '每4小时一次'])
-                freq_combo.setCurrentText(item[5])  # frequency
-                medicine_table.setCellWidget(row, 3, freq_combo)
-                
-                # 数量
-                quantity_spin = QSpinBox()
-                quantity_spin.setRange(1, 100)
-                quantity_spin.setValue(int(item[6]))  # quantity
-                medicine_table.setCellWidget(row, 4, quantity_spin)
-                
-                # 单位
-                unit_combo = QComboBox()
-                unit_combo.addItems(['片', '支', '瓶', '盒'])
-                unit_combo.setCurrentText(item[7])  # unit
-                medicine_table.setCellWidget(row, 5, unit_combo)
-                
-                # 用药说明
-                notes_edit = QLineEdit()
-                notes_edit.setText(item[9])  # notes
-                medicine_table.setCellWidget(row, 6, notes_edit)
+                self.add_medicine_row(medicine_table, {
+                    'name': item[2],           # medicine_name
+                    'specification': item[3],  # specification
+                    'dosage': item[4],         # dosage
+                    'frequency': item[5],      # frequency
+                    'quantity': int(item[6]),  # quantity
+                    'unit': item[7],           # unit
+                    'notes': item[9]           # notes
+                })
             
             # 添加药品按钮
             add_btn = QPushButton("添加药品")
-            def add_medicine_row():
-                row = medicine_table.rowCount()
-                medicine_table.insertRow(row)
-                
-                # 添加新的控件
-                name_combo = QComboBox()
-                name_combo.addItems(['阿莫西林', '布洛芬', '头孢克肟', '感冒灵'])
-                medicine_table.setCellWidget(row, 0, name_combo)
-                
-                spec_combo = QComboBox()
-                spec_combo.addItems(['0.25g/片', '0.5g/片', '10ml/支', '5mg/片'])
-                medicine_table.setCellWidget(row, 1, spec_combo)
-                
-                dosage_combo = QComboBox()
-                dosage_combo.addItems(['1片', '2片', '5ml', '10ml'])
-                medicine_table.setCellWidget(row, 2, dosage_combo)
-                
-                freq_combo = QComboBox()
-                freq_combo.addItems(['每日一次', '每日两次', '每日三次', '每4小时一次'])
-                medicine_table.setCellWidget(row, 3, freq_combo)
-                
-                quantity_spin = QSpinBox()
-                quantity_spin.setRange(1, 100)
-                medicine_table.setCellWidget(row, 4, quantity_spin)
-                
-                unit_combo = QComboBox()
-                unit_combo.addItems(['片', '支', '瓶', '盒'])
-                medicine_table.setCellWidget(row, 5, unit_combo)
-                
-                notes_edit = QLineEdit()
-                medicine_table.setCellWidget(row, 6, notes_edit)
-            
-            add_btn.clicked.connect(add_medicine_row)
+            add_btn.clicked.connect(lambda: self.add_medicine_row(medicine_table))
             
             medicine_layout.addWidget(medicine_table)
             medicine_layout.addWidget(add_btn)
@@ -2550,6 +2677,7 @@ class MedicalAssistant(QMainWindow):
                             ))
                     
                     self.db.commit()
+                    self.print_cache.invalidate(prescription_no)
                     
                     # 更新处方列表
                     self.update_prescription_list()
@@ -2602,6 +2730,7 @@ class MedicalAssistant(QMainWindow):
                 ''', (prescription_no,))
                 
                 self.db.commit()
+                self.print_cache.invalidate(prescription_no)
                 
                 # 从表格中删除
                 self.prescription_list.removeRow(current_row)
@@ -2612,135 +2741,53 @@ class MedicalAssistant(QMainWindow):
             QMessageBox.warning(self, "错误", f"删除处方失败: {str(e)}")
 
     def print_prescription(self):
-        """打印处方"""
-        current_row = self.prescription_list.currentRow()
-        if current_row < 0:
+        """打印处方（选中多张时合并为一个打印任务）"""
+        rows = sorted({index.row() for index in self.prescription_list.selectedIndexes()})
+        if not rows and self.prescription_list.currentRow() >= 0:
+            rows = [self.prescription_list.currentRow()]
+        if not rows:
             QMessageBox.warning(self, "警告", "请先选择要打印的处方")
             return
         
         try:
-            prescription_no = self.prescription_list.item(current_row, 0).text()
-            
-            # 获取处方信息
-            self.cursor.execute('''
-                SELECT p.*, i.* 
-                FROM prescriptions p
-                LEFT JOIN prescription_items i ON p.id = i.prescription_id
-                WHERE p.prescription_no = ?
-            ''', (prescription_no,))
-            
-            prescription_data = self.cursor.fetchall()
-            
-            if not prescription_data:
-                QMessageBox.warning(self, "错误", "未找到处方信息")
-                return
+            documents = []
+            for row in rows:
+                prescription_no = self.prescription_list.item(row, 0).text()
+                if prescription_no in self.print_cache:
+                    documents.append(self.print_cache.document(prescription_no))
+                    continue
+                
+                # 获取处方信息
+                self.cursor.execute('''
+                    SELECT p.*, i.* 
+                    FROM prescriptions p
+                    LEFT JOIN prescription_items i ON p.id = i.prescription_id
+                    WHERE p.prescription_no = ?
+                ''', (prescription_no,))
+                
+                prescription_data = self.cursor.fetchall()
+                
+                if not prescription_data:
+                    QMessageBox.warning(self, "错误", f"未找到处方信息: {prescription_no}")
+                    return
+                documents.append(self.print_cache.document(prescription_no, prescription_data))
             
-            # 创建打印预览
-            dialog = QPrintPreviewDialog()
-            dialog.paintRequested.connect(lambda printer: self.print_prescription_content(printer, prescription_data))
+            # 创建打印预览，重绘时直接使用已排版的文档
+            dialog = QPrintPreviewDialog(self)
+            dialog.paintRequested.connect(lambda printer: self.print_prescription_content(printer, documents))
             dialog.exec()
+            # 对话框以主窗口为父对象，关闭后释放，避免每次打印残留一个预览窗口
+            dialog.deleteLater()
             
         except Exception as e:
             QMessageBox.warning(self, "错误", f"打印处方失败: {str(e)}")
 
-    def print_prescription_content(self, printer, prescription_data):
+    def print_prescription_content(self, printer, documents):
         """打印处方内容"""
+        from prescription_print import print_documents
+        
         try:
-            painter = QPainter()
-            painter.begin(printer)
-            
-            # 设置字体
-            font = QFont("SimSun", 12)  # 使用宋体
-            painter.setFont(font)
-            
-            # 打印处方内容
-            y = 100
-            
-            # 标题
-            font.setPointSize(16)
-            painter.setFont(font)
-            painter.drawText(300, y, "处方笺")
-            
-            # 恢复字体大小
-            font.setPointSize(12)
-            painter.setFont(font)
-            
-            y += 50
-            
-            # 打印基本信息
-            basic_info = prescription_data[0]
-            painter.drawText(100, y, f"处方编号: {basic_info[1]}")
-            y += 30
-            painter.drawText(100, y, f"开具日期: {basic_info[4]}")
-            y += 30
-            painter.drawText(100, y, f"医疗机构: {basic_info[14]}")
-            y += 30
-            painter.drawText(100, y, f"科室: {basic_info[15]}")
-            y += 30
-            
-            # 患者信息
-            y += 20
-            painter.drawText(100, y, "患者信息:")
-            y += 30
-            painter.drawText(120, y, f"姓名: {basic_info[6]}    性别: {basic_info[7]}    年龄: {basic_info[8]}岁")
-            y += 30
-            painter.drawText(120, y, f"体重: {basic_info[9]}kg    医保类型: {basic_info[10]}")
-            
-            # 诊断信息
-            y += 50
-            painter.drawText(100, y, "诊断:")
-            y += 30
-            
-            # 处理多行诊断
-            diagnosis_lines = basic_info[11].split('\n')
-            for line in diagnosis_lines:
-                painter.drawText(120, y, line)
-                y += 20
-            
-            # 药品信息
-            y += 30
-            painter.drawText(100, y, "处方药品:")
-            y += 30
-            
-            # 表头
-            painter.drawText(120, y, "药品名称")
-            painter.drawText(300, y, "规格")
-            painter.drawText(400, y, "用法用量")
-            painter.drawText(500, y, "数量")
-            y += 20
-            
-            # 药品列表
-            for item in prescription_data:
-                if item[19]:  # 如果有药品信息
-                    painter.drawText(120, y, item[20])  # 药品名称
-                    painter.drawText(300, y, item[21])  # 规格
-                    painter.drawText(400, y, f"{item[22]} {item[23]}")  # 用法用量和频次
-                    painter.drawText(500, y, f"{item[24]}{item[25]}")  # 数量和单位
-                    y += 30
-                    if item[27]:  # 如果有用药说明
-                        painter.drawText(140, y, f"说明: {item[27]}")
-                        y += 20
-            
-            # 医师信息
-            y += 50
-            painter.drawText(100, y, f"医师: {basic_info[12]}    职称: {basic_info[13]}")
-            
-            # 签名和日期
-            y += 50
-            painter.drawText(100, y, "医师签名: _____________    日期: _____________")
-            
-            # 注意事项
-            y += 50
-            painter.drawText(100, y, "注意事项:")
-            y += 20
-            painter.drawText(120, y, "1. 请按医嘱用药，不得擅自加减药量或停药")
-            y += 20
-            painter.drawText(120, y, "2. 如有不适，请及时就医")
-            y += 20
-            painter.drawText(120, y, "3. 本处方仅限本次使用")
-            
-            painter.end()
-            
+            print_documents(printer, documents)
         except Exception as e:
             QMessageBox.warning(self, "错误", f"生成打印内容失败: {str(e)}")
 
@@ -2774,232 +2821,422 @@ class MedicalAssistant(QMainWindow):
             
             prescription_data = self.cursor.fetchall()
             
-            if file_name.endswith('.pdf'):
-                self.export_prescription_pdf(file_name, prescription_data)
-            else:
-                self.export_prescription_docx(file_name, prescription_data)
-            
-            QMessageBox.information(self, "成功", "处方已导出")
+            self.start_export(f"导出处方 {prescription_no}", file_name,
+                              exporters.export_prescription, prescription_data)
             
         except Exception as e:
             QMessageBox.warning(self, "错误", f"导出处方失败: {str(e)}")
 
-    def export_prescription_pdf(self, file_name: str, prescription_data: list):
-        """导出处方为PDF"""
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
-        
-        # 根据操作系统选择合适的中文字体
-        system = platform.system()
-        if system == "Darwin":  # macOS
-            try:
-                # 尝试使用苹果系统自带的中文字体
-                font_path = "/System/Library/Fonts/PingFang.ttc"
-                font_name = "PingFang"
-                pdfmetrics.registerFont(TTFont(font_name, font_path))
-            except:
-                # 如果找不到 PingFang，使用其他可能存在的字体
-                try:
-                    font_path = "/System/Library/Fonts/STHeiti Light.ttc"
-                    font_name = "STHeiti"
-                    pdfmetrics.registerFont(TTFont(font_name, font_path))
-                except:
-                    # 如果都找不到，使用默认字体
-                    font_name = "Helvetica"
-        elif system == "Windows":
-            try:
-                font_path = "C:\\Windows\\Fonts\\simsun.ttc"
-                font_name = "SimSun"
-                pdfmetrics.registerFont(TTFont(font_name, font_path))
-            except:
-                font_name = "Helvetica"
-        else:
-            font_name = "Helvetica"
-        
-        c = canvas.Canvas(file_name, pagesize=A4)
-        c.setFont(font_name, 12)
-        
-        # 添加处方内容
-        y = 800
-        c.setFont(font_name, 16)
-        c.drawString(250, y, "处方笺")
-        y -= 50
-        
-        c.setFont(font_name, 12)
-        # 基本信息
-        basic_info = prescription_data[0]
-        c.drawString(100, y, f"处方编号: {basic_info[1]}")
-        y -= 30
-        c.drawString(100, y, f"开具日期: {basic_info[4]}")
-        y -= 30
-        c.drawString(100, y, f"医疗机构: {basic_info[14]}")
-        y -= 30
-        c.drawString(100, y, f"科室: {basic_info[15]}")
-        y -= 30
-        
-        # 患者信息
-        y -= 20
-        c.drawString(100, y, "患者信息:")
-        y -= 30
-        c.drawString(120, y, f"姓名: {basic_info[6]}    性别: {basic_info[7]}    年龄: {basic_info[8]}岁")
-        y -= 30
-        c.drawString(120, y, f"体重: {basic_info[9]}kg    医保类型: {basic_info[10]}")
-        
-        # 诊断信息
-        y -= 40
-        c.drawString(100, y, "诊断:")
-        y -= 30
-        
-        # 处理多行诊断
-        diagnosis_lines = basic_info[11].split('\n')
-        for line in diagnosis_lines:
-            c.drawString(120, y, line)
-            y -= 20
-        
-        # 药品信息
-        y -= 30
-        c.drawString(100, y, "处方药品:")
-        y -= 30
-        
-        # 表头
-        c.drawString(120, y, "药品名称")
-        c.drawString(300, y, "规格")
-        c.drawString(400, y, "用法用量")
-        c.drawString(500, y, "数量")
-        y -= 20
-        
-        # 药品列表
-        for item in prescription_data:
-            if item[19]:  # 如果有药品信息
-                c.drawString(120, y, item[20])  # 药品名称
-                c.drawString(300, y, item[21])  # 规格
-                c.drawString(400, y, f"{item[22]} {item[23]}")  # 用法用量和频次
-                c.drawString(500, y, f"{item[24]}{item[25]}")  # 数量和单位
-                y -= 30
-                if item[27]:  # 如果有用药说明
-                    c.drawString(140, y, f"说明: {item[27]}")
-                    y -= 20
-        
-        # 医师信息
-        y -= 40
-        c.drawString(100, y, f"医师: {basic_info[12]}    职称: {basic_info[13]}")
-        
-        # 签名和日期
-        y -= 40
-        c.drawString(100, y, "医师签名: _____________    日期: _____________")
-        
-        # 注意事项
-        y -= 40
-        c.drawString(100, y, "注意事项:")
-        y -= 20
-        c.drawString(120, y, "1. 请按医嘱用药，不得擅自加减药量或停药")
-        y -= 20
-        c.drawString(120, y, "2. 如有不适，请及时就医")
-        y -= 20
-        c.drawString(120, y, "3. 本处方仅限本次使用")
-        
-        c.save()
-
-    def export_prescription_docx(self, file_name: str, prescription_data: list):
-        """导出处方为Word文档"""
-        from docx import Document
-        
-        doc = Document()
-        doc.add_heading('处方', 0)
-        
-        # 添加基本信息
-        basic_info = prescription_data[0]
-        doc.add_paragraph(f"处方编号: {basic_info[1]}")
-        doc.add_paragraph(f"开具日期: {basic_info[4]}")
-        doc.add_paragraph(f"患者姓名: {basic_info[6]}")
-        
-        # 添加药品信息
-        doc.add_heading('药品信息', level=1)
-        for item in prescription_data:
-            if item[19]:  # 如果有药品信息
-                doc.add_paragraph(f"{item[20]} {item[21]} {item[22]}")
-        
-        doc.save(file_name)
+    def trend_range_since(self):
+        """当前时间范围的起点（"全部"时为 None），按本地时间计算，与存储的时间戳一致"""
+        days = {'最近7天': 7, '最近30天': 30, '最近90天': 90}.get(self.range_combo.currentText())
+        return datetime.now() - timedelta(days=days) if days else None
 
     def update_health_chart(self):
         """更新健康趋势图表"""
+        if not self.panels['trends'].is_built:
+            return  # 面板构建时会加载数据
+        
         try:
-            import matplotlib.pyplot as plt
-            import matplotlib.dates as mdates
             trend_type = self.trend_type.currentText()
             time_range = self.range_combo.currentText()
             
+            from trend_widget import parse_timestamps, to_epoch
+            import numpy as np
+            
             # 根据时间范围构建查询
-            if time_range == '最近7天':
-                days = 7
-            elif time_range == '最近30天':
-                days = 30
-            elif time_range == '最近90天':
-                days = 90
-            else:
-                days = None
-            
-            if days:
-                query = '''
-                    SELECT timestamp, value 
-                    FROM health_trends 
-                    WHERE type = ? AND timestamp >= datetime('now', ?)
-                    ORDER BY timestamp
-                '''
-                params = (trend_type, f'-{days} days')
-            else:
-                query = '''
-                    SELECT timestamp, value 
-                    FROM health_trends 
-                    WHERE type = ?
-                    ORDER BY timestamp
-                '''
-                params = (trend_type,)
-            
-            # 获取数据
-            self.cursor.execute(query, params)
-            data = self.cursor.fetchall()
-            
-            # 清除当前图表
-            self.ax.clear()
-            
-            if data:
-                # 转换数据
-                dates = [datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S') for row in data]
-                values = [row[1] for row in data]
-                
-                # 绘制图表
-                self.ax.plot(dates, values, marker='o', linestyle='-', color='b', label=trend_type)
-                
-                # 设置标签
-                self.ax.set_title(f'{trend_type}趋势图')
-                self.ax.set_xlabel('日期')
-                self.ax.set_ylabel(trend_type)
-                self.ax.legend()  # 添加图例
-                
-                # 设置x轴日期格式
-                self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-                self.figure.autofmt_xdate()  # 自动旋转日期标签
-                
-                # 添加网格
-                self.ax.grid(True, linestyle='--', alpha=0.7)
-                
-                # 设置合适的刻度
-                self.ax.yaxis.set_major_locator(plt.MaxNLocator(10))
+            since = self.trend_range_since()
+            
+            # 优先使用缓存的序列
+            series = self.trend_cache.get(
+                None, trend_type, time_range, to_epoch(since) if since else None)
+            
+            if series is None:
+                if since:
+                    query = '''
+                        SELECT timestamp, value 
+                        FROM health_trends 
+                        WHERE type = ? AND timestamp >= ?
+                        ORDER BY timestamp
+                    '''
+                    params = (trend_type, since.strftime('%Y-%m-%d %H:%M:%S'))
+                else:
+                    query = '''
+                        SELECT timestamp, value 
+                        FROM health_trends 
+                        WHERE type = ?
+                        ORDER BY timestamp
+                    '''
+                    params = (trend_type,)
+                
+                # 获取数据
+                self.cursor.execute(query, params)
+                data = self.cursor.fetchall()
+                
+                times = parse_timestamps([row[0] for row in data])
+                values = np.array([row[1] for row in data], dtype=np.float64)
+                self.trend_cache.put(None, trend_type, time_range, times, values)
             else:
-                self.ax.text(0.5, 0.5, '暂无数据', 
-                            horizontalalignment='center',
-                            verticalalignment='center',
-                            transform=self.ax.transAxes)
+                times, values = series
             
-            # 刷新画布
-            self.canvas.draw()
+            # 交给趋势图绘制
+            self.trend_chart.set_series(trend_type, times, values)
             
+            # 在提示中显示缓存命中情况
+            stats = self.trend_cache.stats()
+            self.trend_chart.setToolTip(
+                f"缓存命中 {stats['hits']} / 未命中 {stats['misses']}"
+                f"（{stats['entries']} 条序列，{stats['bytes'] // 1024} KB）"
+            )
+            
+        except Exception as e:
+            print(f"更新图表失败: {str(e)}")
+
+    def on_health_trend_added(self, trend_type: str, timestamp: datetime, value: float):
+        """新数据写入后同步更新缓存，并在属于当前类型时直接追加到图表"""
+        if not self.panels['trends'].is_built:
+            return  # 面板构建时会从数据库加载
+        
+        from trend_widget import to_epoch
+        
+        # health_trends 目前不区分患者，缓存的患者键统一为 None
+        self.trend_cache.append(None, trend_type, to_epoch(timestamp), value)
+        
+        try:
+            if trend_type == self.trend_type.currentText():
+                self.trend_chart.append(timestamp, value)
         except Exception as e:
             print(f"更新图表失败: {str(e)}")
 
+    def import_health_data(self):
+        """从血糖仪、血压计、体重秤导出的 CSV/JSON 文件批量导入健康数据"""
+        from health_import import import_file
+        
+        if self.health_import_running:
+            QMessageBox.warning(self, "警告", "已有设备数据正在导入，请等待完成")
+            return
+        
+        file_name, _ = QFileDialog.getOpenFileName(
+            self,
+            "导入设备数据",
+            "",
+            "设备导出文件 (*.csv *.json *.jsonl);;All Files (*)"
+        )
+        
+        if not file_name:
+            return
+        
+        def on_done():
+            self.health_import_running = False
+            # 导入结束（含失败、取消时已写入的部分）后统一刷新缓存和图表
+            if self.panels['trends'].is_built:
+                self.trend_cache.invalidate()
+                self.update_health_chart()
+        
+        # 在后台线程中用独立的数据库连接导入，按块提交
+        self.health_import_running = True
+        self.start_export("导入设备数据", file_name, import_file, self.db_path, atomic=False, on_done=on_done)
+
+    def toggle_device_ingest(self, enabled: bool):
+        """启动或停止本地设备数据接入服务"""
+        from device_ingest import DeviceIngestServer, DEFAULT_HOST, DEFAULT_PORT
+        
+        try:
+            if enabled:
+                config = self.analyzer.load_config().get('ingest') or {}
+                self.ingest_server = DeviceIngestServer(
+                    self.db_path,
+                    host=config.get('host', DEFAULT_HOST),
+                    port=config.get('port', DEFAULT_PORT),
+                    on_flush=self.readings_ingested.emit
+                )
+                self.ingest_server.start()
+                self.statusBar.showMessage(f"设备数据接入服务已启动: {self.ingest_server.url}")
+            elif self.ingest_server:
+                self.ingest_server.stop()
+                self.ingest_server = None
+                self.statusBar.showMessage("设备数据接入服务已停止")
+        
+        except Exception as e:
+            self.ingest_server = None
+            self.ingest_action.blockSignals(True)
+            self.ingest_action.setChecked(False)
+            self.ingest_action.blockSignals(False)
+            QMessageBox.warning(self, "错误", f"启动设备接入服务失败: {str(e)}")
+
+    def on_readings_ingested(self, readings: list):
+        """设备数据写入数据库后更新缓存，图表刷新合并到下一帧"""
+        if not self.panels['trends'].is_built:
+            return  # 面板构建时会从数据库加载
+        
+        from trend_widget import parse_timestamps
+        
+        by_type = {}
+        for timestamp, trend_type, value in readings:
+            by_type.setdefault(trend_type, []).append((timestamp, value))
+        
+        for trend_type, rows in by_type.items():
+            times = parse_timestamps([row[0] for row in rows])
+            self.trend_cache.append_many(None, trend_type, times, [row[1] for row in rows])
+        
+        # 设备可能补传旧数据，早于当前时间范围的不追加到图表
+        since = self.trend_range_since()
+        since = since.strftime('%Y-%m-%d %H:%M:%S') if since else ''
+        self.pending_chart_readings.extend(
+            row for row in by_type.get(self.trend_type.currentText(), []) if row[0] >= since
+        )
+        if not self.chart_refresh_timer.isActive():
+            self.chart_refresh_timer.start()
+
+    def flush_pending_chart_readings(self):
+        """把累积的实时数据一次性追加到图表"""
+        from trend_widget import parse_timestamps
+        import numpy as np
+        
+        pending, self.pending_chart_readings = self.pending_chart_readings, []
+        if pending:
+            times = parse_timestamps([row[0] for row in pending])
+            values = np.array([row[1] for row in pending], dtype=np.float64)
+            self.trend_chart.append_many(times, values)
+        
+        if self.ingest_server:
+            stats = self.ingest_server.stats()
+            self.statusBar.showMessage(
+                f"设备接入: 已接收 {stats['received']} 条，已写入 {stats['written']} 条"
+            )
+
+    def export_health_chart(self):
+        """使用 matplotlib 导出当前趋势图"""
+        from trend_widget import from_epoch
+        
+        file_name, _ = QFileDialog.getSaveFileName(
+            self,
+            "导出图表",
+            f"{self.trend_type.currentText()}趋势图",
+            "PNG图片 (*.png);;PDF文件 (*.pdf);;SVG图片 (*.svg)"
+        )
+        
+        if not file_name:
+            return
+        
+        try:
+            try:
+                from health_chart import export_trend_chart
+            except ImportError:
+                # 未安装 matplotlib 时直接保存当前控件截图
+                if not self.trend_chart.grab().save(file_name):
+                    raise Exception("未安装 matplotlib，仅支持导出 PNG 图片")
+                QMessageBox.information(self, "成功", "图表已导出")
+            else:
+                dates = [from_epoch(t) for t in self.trend_chart.times]
+                self.start_export("导出图表", file_name, export_trend_chart,
+                                  self.trend_chart.trend_type, dates,
+                                  self.trend_chart.values.tolist())
+            
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"导出图表失败: {str(e)}")
+
+    def bulk_export_prescriptions(self):
+        """按日期范围和科室批量导出处方 PDF"""
+        from bulk_export import export_prescriptions, list_departments
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("批量导出处方")
+        layout = QFormLayout(dialog)
+        
+        start_date = QDateEdit(QDate.currentDate().addMonths(-1))
+        start_date.setCalendarPopup(True)
+        end_date = QDateEdit(QDate.currentDate())
+        end_date.setCalendarPopup(True)
+        layout.addRow("开始日期:", start_date)
+        layout.addRow("结束日期:", end_date)
+        
+        department = QComboBox()
+        department.addItem("全部科室")
+        department.addItems(list_departments(self.db))
+        layout.addRow("科室:", department)
+        
+        mode = QComboBox()
+        mode.addItems(["每份处方单独一个文件", "合并为一个 PDF"])
+        layout.addRow("导出方式:", mode)
+        
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addRow(buttons)
+        
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        
+        merged = mode.currentIndex() == 1
+        if merged:
+            target, _ = QFileDialog.getSaveFileName(self, "导出处方", "处方汇总.pdf", "PDF文件 (*.pdf)")
+        else:
+            target = QFileDialog.getExistingDirectory(self, "选择导出目录")
+        if not target:
+            return
+        
+        self.start_export(
+            "批量导出处方", target, export_prescriptions, self.db_path,
+            start_date.date().toString("yyyy-MM-dd"),
+            end_date.date().toString("yyyy-MM-dd"),
+            department.currentText() if department.currentIndex() > 0 else None,
+            merged,
+            atomic=merged
+        )
+
+    def regroup_medical_records(self):
+        """在后台按本地 DRG 规则重新分组某一年的病历"""
+        year, ok = QInputDialog.getInt(
+            self, "DRG 批量分组", "分组年份（0 为全部病历）:",
+            QDate.currentDate().year(), 0, 9999
+        )
+        if not ok:
+            return
+        
+        # 结果写入数据库，不生成文件
+        self.start_export("DRG 批量分组", self.db_path, drg_grouper.regroup_records, year or None, atomic=False)
+
+    def show_ai_usage(self):
+        """AI 调用统计：各模型的延迟分位数、每日用量和按诊所/患者的费用"""
+        try:
+            # 先等待尚未写入的调用记录（数据库被锁定时不一直等待）
+            if self._analyzer is not None and self._analyzer.metering is not None:
+                if not self._analyzer.metering.flush():
+                    self.statusBar.showMessage("部分AI调用记录尚未写入，统计可能不完整", 5000)
+            
+            dialog = QDialog(self)
+            dialog.setWindowTitle("AI 调用统计")
+            dialog.setMinimumSize(800, 500)
+            layout = QVBoxLayout()
+            
+            range_layout = QHBoxLayout()
+            range_layout.addWidget(QLabel("统计最近"))
+            days_input = QSpinBox()
+            days_input.setRange(0, 3650)
+            days_input.setValue(30)
+            days_input.setSpecialValueText("全部")
+            days_input.setSuffix(" 天")
+            range_layout.addWidget(days_input)
+            range_layout.addStretch()
+            layout.addLayout(range_layout)
+            
+            tabs = QTabWidget()
+            layout.addWidget(tabs)
+            
+            def ms(value):
+                return '-' if value is None else f"{value:.0f}"
+            
+            # (标签, 查询, [(表头, 取值)])
+            counts = [("调用次数", lambda r: r['calls']), ("提示tokens", lambda r: r['prompt_tokens']),
+                      ("生成tokens", lambda r: r['completion_tokens']), ("费用", lambda r: f"{r['cost']:.4f}")]
+            views = [
+                ("延迟", lambda days: ai_metering.latency_stats(self.db, days), [
+                    ("模型", lambda r: r['provider']), ("调用次数", lambda r: r['calls']),
+                    ("失败", lambda r: r['errors']), ("重试", lambda r: r['retries']),
+                    ("p50 (ms)", lambda r: ms(r['p50_ms'])), ("p95 (ms)", lambda r: ms(r['p95_ms'])),
+                    ("首字 p50 (ms)", lambda r: ms(r['ttft_p50_ms'])),
+                    ("首字 p95 (ms)", lambda r: ms(r['ttft_p95_ms']))]),
+                ("每日用量", lambda days: ai_metering.daily_tokens(self.db, days), [
+                    ("日期", lambda r: r['day']), ("模型", lambda r: r['provider']),
+                    ("调用次数", lambda r: r['calls']), ("提示tokens", lambda r: r['prompt_tokens']),
+                    ("生成tokens", lambda r: r['completion_tokens']), ("缓存命中", lambda r: r['cached_tokens']),
+                    ("费用", lambda r: f"{r['cost']:.4f}")]),
+                ("按诊所", lambda days: ai_metering.cost_by(self.db, 'clinic', days),
+                 [("诊所", lambda r: r['clinic'])] + counts),
+                ("按患者", lambda days: ai_metering.cost_by(self.db, 'patient', days),
+                 [("患者", lambda r: r['patient'])] + counts),
+                ("按用途", lambda days: ai_metering.cost_by(self.db, 'purpose', days),
+                 [("用途", lambda r: r['purpose'])] + counts),
+            ]
+            tables = []
+            for title, _, columns in views:
+                table = QTableWidget()
+                table.setColumnCount(len(columns))
+                table.setHorizontalHeaderLabels([header for header, _ in columns])
+                table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+                table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+                tabs.addTab(table, title)
+                tables.append(table)
+            
+            def refresh():
+                days = days_input.value() or None
+                for table, (_, query, columns) in zip(tables, views):
+                    rows = query(days)
+                    table.setRowCount(len(rows))
+                    for i, row in enumerate(rows):
+                        for j, (_, value) in enumerate(columns):
+                            table.setItem(i, j, QTableWidgetItem(str(value(row))))
+            
+            days_input.valueChanged.connect(refresh)
+            refresh()
+            
+            close_btn = QPushButton("关闭")
+            close_btn.clicked.connect(dialog.accept)
+            layout.addWidget(close_btn)
+            
+            dialog.setLayout(layout)
+            dialog.exec()
+            
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取AI调用统计失败: {str(e)}")
+
+    def start_export(self, title: str, file_name: str, writer, *args, atomic: bool = True, on_done=None):
+        """提交后台导出任务，并在状态栏显示进度和取消按钮
+
+        on_done 在任务结束（完成、失败或取消）后于界面线程中调用。
+        """
+        job = self.export_jobs.submit(title, file_name, writer, *args, atomic=atomic)
+        widget = ExportJobWidget(job, self.export_jobs)
+        self.export_widgets[job.id] = (job.title, widget)
+        if on_done:
+            self.export_callbacks[job.id] = on_done
+        self.statusBar.addPermanentWidget(widget)
+
+    def on_export_progress(self, job_id: int, fraction: float):
+        if job_id in self.export_widgets:
+            self.export_widgets[job_id][1].set_progress(fraction)
+
+    def finish_export(self, job_id: int) -> str:
+        """移除状态栏中的任务控件，返回任务名称"""
+        title, widget = self.export_widgets.pop(job_id, ("导出", None))
+        if widget:
+            self.statusBar.removeWidget(widget)
+            widget.deleteLater()
+        on_done = self.export_callbacks.pop(job_id, None)
+        if on_done:
+            on_done()
+        return title
+
+    def on_export_finished(self, job_id: int, file_name: str, summary: str):
+        title = self.finish_export(job_id)
+        if summary:
+            QMessageBox.information(self, "成功", f"{title}完成: {file_name}\n{summary}")
+        else:
+            self.statusBar.showMessage(f"{title}完成: {file_name}", 5000)
+
+    def on_export_failed(self, job_id: int, message: str):
+        title = self.finish_export(job_id)
+        QMessageBox.warning(self, "错误", f"{title}失败: {message}")
+
+    def on_export_cancelled(self, job_id: int):
+        title = self.finish_export(job_id)
+        self.statusBar.showMessage(f"{title}已取消", 5000)
+
+    def closeEvent(self, event):
+        """关闭窗口前停止后台服务"""
+        self.cancel_analysis_stream()
+        if self._analyzer is not None and self._analyzer.metering is not None:
+            self._analyzer.metering.close()
+        if self.ingest_server:
+            self.ingest_server.stop()
+            self.ingest_server = None
+        self.export_jobs.shutdown()
+        self.reminder_scheduler.stop()
+        super().closeEvent(event)
+
     def show_tutorial(self):
         QMessageBox.information(self, "欢迎使用", "这是一个AI 医疗助手应用- AI安全工坊出品（微信公众号搜索关注），您可以通过以下功能进行操作：\n1. 输入患者信息\n2. 描述症状\n3. 获取诊断结果\n4. 管理用药提醒\n5. 查看健康趋势")
 
@@ -3039,6 +3276,8 @@ class MedicalAssistant(QMainWindow):
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    profiler.attach(app, MedicalAssistant)
+    watchdog = install_watchdog(MedicalAssistant)
     
     # 设置应用样式
     app.setStyle("Fusion")
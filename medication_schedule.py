@@ -0,0 +1,60 @@
+"""多日用药时间表
+
+把所有用药方案在一个日期范围内的服药时间按时间顺序合并。每个方案由
+dose_rules 逐个生成服药时间，heapq.merge 每次只比较各方案的下一次服药，
+整个时间表从不一次展开到内存中，界面按需读取、导出逐行写入。
+"""
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dose_rules import parse_usage
+
+# (服药时间, 药品名称, 用法用量, 注意事项)
+Dose = Tuple[datetime, str, str, str]
+
+
+def _doses(med: Dict[str, Any], begin: datetime, end: datetime) -> Iterator[Dose]:
+    rule = parse_usage(med['time'])
+    start = date.fromisoformat(med['start_date']) if med.get('start_date') else begin
+    for when in rule.occurrences(start, med.get('days'), after=begin - timedelta(microseconds=1), until=end):
+        yield when, med['name'], med['dosage'], med['notes']
+
+
+def iter_schedule(medications: List[Dict[str, Any]], start: date, days: int) -> Iterator[Dose]:
+    """按时间顺序产出 start 起 days 天内所有方案的服药
+
+    medications 每项包含 name/dosage/time/notes/days/start_date；没有开始日期的
+    方案视为从 start 开始。需要时服用的方案没有固定时间，不出现在时间表中。
+    """
+    begin = datetime(start.year, start.month, start.day)
+    end = begin + timedelta(days=days, microseconds=-1)
+    streams = [_doses(med, begin, end) for med in medications]
+    # 时间相同时按方案顺序（merge 对相等的键保持输入顺序）
+    return heapq.merge(*streams, key=lambda dose: dose[0])
+
+
+def as_needed(medications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """需要时服用的方案（时间表下方单独列出）"""
+    return [med for med in medications if parse_usage(med['time']).as_needed]
+
+
+def count_doses(medications: List[Dict[str, Any]], start: date, days: int) -> int:
+    """时间范围内的服药次数，用于导出进度；按天计算而不逐次展开"""
+    begin = datetime(start.year, start.month, start.day)
+    total = 0
+    for med in medications:
+        rule = parse_usage(med['time'])
+        if not rule.minutes:
+            continue
+        med_start = datetime.fromisoformat(med['start_date']) if med.get('start_date') else begin
+        course = rule.total_days(med.get('days'))
+        first = max(0, (begin - med_start).days)
+        last = (begin - med_start).days + days
+        if course is not None:
+            last = min(last, course)
+        # first..last-1 中是 every_days 倍数的天数
+        if last > first:
+            step = rule.every_days
+            total += len(rule.minutes) * ((last - 1) // step - (first - 1) // step)
+    return total
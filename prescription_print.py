@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from html import escape
+from typing import Dict, List, Optional
+
+from PyQt6.QtCore import QRectF, QSizeF
+from PyQt6.QtGui import QImage, QPainter, QTextDocument
+from PyQt6.QtPrintSupport import QPrinter
+
+# 打印时依次尝试的中文字体
+FONT_FAMILY = "'SimSun', 'Songti SC', 'Noto Serif CJK SC', 'Noto Sans CJK SC', serif"
+
+# 排版用的绘图设备（按分辨率）。打印机随预览对话框一起销毁，缓存的文档
+# 不能绑定在打印机上，改为绑定到同分辨率、一直存在的 QImage
+_LAYOUT_DEVICES: Dict[int, QImage] = {}
+
+
+def _text(value) -> str:
+    return escape('' if value is None else str(value))
+
+
+def prescription_html(prescription_data: list) -> str:
+    """生成处方笺的排版 HTML（与导出 PDF 的栏目一致）"""
+    basic_info = prescription_data[0]
+    diagnosis = '<br>'.join(_text(line) for line in (basic_info[11] or '').split('\n'))
+
+    rows = []
+    for item in prescription_data:
+        if item[19]:  # 如果有药品信息
+            rows.append(f"""
+                <tr>
+                    <td>{_text(item[20])}</td>
+                    <td>{_text(item[21])}</td>
+                    <td>{_text(item[22])} {_text(item[23])}</td>
+                    <td>{_text(item[24])}{_text(item[25])}</td>
+                </tr>""")
+            if item[27]:  # 如果有用药说明
+                rows.append(f"""
+                <tr><td colspan="4" class="note">说明: {_text(item[27])}</td></tr>""")
+
+    return f"""
+    <html>
+    <head><style>
+        body {{ font-family: {FONT_FAMILY}; font-size: 12pt; }}
+        h1 {{ font-size: 16pt; text-align: center; }}
+        table {{ border-collapse: collapse; }}
+        td, th {{ padding: 4px; }}
+        th {{ text-align: left; border-bottom: 1px solid black; }}
+        .note {{ padding-left: 24px; color: #333333; }}
+        .section {{ margin-top: 12px; font-weight: bold; }}
+    </style></head>
+    <body>
+        <h1>处方笺</h1>
+        <table width="100%">
+            <tr><td>处方编号: {_text(basic_info[1])}</td><td>开具日期: {_text(basic_info[4])}</td></tr>
+            <tr><td>医疗机构: {_text(basic_info[14])}</td><td>科室: {_text(basic_info[15])}</td></tr>
+        </table>
+        <hr>
+        <p class="section">患者信息:</p>
+        <table width="100%">
+            <tr>
+                <td>姓名: {_text(basic_info[6])}</td>
+                <td>性别: {_text(basic_info[7])}</td>
+                <td>年龄: {_text(basic_info[8])}岁</td>
+                <td>体重: {_text(basic_info[9])}kg</td>
+            </tr>
+            <tr><td colspan="4">医保类型: {_text(basic_info[10])}</td></tr>
+        </table>
+        <p class="section">诊断:</p>
+        <p>{diagnosis}</p>
+        <p class="section">处方药品:</p>
+        <table width="100%">
+            <tr><th>药品名称</th><th>规格</th><th>用法用量</th><th>数量</th></tr>
+            {''.join(rows)}
+        </table>
+        <hr>
+        <p>医师: {_text(basic_info[12])}&nbsp;&nbsp;&nbsp;&nbsp;职称: {_text(basic_info[13])}</p>
+        <p>医师签名: _____________&nbsp;&nbsp;&nbsp;&nbsp;日期: _____________</p>
+        <p class="section">注意事项:</p>
+        <p>1. 请按医嘱用药，不得擅自加减药量或停药<br>
+           2. 如有不适，请及时就医<br>
+           3. 本处方仅限本次使用</p>
+    </body>
+    </html>
+    """
+
+
+class PrescriptionPrintCache:
+    """按处方编号缓存排版好的 QTextDocument
+
+    HTML 只解析一次；纸张大小不变时版面也只计算一次，打印预览缩放、重绘
+    和实际打印都直接复用。处方修改或删除后需调用 invalidate。
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._documents: "OrderedDict[str, QTextDocument]" = OrderedDict()
+
+    def __contains__(self, prescription_no: str) -> bool:
+        return prescription_no in self._documents
+
+    def document(self, prescription_no: str, prescription_data: Optional[list] = None) -> QTextDocument:
+        """返回缓存的文档；未缓存时用 prescription_data 排版"""
+        doc = self._documents.get(prescription_no)
+        if doc is not None:
+            self._documents.move_to_end(prescription_no)
+            return doc
+
+        doc = QTextDocument()
+        doc.setHtml(prescription_html(prescription_data))
+        self._documents[prescription_no] = doc
+        while len(self._documents) > self.max_entries:
+            self._documents.popitem(last=False)
+        return doc
+
+    def invalidate(self, prescription_no: Optional[str] = None):
+        """使某张处方（不带参数时全部）的排版失效"""
+        if prescription_no is None:
+            self._documents.clear()
+        else:
+            self._documents.pop(prescription_no, None)
+
+
+def _layout_device(resolution: int) -> QImage:
+    device = _LAYOUT_DEVICES.get(resolution)
+    if device is None:
+        device = QImage(1, 1, QImage.Format.Format_RGB32)
+        dots = round(resolution / 0.0254)
+        device.setDotsPerMeterX(dots)
+        device.setDotsPerMeterY(dots)
+        _LAYOUT_DEVICES[resolution] = device
+    return device
+
+
+def _layout_for(doc: QTextDocument, printer: QPrinter) -> QSizeF:
+    """按打印机页面大小排版；纸张和分辨率不变时不重新排版"""
+    page = printer.pageLayout().paintRectPixels(printer.resolution())
+    size = QSizeF(page.width(), page.height())
+    layout = doc.documentLayout()
+    device = _layout_device(printer.resolution())
+    if layout.paintDevice() is not device:
+        layout.setPaintDevice(device)
+        doc.setPageSize(size)
+    elif doc.pageSize() != size:
+        doc.setPageSize(size)
+    return size
+
+
+def print_documents(printer: QPrinter, documents: List[QTextDocument]):
+    """把多张处方依次打印到同一个打印任务中，每张处方从新页开始"""
+    painter = QPainter()
+    if not painter.begin(printer):
+        raise RuntimeError("无法开始打印")
+    try:
+        first = True
+        for doc in documents:
+            size = _layout_for(doc, printer)
+            for page in range(doc.pageCount()):
+                if not first:
+                    printer.newPage()
+                first = False
+                painter.save()
+                painter.translate(0, -page * size.height())
+                doc.drawContents(painter, QRectF(0, page * size.height(), size.width(), size.height()))
+                painter.restore()
+    finally:
+        painter.end()
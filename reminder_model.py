@@ -0,0 +1,336 @@
+import itertools
+import sqlite3
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from medication_schedule import iter_schedule
+
+# 未指定时的服用天数（与添加对话框的默认值一致）
+DEFAULT_DAYS = 7
+
+# SQLite 单条语句的参数个数上限较低，IN (...) 按块拆分
+MAX_SQL_VARIABLES = 900
+
+
+def _chunks(ids: List[int], size: int = MAX_SQL_VARIABLES) -> Iterable[List[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class ReminderTableModel(QAbstractTableModel):
+    """用药提醒列表模型
+
+    启动时从 medication_reminders 表按主键加载，每行记录数据库 id；
+    修改和删除都按 id 进行，并在一个事务中用集合式语句完成。
+    """
+
+    # (数据库列名, 字典键, 表头)
+    COLUMNS = [
+        ('medicine_name', 'name', '药品名称'),
+        ('dosage', 'dosage', '用法用量'),
+        ('time', 'time', '服用时间'),
+        ('notes', 'notes', '注意事项')
+    ]
+    # 不显示但可修改的列：服用天数和开始日期供提醒调度使用
+    FIELDS = {key: column for column, key, _ in COLUMNS}
+    FIELDS.update(days='days', start_date='start_date')
+
+    def __init__(self, db: sqlite3.Connection, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._rows: List[Dict[str, Any]] = []
+        self._index: Dict[int, int] = {}  # id -> 行号
+
+    def load(self):
+        """从数据库重新加载全部提醒"""
+        rows = self.db.execute('''
+            SELECT id, medicine_name, dosage, time, notes, days, start_date
+            FROM medication_reminders
+            ORDER BY id
+        ''').fetchall()
+        self.beginResetModel()
+        self._rows = [
+            {'id': row[0], 'name': row[1] or '', 'dosage': row[2] or '',
+             'time': row[3] or '', 'notes': row[4] or '', 'days': row[5], 'start_date': row[6]}
+            for row in rows
+        ]
+        self._reindex()
+        self.endResetModel()
+
+    def _reindex(self):
+        self._index = {reminder['id']: row for row, reminder in enumerate(self._rows)}
+
+    # Qt 模型接口
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self._rows[index.row()][self.COLUMNS[index.column()][1]]
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section][2]
+        return super().headerData(section, orientation, role)
+
+    # 读取
+    def reminder(self, row: int) -> Dict[str, Any]:
+        return dict(self._rows[row])
+
+    def reminders(self, rows: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """返回指定行（默认全部）的提醒副本"""
+        if rows is None:
+            return [dict(reminder) for reminder in self._rows]
+        return [dict(self._rows[row]) for row in rows]
+
+    def reminders_by_id(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        return [dict(self._rows[self._index[i]]) for i in ids if i in self._index]
+
+    def ids(self, rows: Iterable[int]) -> List[int]:
+        return [self._rows[row]['id'] for row in rows]
+
+    # 写入（每个方法一次提交）
+    def add_many(self, reminders: List[Dict[str, Any]]) -> List[int]:
+        """批量新增提醒（从今天开始），返回新记录的 id"""
+        if not reminders:
+            return []
+        now = datetime.now()
+        rows = [{'name': reminder['name'], 'dosage': reminder['dosage'], 'time': reminder['time'],
+                 'notes': reminder['notes'], 'days': reminder.get('days') or DEFAULT_DAYS,
+                 'start_date': reminder.get('start_date') or now.strftime('%Y-%m-%d')}
+                for reminder in reminders]
+        cursor = self.db.cursor()
+        try:
+            for row in rows:
+                # last_fired 记为创建时间，之前的服药时间不补发提醒
+                cursor.execute('''
+                    INSERT INTO medication_reminders
+                    (medicine_name, dosage, time, notes, days, start_date, last_fired)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (row['name'], row['dosage'], row['time'], row['notes'], row['days'],
+                      row['start_date'], now.strftime('%Y-%m-%d %H:%M')))
+                row['id'] = cursor.lastrowid
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        self._reindex()
+        self.endInsertRows()
+        return [row['id'] for row in rows]
+
+    def add(self, name: str, dosage: str, time: str, notes: str, days: Optional[int] = None) -> int:
+        return self.add_many([{'name': name, 'dosage': dosage, 'time': time, 'notes': notes, 'days': days}])[0]
+
+    def update_fields(self, ids: List[int], **fields: str):
+        """把同样的字段值写入多条提醒：UPDATE ... SET ... WHERE id IN (...)"""
+        fields = {key: value for key, value in fields.items() if key in self.FIELDS}
+        if not ids or not fields:
+            return
+
+        assignments = ', '.join(f"{self.FIELDS[key]} = ?" for key in fields)
+        try:
+            for chunk in _chunks(ids, MAX_SQL_VARIABLES - len(fields)):
+                placeholders = ', '.join('?' * len(chunk))
+                self.db.execute(f'''
+                    UPDATE medication_reminders SET {assignments}
+                    WHERE id IN ({placeholders})
+                ''', [*fields.values(), *chunk])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        self._apply({reminder_id: fields for reminder_id in ids})
+
+    def update_many(self, updates: Dict[int, Dict[str, str]]):
+        """每条提醒写入各自的值（executemany，一次提交）"""
+        if not updates:
+            return
+        keys = list(self.FIELDS)
+        assignments = ', '.join(f"{column} = ?" for column in self.FIELDS.values())
+        try:
+            self.db.executemany(f'''
+                UPDATE medication_reminders SET {assignments}
+                WHERE id = ?
+            ''', [
+                [values.get(key, self._rows[self._index[reminder_id]][key]) for key in keys] + [reminder_id]
+                for reminder_id, values in updates.items()
+            ])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        self._apply(updates)
+
+    def remove(self, ids: List[int]):
+        """删除多条提醒：DELETE ... WHERE id IN (...)"""
+        if not ids:
+            return
+        try:
+            for chunk in _chunks(ids):
+                placeholders = ', '.join('?' * len(chunk))
+                self.db.execute(f'DELETE FROM medication_reminders WHERE id IN ({placeholders})', chunk)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        for row in sorted((self._index[i] for i in ids if i in self._index), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+        self._reindex()
+
+    def _apply(self, updates: Dict[int, Dict[str, str]]):
+        """更新内存中的行并通知视图"""
+        rows = []
+        for reminder_id, values in updates.items():
+            row = self._index.get(reminder_id)
+            if row is not None:
+                self._rows[row].update(values)
+                rows.append(row)
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0),
+                                  self.index(max(rows), len(self.COLUMNS) - 1))
+
+
+class ScheduleTableModel(QAbstractTableModel):
+    """多日用药时间表模型
+
+    服药时间由生成器按时间顺序产生，视图滚动到末尾时才通过 fetchMore
+    继续读取下一批，不会预先展开整个日期范围。
+    """
+
+    HEADERS = ['日期', '时间', '药品', '用量', '注意事项']
+    BATCH_SIZE = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: List[tuple] = []
+        self._doses = iter(())
+        self._exhausted = True
+
+    def set_range(self, medications: List[Dict[str, Any]], start: date, days: int):
+        self.beginResetModel()
+        self._rows = []
+        self._doses = iter_schedule(medications, start, days)
+        self._exhausted = False
+        self.endResetModel()
+        # 先取一屏
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        batch = [
+            (when.strftime('%Y-%m-%d'), when.strftime('%H:%M'), name, dosage, notes)
+            for when, name, dosage, notes in itertools.islice(self._doses, self.BATCH_SIZE)
+        ]
+        if len(batch) < self.BATCH_SIZE:
+            self._exhausted = True
+        if not batch:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+        self._rows.extend(batch)
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+
+class PendingMedicationModel(QAbstractTableModel):
+    """待确认的用药条目
+
+    分析结果生成过程中逐条追加，医生可直接在表格中修改，确认后再写入
+    用药提醒。
+    """
+
+    COLUMNS = ReminderTableModel.COLUMNS
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: List[Dict[str, Any]] = []
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self.endResetModel()
+
+    def append(self, medications: List[Dict[str, Any]]):
+        if not medications:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(medications) - 1)
+        self._rows.extend(dict(med) for med in medications)
+        self.endInsertRows()
+
+    def remove_rows(self, rows: Iterable[int]):
+        # 从后往前删除，行号不受前面删除的影响
+        for row in sorted(set(rows), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+
+    def medications(self) -> List[Dict[str, Any]]:
+        return [dict(med) for med in self._rows]
+
+    # Qt 模型接口
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole, Qt.ItemDataRole.ToolTipRole):
+            return self._rows[index.row()].get(self.COLUMNS[index.column()][1], '')
+        return None
+
+    def setData(self, index: QModelIndex, value, role=Qt.ItemDataRole.EditRole) -> bool:
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole:
+            return False
+        self._rows[index.row()][self.COLUMNS[index.column()][1]] = str(value).strip()
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index: QModelIndex):
+        return super().flags(index) | Qt.ItemFlag.ItemIsEditable
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section][2]
+        return super().headerData(section, orientation, role)
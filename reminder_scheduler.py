@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from dose_rules import parse_usage
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+# QTimer 的间隔上限约 24 天；另外睡眠、调整系统时间后计时会不准，
+# 所以最长等待一小时就重新核对一次队首
+MAX_WAIT_MS = 60 * 60 * 1000
+
+
+def occurrences(reminder: Dict[str, Any], after: datetime) -> Iterator[datetime]:
+    """按时间顺序产出 after 之后（不含）的每次服药时间
+
+    与 medication_schedule 相同，没有疗程天数时一直提醒到提醒被删除。
+    """
+    if not reminder.get('start_date'):
+        return iter(())
+    rule = parse_usage(reminder['time'])
+    start = datetime.fromisoformat(reminder['start_date'])
+    return rule.occurrences(start, reminder.get('days'), after=after)
+
+
+class ReminderScheduler(QObject):
+    """应用内用药提醒调度
+
+    所有提醒的下一次服药时间放在一个最小堆中，只用一个 QTimer 等待堆顶的
+    时间。新增和取消都是 O(log n)：取消时只把堆中的条目标记为失效，弹出时跳过。
+    每条提醒已处理到的时间（创建或最后一次提醒）记录在
+    medication_reminders.last_fired 中，重新启动后把错过的服药合并为一次提醒补发。
+    """
+
+    # 提醒ID, 药品名称, 用法用量, 计划服药时间, 错过的次数（补发时大于 1）
+    due = pyqtSignal(int, str, str, str, int)
+
+    def __init__(self, db: sqlite3.Connection, parent=None,
+                 clock: Callable[[], datetime] = datetime.now):
+        super().__init__(parent)
+        self.db = db
+        self.clock = clock
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}  # 提醒ID -> 堆中的有效条目
+        self._reminders: Dict[int, Dict[str, Any]] = {}
+        self._counter = itertools.count()  # 时间相同时按加入顺序
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """从数据库加载全部提醒，补发关闭期间错过的服药"""
+        rows = self.db.execute('''
+            SELECT id, medicine_name, dosage, time, days, start_date, last_fired
+            FROM medication_reminders
+            WHERE start_date IS NOT NULL
+        ''').fetchall()
+        now = self.clock()
+        self._heap, self._entries, self._reminders = [], {}, {}
+        fired = []
+        for row in rows:
+            reminder = {'id': row[0], 'name': row[1] or '', 'dosage': row[2] or '', 'time': row[3] or '',
+                        'days': row[4], 'start_date': row[5], 'last_fired': row[6]}
+            self._reminders[reminder['id']] = reminder
+            if reminder['last_fired']:
+                last = datetime.fromisoformat(reminder['last_fired'])
+                fired.extend(self._catch_up(reminder, last, now))
+            entry = self._entry(reminder, now)
+            if entry:
+                self._entries[reminder['id']] = entry
+        # 一次建堆 O(n)，比逐个 push 快
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)
+        self._save_fired(fired)
+        self._reschedule()
+
+    def schedule(self, reminders: List[Dict[str, Any]]):
+        """新增或更新提醒（需包含 id/name/dosage/time/days/start_date）"""
+        now = self.clock()
+        for reminder in reminders:
+            self._cancel(reminder['id'])
+            reminder = dict(reminder)
+            self._reminders[reminder['id']] = reminder
+            self._push(self._entry(reminder, now))
+        self._reschedule()
+
+    def cancel(self, ids: List[int]):
+        for reminder_id in ids:
+            self._cancel(reminder_id)
+            self._reminders.pop(reminder_id, None)
+        self._reschedule()
+
+    def next_due(self) -> Optional[datetime]:
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+
+    def stop(self):
+        self._timer.stop()
+
+    def _entry(self, reminder: Dict[str, Any], after: datetime) -> Optional[list]:
+        """堆条目 [时间, 序号, 提醒ID]；疗程已结束时返回 None"""
+        when = next(occurrences(reminder, after), None)
+        if when is None:
+            return None
+        return [when, next(self._counter), reminder['id']]
+
+    def _push(self, entry: Optional[list]):
+        if entry:
+            self._entries[entry[-1]] = entry
+            heapq.heappush(self._heap, entry)
+
+    def _cancel(self, reminder_id: int):
+        entry = self._entries.pop(reminder_id, None)
+        if entry is not None:
+            entry[-1] = None  # 标记失效，弹出时跳过
+
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+
+    def _catch_up(self, reminder: Dict[str, Any], last: datetime, now: datetime) -> List[tuple]:
+        """last 到 now 之间错过的服药合并为一次提醒"""
+        missed = None
+        count = 0
+        for when in occurrences(reminder, last):
+            if when > now:
+                break
+            missed = when
+            count += 1
+        if not count:
+            return []
+        self.due.emit(reminder['id'], reminder['name'], reminder['dosage'], missed.strftime(TIME_FORMAT), count)
+        return [(missed, reminder['id'])]
+
+    def _fire(self):
+        now = self.clock()
+        fired = []
+        while True:
+            self._drop_cancelled()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            when, _, reminder_id = heapq.heappop(self._heap)
+            del self._entries[reminder_id]
+            reminder = self._reminders[reminder_id]
+            # 计算机睡眠期间可能错过多次，只提醒最近一次并注明次数
+            fired.extend(self._catch_up(reminder, when - timedelta(minutes=1), now))
+            self._push(self._entry(reminder, fired[-1][0]))
+        self._save_fired(fired)
+        self._reschedule()
+
+    def _save_fired(self, fired: List[tuple]):
+        """一次提交记录本轮所有提醒的最后提醒时间"""
+        if not fired:
+            return
+        self.db.executemany('UPDATE medication_reminders SET last_fired = ? WHERE id = ?',
+                            [(when.strftime(TIME_FORMAT), reminder_id) for when, reminder_id in fired])
+        self.db.commit()
+        for when, reminder_id in fired:
+            if reminder_id in self._reminders:
+                self._reminders[reminder_id]['last_fired'] = when.strftime(TIME_FORMAT)
+
+    def _reschedule(self):
+        """把唯一的计时器重设到堆顶的时间"""
+        when = self.next_due()
+        if when is None:
+            self._timer.stop()
+            return
+        wait = (when - self.clock()).total_seconds() * 1000
+        self._timer.start(int(min(max(wait, 0), MAX_WAIT_MS)))
@@ -0,0 +1,348 @@
+"""启动性能分析
+
+设置环境变量 MEDICAL_PROFILE_STARTUP=<报告路径> 后运行 medical_assistant.py，
+会记录各模块导入耗时（类似 python -X importtime）、启动各阶段时间点
+（数据存储初始化、各 create_* 面板、首次绘制）以及启动期间的数据库查询耗时，
+退出时写入 JSON 报告。
+
+    python startup_profiler.py                  # 离屏启动一次并打印报告摘要
+    python startup_profiler.py --check-budget   # 超过 config.yaml 中的预算时返回非零
+"""
+import atexit
+import fnmatch
+import functools
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from importlib.abc import MetaPathFinder
+from typing import Any, Dict, List, Optional
+
+ENV_REPORT = 'MEDICAL_PROFILE_STARTUP'
+# 窗口就绪后自动退出（用于预算检查）
+ENV_EXIT = 'MEDICAL_PROFILE_EXIT'
+
+DEFAULT_BUDGET_MS = 1500
+
+# 记录为启动阶段的主窗口方法
+PHASE_METHODS = ('__init__', 'init_storage', 'create_*', 'show_tutorial')
+
+
+class _ImportTimer(MetaPathFinder):
+    """记录每个模块的自身耗时和累计耗时（含其导入的子模块）"""
+
+    def __init__(self, profiler: 'StartupProfiler'):
+        self.profiler = profiler
+        self._stack: List[list] = []
+        self._finding = set()
+
+    def find_spec(self, name, path, target=None):
+        # 交给后续的查找器定位模块，只替换 loader 以便计时
+        if name in self._finding:
+            return None
+        self._finding.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.discard(name)
+
+        if spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def run(self, name: str, loader, module, create_seconds: float = 0.0):
+        entry = [name, time.perf_counter(), 0.0]
+        self._stack.append(entry)
+        try:
+            loader.exec_module(module)
+        finally:
+            self._stack.pop()
+            # 扩展模块的主要耗时在 create_module 中
+            cumulative = time.perf_counter() - entry[1] + create_seconds
+            if self._stack:
+                self._stack[-1][2] += cumulative
+            self.profiler.imports.append({
+                'module': name,
+                'self_ms': round((cumulative - entry[2]) * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+                'depth': len(self._stack)
+            })
+
+
+class _TimedLoader:
+    """包装原 loader，执行模块代码前恢复原 loader，避免影响 importlib.resources 等"""
+
+    def __init__(self, loader, timer: _ImportTimer):
+        self._loader = loader
+        self._timer = timer
+        self._create_seconds = 0.0
+
+    def create_module(self, spec):
+        started = time.perf_counter()
+        try:
+            return self._loader.create_module(spec)
+        finally:
+            self._create_seconds = time.perf_counter() - started
+
+    def exec_module(self, module):
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        module.__loader__ = self._loader
+        self._timer.run(module.__name__, self._loader, module, self._create_seconds)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            profiler.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            profiler.record_query(sql, time.perf_counter() - started)
+
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class StartupProfiler:
+    """收集启动过程中的导入、阶段和查询耗时"""
+
+    def __init__(self):
+        self.enabled = False
+        self.report_path: Optional[str] = None
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.imports: List[Dict[str, Any]] = []
+        self.marks: List[Dict[str, Any]] = []
+        self.queries: Dict[str, Dict[str, Any]] = {}
+        self._phase_depth = 0
+        self._finished = False
+        self._connect = None
+        self._import_timer = None
+        self._first_paint = None
+
+    def install(self, report_path: str):
+        """开始记录导入和数据库查询，需在导入 PyQt6 等模块之前调用"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.report_path = report_path
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+
+        self._import_timer = _ImportTimer(self)
+        sys.meta_path.insert(0, self._import_timer)
+
+        self._connect = sqlite3.connect
+
+        @functools.wraps(self._connect)
+        def connect(*args, **kwargs):
+            kwargs.setdefault('factory', _TimedConnection)
+            return self._connect(*args, **kwargs)
+        sqlite3.connect = connect
+
+        atexit.register(self.write_report)
+
+    def now_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def mark(self, name: str, **extra):
+        """记录一个时间点（相对于开始记录时）"""
+        if self.enabled and not self._finished:
+            self.marks.append({'name': name, 'at_ms': self.now_ms(), **extra})
+
+    def record_query(self, sql: str, seconds: float):
+        if not self.enabled or self._finished:
+            return
+        key = re.sub(r'\s+', ' ', sql).strip()
+        stats = self.queries.setdefault(key, {'sql': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += seconds * 1000
+        stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+    def attach(self, app, window_class):
+        """给主窗口的启动阶段方法计时，并在首次绘制和面板全部就绪时打点"""
+        if not self.enabled:
+            return
+
+        for name, method in list(vars(window_class).items()):
+            if callable(method) and any(fnmatch.fnmatchcase(name, p) for p in PHASE_METHODS):
+                setattr(window_class, name, self._timed_phase(app, name, method))
+
+        # PyQt6 在主程序中已经导入，这里导入不会影响导入耗时统计
+        from PyQt6.QtCore import QEvent, QObject
+
+        profiler = self
+
+        class FirstPaintFilter(QObject):
+            def eventFilter(self, obj, event):
+                if (event.type() == QEvent.Type.Paint and obj.isWidgetType()
+                        and isinstance(obj.window(), window_class)):
+                    profiler.mark('first_paint')
+                    app.removeEventFilter(self)
+                return False
+
+        self._first_paint = FirstPaintFilter()
+        app.installEventFilter(self._first_paint)
+
+    def _timed_phase(self, app, name: str, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if self._finished:
+                return method(*args, **kwargs)
+            if name == 'show_tutorial':
+                # 所有延迟面板构建完成后才会显示引导教程（模态对话框不计入阶段耗时）
+                self.mark('ready')
+                if os.environ.get(ENV_EXIT):
+                    self.write_report()
+                    app.quit()
+                    return None
+                return method(*args, **kwargs)
+
+            started = self.now_ms()
+            self._phase_depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._phase_depth -= 1
+                self.marks.append({
+                    'name': name,
+                    'at_ms': started,
+                    'duration_ms': round(self.now_ms() - started, 3),
+                    'depth': self._phase_depth
+                })
+        return wrapper
+
+    def report(self) -> Dict[str, Any]:
+        marks = sorted(self.marks, key=lambda m: m['at_ms'])
+        by_name = {m['name']: m['at_ms'] for m in marks}
+        imports = sorted(self.imports, key=lambda i: i['cumulative_ms'], reverse=True)
+        queries = sorted(self.queries.values(), key=lambda q: q['total_ms'], reverse=True)
+        for query in queries:
+            query['total_ms'] = round(query['total_ms'], 3)
+            query['max_ms'] = round(query['max_ms'], 3)
+        return {
+            'started_at': self.started_at,
+            'time_to_window_ms': by_name.get('first_paint'),
+            'time_to_ready_ms': by_name.get('ready'),
+            'import_total_ms': round(sum(i['self_ms'] for i in self.imports), 3),
+            'query_total_ms': round(sum(q['total_ms'] for q in queries), 3),
+            'phases': marks,
+            'imports': imports,
+            'queries': queries
+        }
+
+    def write_report(self):
+        """写入报告并停止记录（只写一次）"""
+        if not self.enabled or self._finished:
+            return
+        data = self.report()
+        self._finished = True
+        if self._import_timer in sys.meta_path:
+            sys.meta_path.remove(self._import_timer)
+        try:
+            with open(self.report_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"写入启动分析报告失败: {str(e)}")
+
+
+profiler = StartupProfiler()
+
+if os.environ.get(ENV_REPORT):
+    # 从环境变量中移除，批量导出等启动的子进程不会重复记录并覆盖报告
+    profiler.install(os.environ.pop(ENV_REPORT))
+
+
+def load_budget() -> float:
+    try:
+        import yaml
+        with open('config.yaml', 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        return float((config.get('startup') or {}).get('budget_ms', DEFAULT_BUDGET_MS))
+    except Exception:
+        return DEFAULT_BUDGET_MS
+
+
+def profile_once(output: str, timeout: float = 60.0) -> Dict[str, Any]:
+    """离屏启动应用，窗口就绪后自动退出，返回报告"""
+    import subprocess
+
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    env[ENV_REPORT] = os.path.abspath(output)
+    env[ENV_EXIT] = '1'
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'medical_assistant.py')
+    launched_at = time.time()
+    subprocess.run([sys.executable, script], env=env, timeout=timeout, check=True)
+    with open(output, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # 解释器自身启动到开始记录之间的时间
+    data['interpreter_startup_ms'] = round((data['started_at'] - launched_at) * 1000, 3)
+    return data
+
+
+def print_summary(data: Dict[str, Any], top: int = 10):
+    print(f"解释器启动: {data.get('interpreter_startup_ms', 0):.1f} ms")
+    print(f"首次绘制: {data['time_to_window_ms']} ms    全部就绪: {data['time_to_ready_ms']} ms")
+    print(f"模块导入: {data['import_total_ms']:.1f} ms    数据库查询: {data['query_total_ms']:.1f} ms")
+    print("\n启动阶段:")
+    for phase in data['phases']:
+        indent = '  ' * (phase.get('depth', 0) + 1)
+        duration = f"{phase['duration_ms']:.1f} ms" if 'duration_ms' in phase else ''
+        print(f"{indent}{phase['at_ms']:9.1f}  {phase['name']:<32}{duration}")
+    print(f"\n导入最慢的 {top} 个模块（累计）:")
+    for item in [i for i in data['imports'] if i['depth'] == 0][:top]:
+        print(f"  {item['cumulative_ms']:9.1f} ms  {item['module']}")
+    print(f"\n耗时最多的 {top} 条查询:")
+    for query in data['queries'][:top]:
+        print(f"  {query['total_ms']:9.1f} ms  x{query['count']:<4} {query['sql'][:80]}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="启动性能分析")
+    parser.add_argument('--output', default='startup_profile.json')
+    parser.add_argument('--check-budget', action='store_true',
+                        help="首次绘制时间超过 config.yaml 中 startup.budget_ms 时返回 1")
+    parser.add_argument('--budget', type=float, help="覆盖配置中的预算（毫秒）")
+    args = parser.parse_args()
+
+    data = profile_once(args.output)
+    print_summary(data)
+
+    if args.check_budget:
+        budget = args.budget if args.budget is not None else load_budget()
+        elapsed = data['time_to_window_ms']
+        if elapsed is None or elapsed > budget:
+            print(f"\n启动时间超出预算: {elapsed} ms > {budget:.0f} ms")
+            sys.exit(1)
+        print(f"\n启动时间在预算内: {elapsed} ms <= {budget:.0f} ms")
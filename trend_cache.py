@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+class TrendSeriesCache:
+    """健康趋势序列缓存
+
+    按 (患者, 趋势类型, 时间范围) 缓存已解码的序列，时间以 int64 秒、数值以
+    float64 保存（血糖、血压等读数不损失精度）。超过内存上限时按最近最少
+    读取淘汰；写入新数据时直接追加到所有相关缓存项，无需重新查询，追加不
+    改变缓存项的使用顺序。
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, patient, trend_type: str, time_range: str,
+            cutoff: Optional[float] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """读取缓存序列；cutoff 为时间窗口起点（秒），早于它的数据会被裁掉"""
+        key = (patient, trend_type, time_range)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        times, values = entry
+        if cutoff is not None:
+            start = int(np.searchsorted(times, cutoff, side='left'))
+            if start:
+                # 时间窗口随当前时间前移，裁掉已经过期的数据
+                times, values = times[start:].copy(), values[start:].copy()
+                self._store(key, times, values)
+        return times, values
+
+    def put(self, patient, trend_type: str, time_range: str,
+            times: np.ndarray, values: np.ndarray):
+        """写入查询结果（times 为秒数，需已按时间排序）"""
+        key = (patient, trend_type, time_range)
+        self._store(key, np.asarray(times, dtype=np.int64), np.asarray(values, dtype=np.float64))
+        # 查询结果写入视为一次读取
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def append(self, patient, trend_type: str, timestamp: float, value: float):
+        """写入新数据时同步追加到该患者、该类型的所有缓存序列"""
+        self.append_many(patient, trend_type, np.array([timestamp]), np.array([value]))
+
+    def append_many(self, patient, trend_type: str, times: np.ndarray, values: np.ndarray):
+        """批量追加新数据（times 为秒数）"""
+        if not len(times):
+            return
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        for key in [k for k in self._entries if k[0] == patient and k[1] == trend_type]:
+            old_times, old_values = self._entries[key]
+            new_times = np.concatenate((old_times, times))
+            new_values = np.concatenate((old_values, values))
+            if len(old_times) and times.min() < old_times[-1]:
+                order = np.argsort(new_times, kind='stable')
+                new_times, new_values = new_times[order], new_values[order]
+            self._store(key, new_times, new_values)
+        self._evict()
+
+    def invalidate(self, patient=None, trend_type: Optional[str] = None):
+        """按患者和/或类型使缓存失效，不带参数时清空全部"""
+        for key in list(self._entries):
+            if (patient is None or key[0] == patient) and (trend_type is None or key[1] == trend_type):
+                self._bytes -= self._nbytes(self._entries.pop(key))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes
+        }
+
+    @staticmethod
+    def _nbytes(entry: Tuple[np.ndarray, np.ndarray]) -> int:
+        return entry[0].nbytes + entry[1].nbytes
+
+    def _store(self, key: tuple, times: np.ndarray, values: np.ndarray):
+        """替换缓存项；已有的项保留原来的使用顺序，新项排在最后"""
+        old = self._entries.get(key)
+        if old is not None:
+            self._bytes -= self._nbytes(old)
+        self._entries[key] = (times, values)
+        self._bytes += self._nbytes((times, values))
+
+    def _evict(self):
+        """超过内存上限时淘汰最久未使用的序列（至少保留最近一项）"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= self._nbytes(entry)
+            self.evictions += 1
@@ -0,0 +1,257 @@
+import math
+from datetime import datetime, timedelta
+from typing import List, Sequence
+
+import numpy as np
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtGui import QColor, QFont, QPainter, QPen, QPolygonF
+from PyQt6.QtWidgets import QSizePolicy, QWidget
+
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
+
+
+def to_epoch(value: datetime) -> float:
+    """本地时间转换为秒数（不做时区换算）"""
+    return (value - EPOCH).total_seconds()
+
+
+def from_epoch(seconds: float) -> datetime:
+    """秒数转换回本地时间"""
+    return EPOCH + timedelta(seconds=float(seconds))
+
+
+def parse_timestamps(timestamps: Sequence[str]) -> np.ndarray:
+    """把数据库中的 '%Y-%m-%d %H:%M:%S' 字符串批量转换为秒数数组"""
+    if not len(timestamps):
+        return np.empty(0, dtype=np.float64)
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64).astype(np.float64)
+
+
+def nice_ticks(vmin: float, vmax: float, max_ticks: int = 10) -> List[float]:
+    """计算 1/2/5 步长的纵轴刻度"""
+    span = vmax - vmin
+    if span <= 0:
+        return [vmin]
+    raw = span / max(max_ticks - 1, 1)
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 5, 10):
+        step = factor * magnitude
+        if step >= raw:
+            break
+    start = math.ceil(vmin / step) * step
+    ticks = []
+    value = start
+    while value <= vmax + step * 1e-9:
+        ticks.append(round(value, 10))
+        value += step
+    return ticks
+
+
+class TrendWidget(QWidget):
+    """基于 QPainter 的轻量健康趋势图
+
+    数据以 NumPy 数组保存，坐标变换和超出像素宽度时的抽样都在数组上完成，
+    不依赖 matplotlib。
+    """
+
+    MARGIN_LEFT = 56
+    MARGIN_RIGHT = 16
+    MARGIN_TOP = 32
+    MARGIN_BOTTOM = 48
+    MARKER_RADIUS = 3
+    LINE_COLOR = QColor(31, 119, 180)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(240)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+
+        self.trend_type = ''
+        # 预分配容量，追加数据时按倍数扩容
+        self._times = np.empty(64, dtype=np.float64)
+        self._values = np.empty(64, dtype=np.float64)
+        self._size = 0
+        self.xlim = (0.0, 1.0)
+        self.ylim = (0.0, 1.0)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self._size]
+
+    def set_series(self, trend_type: str, times: np.ndarray, values: np.ndarray):
+        """替换整条曲线数据（times 为秒数数组）"""
+        self.trend_type = trend_type
+        n = len(times)
+        self._ensure_capacity(n)
+        self._times[:n] = times
+        self._values[:n] = values
+        self._size = n
+        self._update_limits()
+        self.update()
+
+    def append(self, timestamp: datetime, value: float):
+        """追加一个数据点"""
+        self.append_many(np.array([to_epoch(timestamp)]), np.array([value], dtype=np.float64))
+
+    def append_many(self, times: np.ndarray, values: np.ndarray):
+        """批量追加数据点（times 为秒数数组）"""
+        n = len(times)
+        if not n:
+            return
+        self._ensure_capacity(self._size + n)
+        self._times[self._size:self._size + n] = times
+        self._values[self._size:self._size + n] = values
+        self._size += n
+        if self._size > n and times.min() < self._times[self._size - n - 1]:
+            order = np.argsort(self.times, kind='stable')
+            self._times[:self._size] = self.times[order]
+            self._values[:self._size] = self.values[order]
+        if not self._contains(times, values):
+            self._update_limits()
+        self.update()
+
+    def _ensure_capacity(self, size: int):
+        """容量不足时按倍数扩容"""
+        capacity = len(self._times)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        times = np.empty(capacity, dtype=np.float64)
+        values = np.empty(capacity, dtype=np.float64)
+        times[:self._size] = self.times
+        values[:self._size] = self.values
+        self._times, self._values = times, values
+
+    def _update_limits(self):
+        """横轴按整天对齐，纵轴上下各留 10% 余量"""
+        if not self._size:
+            return
+        times, values = self.times, self.values
+        x0 = math.floor(times.min() / DAY) * DAY
+        x1 = math.floor(times.max() / DAY) * DAY + DAY
+        ymin, ymax = float(values.min()), float(values.max())
+        pad = (ymax - ymin) * 0.1 or max(abs(ymax) * 0.05, 1.0)
+        self.xlim = (x0, x1)
+        self.ylim = (ymin - pad, ymax + pad)
+
+    def _contains(self, times: np.ndarray, values: np.ndarray) -> bool:
+        """判断新数据是否落在当前坐标范围内"""
+        return bool(times.min() >= self.xlim[0] and times.max() <= self.xlim[1]
+                    and values.min() >= self.ylim[0] and values.max() <= self.ylim[1])
+
+    def plot_rect(self) -> QRectF:
+        return QRectF(self.MARGIN_LEFT, self.MARGIN_TOP,
+                      max(self.width() - self.MARGIN_LEFT - self.MARGIN_RIGHT, 1),
+                      max(self.height() - self.MARGIN_TOP - self.MARGIN_BOTTOM, 1))
+
+    def _map_points(self, rect: QRectF):
+        """把数据映射为像素坐标；点数远多于像素列时按列取最小/最大值抽样"""
+        times, values = self.times, self.values
+        x0, x1 = self.xlim
+        y0, y1 = self.ylim
+        px = rect.left() + (times - x0) / (x1 - x0) * rect.width()
+        py = rect.bottom() - (values - y0) / (y1 - y0) * rect.height()
+
+        width = int(rect.width())
+        if len(px) > width * 4:
+            columns = np.clip((px - rect.left()).astype(np.int64), 0, width)
+            starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+            low = np.minimum.reduceat(py, starts)
+            high = np.maximum.reduceat(py, starts)
+            column_x = px[starts]
+            # 每个像素列保留最小、最大两个点，折线形状保持不变
+            px = np.repeat(column_x, 2)
+            py = np.column_stack((low, high)).ravel()
+            return px, py, False
+        return px, py, True
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.fillRect(self.rect(), Qt.GlobalColor.white)
+        rect = self.plot_rect()
+
+        # 标题
+        title_font = QFont(self.font())
+        title_font.setPointSize(title_font.pointSize() + 2)
+        painter.setFont(title_font)
+        painter.setPen(Qt.GlobalColor.black)
+        if self.trend_type:
+            painter.drawText(QRectF(0, 0, self.width(), self.MARGIN_TOP),
+                             Qt.AlignmentFlag.AlignCenter, f'{self.trend_type}趋势图')
+        painter.setFont(self.font())
+
+        painter.setPen(QPen(Qt.GlobalColor.black, 1))
+        painter.drawRect(rect)
+
+        if not self._size:
+            painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, '暂无数据')
+            painter.end()
+            return
+
+        self._draw_axes(painter, rect)
+
+        px, py, markers = self._map_points(rect)
+        painter.setClipRect(rect)
+        # 1 像素画笔走 Qt 的快速路径，宽画笔描边自交折线非常慢
+        painter.setPen(QPen(self.LINE_COLOR, 1))
+        painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(px.tolist(), py.tolist())]))
+        if markers:
+            painter.setBrush(self.LINE_COLOR)
+            r = self.MARKER_RADIUS
+            for x, y in zip(px.tolist(), py.tolist()):
+                painter.drawEllipse(QPointF(x, y), r, r)
+        painter.setClipping(False)
+
+        # 图例
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        legend_x, legend_y = rect.left() + 10, rect.top() + 14
+        painter.setPen(QPen(self.LINE_COLOR, 1.5))
+        painter.drawLine(QPointF(legend_x, legend_y), QPointF(legend_x + 20, legend_y))
+        painter.setPen(Qt.GlobalColor.black)
+        painter.drawText(QPointF(legend_x + 26, legend_y + 4), self.trend_type)
+        painter.end()
+
+    def _draw_axes(self, painter: QPainter, rect: QRectF):
+        """绘制网格、纵轴刻度和日期横轴"""
+        grid_pen = QPen(QColor(180, 180, 180), 1, Qt.PenStyle.DashLine)
+        metrics = painter.fontMetrics()
+        x0, x1 = self.xlim
+        y0, y1 = self.ylim
+
+        for tick in nice_ticks(y0, y1):
+            y = rect.bottom() - (tick - y0) / (y1 - y0) * rect.height()
+            painter.setPen(grid_pen)
+            painter.drawLine(QPointF(rect.left(), y), QPointF(rect.right(), y))
+            painter.setPen(Qt.GlobalColor.black)
+            label = f'{tick:g}'
+            painter.drawText(QPointF(rect.left() - metrics.horizontalAdvance(label) - 6,
+                                     y + metrics.ascent() / 2), label)
+
+        # 日期刻度：按可用宽度选择 1/2/7/14/30... 天的步长
+        days = max(int(round((x1 - x0) / DAY)), 1)
+        label_width = metrics.horizontalAdvance('2000-00-00') + 12
+        max_labels = max(int(rect.width() // label_width), 1)
+        step = next((s for s in (1, 2, 7, 14, 30, 60, 90, 180, 365) if days / s <= max_labels),
+                    math.ceil(days / max_labels))
+        tick = x0
+        while tick <= x1:
+            x = rect.left() + (tick - x0) / (x1 - x0) * rect.width()
+            painter.setPen(grid_pen)
+            painter.drawLine(QPointF(x, rect.top()), QPointF(x, rect.bottom()))
+            painter.setPen(Qt.GlobalColor.black)
+            label = from_epoch(tick).strftime('%Y-%m-%d')
+            painter.drawText(QPointF(x - metrics.horizontalAdvance(label) / 2,
+                                     rect.bottom() + metrics.height() + 2), label)
+            tick += step * DAY
+
+        painter.drawText(QRectF(rect.left(), rect.bottom() + metrics.height() + 4,
+                                rect.width(), metrics.height() + 4),
+                         Qt.AlignmentFlag.AlignCenter, '日期')
@@ -0,0 +1,178 @@
+"""界面卡顿监测
+
+设置环境变量 MEDICAL_UI_WATCHDOG=<日志路径>（或 1，使用默认的 ui_watchdog.log）
+后运行 medical_assistant.py 即可启用：
+
+- 界面线程上的心跳定时器定期打点，后台线程发现心跳停顿超过阈值时抓取界面
+  线程当前的调用栈，卡顿结束后把持续时间和调用栈写入日志；
+- 主窗口的槽函数全部加上计时，退出时把最慢的处理函数排行写入日志。
+"""
+import atexit
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from PyQt6.QtCore import QTimer
+
+ENV_WATCHDOG = 'MEDICAL_UI_WATCHDOG'
+DEFAULT_LOG = 'ui_watchdog.log'
+
+
+class UIWatchdog:
+    """事件循环心跳监测和槽函数计时"""
+
+    def __init__(self, log_path: str = DEFAULT_LOG, stall_ms: int = 250,
+                 heartbeat_ms: int = 50, slow_slot_ms: int = 50):
+        self.log_path = log_path
+        self.stall_ms = stall_ms
+        self.heartbeat_ms = heartbeat_ms
+        self.slow_slot_ms = slow_slot_ms
+
+        self.slots: Dict[str, Dict[str, Any]] = {}
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._gui_thread_id = threading.get_ident()
+        self._samples: List[str] = []
+        self._stalled_since: Optional[float] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._timer = None
+
+    def start(self):
+        """在界面线程调用"""
+        self._gui_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._beat)
+        self._timer.start(self.heartbeat_ms)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='ui-watchdog', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+        self.write_slot_report()
+
+    def _beat(self):
+        now = time.monotonic()
+        with self._lock:
+            stalled_since = self._stalled_since
+            samples = self._samples
+            self._last_beat = now
+            self._stalled_since = None
+            self._samples = []
+        if stalled_since is not None:
+            self._write_stall(now - stalled_since, samples)
+
+    def _watch(self):
+        """心跳超时期间每个心跳周期采样一次界面线程调用栈"""
+        interval = self.heartbeat_ms / 1000
+        while not self._stop.wait(interval):
+            frame = None
+            with self._lock:
+                if time.monotonic() - self._last_beat < self.stall_ms / 1000:
+                    continue
+                if self._stalled_since is None:
+                    self._stalled_since = self._last_beat
+                frame = sys._current_frames().get(self._gui_thread_id)
+                if frame is not None:
+                    self._samples.append(''.join(traceback.format_stack(frame)))
+
+    def _write_stall(self, seconds: float, samples: List[str]):
+        self.stalls += 1
+        lines = [f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 界面卡顿 {seconds * 1000:.0f} ms"
+                 f"（采样 {len(samples)} 次）"]
+        if samples:
+            # 出现次数最多的调用栈就是卡住的位置
+            stack, count = Counter(samples).most_common(1)[0]
+            lines.append(f"界面线程调用栈（{count}/{len(samples)} 次采样）:")
+            lines.append(stack.rstrip())
+        self._append_log('\n'.join(lines) + '\n\n')
+
+    def instrument(self, cls):
+        """给类中的普通方法加上计时；通过 connect 连接的槽函数由此全部计时"""
+        for name, member in list(vars(cls).items()):
+            if name.startswith('__') or name.endswith('Event') or not inspect.isfunction(member):
+                continue
+            setattr(cls, name, self._timed_slot(f"{cls.__name__}.{name}", member))
+
+    def _timed_slot(self, name: str, func):
+        # PyQt 按槽函数的参数个数决定是否传入 clicked(bool) 等信号参数，
+        # 包装函数接收 *args，需要按原函数签名截掉多余的位置参数
+        try:
+            params = inspect.signature(func).parameters.values()
+        except (TypeError, ValueError):
+            params = []
+        if any(p.kind == p.VAR_POSITIONAL for p in params):
+            max_args = None
+        else:
+            max_args = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            if threading.get_ident() != self._gui_thread_id:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record_slot(name, time.perf_counter() - started)
+        return wrapper
+
+    def _record_slot(self, name: str, seconds: float):
+        ms = seconds * 1000
+        stats = self.slots.get(name)
+        if stats is None:
+            stats = self.slots[name] = {'name': name, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0}
+        stats['calls'] += 1
+        stats['total_ms'] += ms
+        stats['max_ms'] = max(stats['max_ms'], ms)
+        if ms >= self.slow_slot_ms:
+            stats['slow'] += 1
+
+    def slowest(self, top: int = 20) -> List[Dict[str, Any]]:
+        """按单次最长耗时排序的处理函数"""
+        return sorted(self.slots.values(), key=lambda s: s['max_ms'], reverse=True)[:top]
+
+    def write_slot_report(self, top: int = 20):
+        lines = [f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 最慢的处理函数"
+                 f"（卡顿 {self.stalls} 次，慢调用阈值 {self.slow_slot_ms} ms）",
+                 f"{'最长(ms)':>10} {'平均(ms)':>10} {'调用':>6} {'慢调用':>6}  处理函数"]
+        for stats in self.slowest(top):
+            lines.append(f"{stats['max_ms']:10.1f} {stats['total_ms'] / stats['calls']:10.1f} "
+                         f"{stats['calls']:6d} {stats['slow']:6d}  {stats['name']}")
+        self._append_log('\n'.join(lines) + '\n\n')
+
+    def _append_log(self, text: str):
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(text)
+        except OSError as e:
+            print(f"写入卡顿日志失败: {str(e)}")
+
+
+def install_from_env(window_class) -> Optional[UIWatchdog]:
+    """环境变量启用时给主窗口槽函数计时并启动心跳监测，需在创建窗口前调用"""
+    value = os.environ.get(ENV_WATCHDOG)
+    if not value:
+        return None
+    watchdog = UIWatchdog(DEFAULT_LOG if value == '1' else value)
+    watchdog.instrument(window_class)
+    watchdog.start()
+    return watchdog